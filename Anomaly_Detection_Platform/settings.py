@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,10 +46,14 @@ INSTALLED_APPS = [
     'core',
 ]
 CORS_ALLOW_ALL_ORIGINS = True
+# Conditional polling of by_plot / anomalies from the frontend.
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Next-Cursor']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
+        'core.authentication.DeviceTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -66,6 +72,80 @@ class UserProfileSessionAuthentication(SessionAuthentication):
 
 from datetime import timedelta
 
+# Keyset pagination of the reading / anomaly / recommendation lists
+KEYSET_PAGINATION = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+}
+
+# Partitioning of sensor_readings (PostgreSQL), see core/partitions.py
+# and `python manage.py manage_partitions`.
+SENSOR_READINGS_PARTITIONING = {
+    'INTERVAL': 'month',        # 'month' or 'day'
+    'PREMAKE': 3,               # future partitions kept ready
+    'RETENTION_DAYS': None,     # None = keep everything
+}
+
+# Streaming anomaly detection, see core/detection.py and
+# `python manage.py detect_anomalies --loop`.
+ANOMALY_DETECTION = {
+    'Z_THRESHOLD': 4.0,
+    'WARMUP': 30,
+    'GAP_SECONDS': 900,
+}
+
+# Latest reading per (plot, sensor_type), see core/latest.py. Use a shared
+# cache backend when running several workers.
+SENSOR_LATEST_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by the processes of a host:
+    # 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    # 'LOCATION': BASE_DIR / 'var' / 'response-cache',
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Cached farm / plot lists and by_plot days, see core/response_cache.py.
+RESPONSE_CACHE = {
+    'CACHE': 'responses',
+    'TIMEOUT': 30,
+    'CLOSED_TIMEOUT': 3600,
+}
+
+# Users, roles and plot ids of JWT and device tokens, see
+# core/authentication.py. TIMEOUT None keeps them for the token lifetime,
+# which needs a cache shared by every process for revocations to apply.
+AUTH_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+# Write-behind ingest queue, see core/ingest_queue.py and
+# `python manage.py drain_ingest_queue --loop`.
+SENSOR_INGEST_QUEUE = {
+    'ENABLED': False,
+    'PATH': BASE_DIR / 'var' / 'ingest-queue.sqlite3',
+    'MAX_PENDING': 2_000_000,
+}
+
+# Server-sent events of new readings and anomalies (/api/stream/), see
+# core/live.py. Needs an ASGI server, e.g.
+# `uvicorn Anomaly_Detection_Platform.asgi:application`.
+SENSOR_LIVE_STREAM = {
+    'POLL_INTERVAL': 1.0,
+    'BUFFER': 1000,
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
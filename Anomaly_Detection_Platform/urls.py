@@ -34,8 +34,11 @@ API for managing farms, field plots, sensor readings, anomaly events, and agent
 - /api/farmprofiles/ → Manage farm profiles
 - /api/fieldplots/ → Manage field plots
 - /api/sensor-readings/ → Sensor readings (GET, POST, etc.)
-- /api/sensor-readings/plot/{plot_id}/ → Sensor readings for a specific plot today
+- /api/sensor-readings/plot/{plot_id}/ → Sensor readings for a specific plot today (or ?date=YYYY-MM-DD)
+- /api/sensor-readings/bulk/ → Batch ingestion (JSON array or NDJSON)
+- /api/sensor-readings/aggregate/ → min/max/avg/count/last per time bucket
 - /api/anomalies/ → Anomaly events
+- /api/stream/?plot=1,2 → Live readings and anomalies (server-sent events, ASGI)
 - /api/recommendations/ → Agent recommendations
 """,
         terms_of_service="https://www.google.com/policies/terms/",
@@ -3,6 +3,12 @@ import requests
 import json
 from decouple import config, Config, RepositoryEnv
 import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
 
 class HTTPEnabledSensorSimulator:
     def __init__(self, base_url, token=None, farmer_id=None):
@@ -13,6 +19,9 @@ class HTTPEnabledSensorSimulator:
             "Content-Type": "application/json"
         }
         self.plots = []
+        # Session persistante : réutilise les connexions TCP (keep-alive)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
         
 
     def get_jwt_token(username, password):
@@ -35,10 +44,7 @@ class HTTPEnabledSensorSimulator:
     def fetch_plots(self):
         """Récupère tous les plots disponibles"""
         try:
-            response = requests.get(
-                f"{self.base_url}/api/fieldplots/",
-                headers=self.headers
-            )
+            response = self.session.get(f"{self.base_url}/api/fieldplots/")
             if response.status_code == 200:
                 self.plots = response.json()
                 print(f"✅ {len(self.plots)} plots récupérés")
@@ -63,7 +69,7 @@ class HTTPEnabledSensorSimulator:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self.session.post(url, json=payload)
 
             if response.status_code in (200, 201):
                 print(f"✔ Sent {sensor_type}={value} for plot {plot_id}")
@@ -73,5 +79,233 @@ class HTTPEnabledSensorSimulator:
         except Exception as e:
             print("❌ POST error:", e)
 
+    def create_uploader(self, **kwargs):
+        """Crée un BatchUploader partageant l'URL et le token de ce client"""
+        return BatchUploader(self.base_url, token=self.token, **kwargs)
 
 
+class BatchUploader:
+    """
+    Envoi groupé et asynchrone des lectures vers /api/sensor-readings/bulk/.
+
+    - file d'attente bornée en mémoire (submit() bloque quand elle est pleine)
+    - N threads d'envoi, chacun avec sa propre Session (pool de connexions)
+    - un lot part dès qu'il atteint batch_size ou après flush_interval secondes
+    - retry avec backoff exponentiel + jitter sur erreur réseau / 429 / 5xx
+      (sans doublon : chaque lecture est horodatée à la soumission)
+    - si le backend reste injoignable, le lot est écrit dans un fichier NDJSON
+      local (spool_path) et renvoyé dès que le serveur répond à nouveau ; les
+      lignes illisibles du spool (écriture interrompue...) sont mises à l'écart
+      dans spool_path + ".corrupt" au lieu d'arrêter l'envoi
+    """
+
+    def __init__(
+        self,
+        base_url,
+        token=None,
+        batch_size=1000,
+        flush_interval=2.0,
+        max_queue=200_000,
+        workers=4,
+        max_retries=5,
+        backoff=0.5,
+        timeout=30,
+        spool_path=None,
+    ):
+        self.url = f"{base_url}/api/sensor-readings/bulk/"
+        self.headers = {
+            "Authorization": f"Bearer {token}" if token else "",
+            "Content-Type": "application/json",
+        }
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.workers = workers
+        self.spool_path = spool_path or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "spool", "readings.ndjson"
+        )
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._spool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._threads = []
+        self.stats = {"sent": 0, "rejected": 0, "duplicates": 0, "spooled": 0, "replayed": 0, "corrupt": 0, "batches": 0, "retries": 0}
+
+    # ------------------------------------------------------------------
+    # API publique
+    # ------------------------------------------------------------------
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True, name=f"Uploader-{i}")
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, plot_id, sensor_type, value, timestamp=None, source="simulator", block=True, timeout=None):
+        """Ajoute une lecture à la file. Retourne False si la file est pleine (block=False ou timeout)."""
+        row = {
+            "plot": plot_id,
+            "sensor_type": sensor_type,
+            "value": float(value),
+            "source": source,
+        }
+        # Horodatage à la mesure : un lot renvoyé après un retry est dédoublonné par l'API
+        if timestamp is None:
+            timestamp = datetime.now(timezone.utc)
+        row["timestamp"] = timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp
+        try:
+            self.queue.put(row, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def submit_reading(self, plot_id, reading, timestamp=None):
+        """Ajoute les 3 capteurs d'une lecture du simulateur (temperature, humidity, moisture)"""
+        ts = timestamp if timestamp is not None else reading.get("timestamp")
+        self.submit(plot_id, "temperature", reading["temperature"], ts)
+        self.submit(plot_id, "humidity", reading["humidity"], ts)
+        self.submit(plot_id, "moisture", reading["soil_moisture"], ts)
+
+    def close(self, timeout=None):
+        """Vide la file puis arrête les threads d'envoi"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Threads d'envoi
+    # ------------------------------------------------------------------
+    def _run(self):
+        session = self._make_session()
+        last_replay = 0.0
+        while True:
+            batch = self._next_batch()
+            if batch:
+                if self._send(session, batch) and time.monotonic() - last_replay > self.flush_interval:
+                    last_replay = time.monotonic()
+                    self._replay_spool(session)
+            elif self._stop.is_set():
+                break
+        session.close()
+
+    def _make_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def _next_batch(self):
+        """Attend un lot complet ou l'expiration de flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.2)))
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+        return batch
+
+    def _send(self, session, batch, spool=True):
+        """Envoie un lot avec retry/backoff ; le spoole sur disque en cas d'échec"""
+        body = json.dumps(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = session.post(self.url, data=body, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                if response.status_code in (200, 201, 202):
+                    result = response.json()
+                    rejected = len(result.get("errors", []))
+                    # Lectures déjà reçues lors d'un envoi précédent de ce lot
+                    duplicates = result.get("duplicates", 0)
+                    self._count("sent", len(batch) - rejected - duplicates)
+                    self._count("rejected", rejected)
+                    self._count("duplicates", duplicates)
+                    self._count("batches")
+                    return True
+                if response.status_code != 429 and response.status_code < 500:
+                    # Erreur client : inutile de réessayer
+                    print(f"❌ Lot rejeté ({response.status_code}): {response.text[:200]}")
+                    self._count("rejected", len(batch))
+                    return True
+                error = f"HTTP {response.status_code}"
+
+            if attempt < self.max_retries:
+                self._count("retries")
+                delay = self.backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+
+        print(f"⚠️  Backend indisponible ({error}), {len(batch)} lectures mises en attente sur disque")
+        if spool:
+            self._spool(batch)
+        return False
+
+    # ------------------------------------------------------------------
+    # Tampon disque
+    # ------------------------------------------------------------------
+    def _spool(self, batch):
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for row in batch:
+                    f.write(json.dumps(row) + "\n")
+        self._count("spooled", len(batch))
+
+    def _replay_spool(self, session):
+        """Renvoie le contenu du spool (si présent) par lots"""
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            replay_path = f"{self.spool_path}.{threading.get_ident()}.replay"
+            os.replace(self.spool_path, replay_path)
+
+        rows, corrupt = [], []
+        with open(replay_path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            self._quarantine(corrupt)
+
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            if not self._send(session, batch, spool=False):
+                # Toujours indisponible : on remet le reste dans le spool
+                self._spool(rows[start:])
+                break
+            self._count("replayed", len(batch))
+        os.remove(replay_path)
+
+    def _quarantine(self, lines):
+        """Met de côté les lignes illisibles du spool pour inspection"""
+        path = f"{self.spool_path}.corrupt"
+        with self._spool_lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        self._count("corrupt", len(lines))
+        print(f"⚠️  {len(lines)} ligne(s) illisible(s) du spool mises de côté dans {path}")
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
@@ -0,0 +1,178 @@
+"""
+Backfill historique rapide.
+
+Génère des mois de lectures pour un ou plusieurs plots en avance rapide
+(FleetSimulator en mode fast_simulate, aucun sleep), par blocs de ticks,
+sous forme de DataFrames pandas colonnes :
+
+    timestamp | plot | sensor_type | value | source
+
+Exemples :
+    python backfill.py --plots 1-1000 --days 90 --output readings.parquet
+    python backfill.py --plots 1,2,3 --start 2025-01-01 --end 2025-04-01 --output readings.csv
+
+Pour écrire directement en base : python manage.py backfill_readings
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from fleet_simulator import FleetSimulator
+
+
+SENSORS = (
+    ("temperature", "temperature"),
+    ("humidity", "humidity"),
+    ("moisture", "soil_moisture"),
+)
+
+
+def _aware(dt):
+    """Les dates naïves sont interprétées en UTC"""
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def iter_backfill(plot_ids, start, end, interval=300, seed=0, chunk_ticks=288,
+                  cross_effects=False, source="backfill", wide=False):
+    """
+    Génère les lectures de [start, end) par blocs de `chunk_ticks` ticks.
+
+    Chaque bloc est un DataFrame « long » (une ligne par capteur, comme
+    l'API) ou « wide » (une ligne par plot et par tick) si wide=True.
+    La mémoire reste bornée par la taille d'un bloc.
+    """
+    start, end = _aware(start), _aware(end)
+    fleet = FleetSimulator(
+        plot_ids,
+        seed=seed,
+        start_time=start,
+        fast_simulate=True,
+        cross_effects=cross_effects,
+        scenario_delay=None,
+    )
+    plots = fleet.plot_ids
+    total_ticks = int(np.ceil((end - start).total_seconds() / interval))
+
+    for first in range(0, total_ticks, chunk_ticks):
+        n_ticks = min(chunk_ticks, total_ticks - first)
+        values = {column: np.empty((n_ticks, fleet.n)) for _, column in SENSORS}
+        stamps = np.empty(n_ticks, dtype="datetime64[us]")
+
+        for k in range(n_ticks):
+            r = fleet.tick()
+            stamps[k] = np.datetime64(r["timestamp"].replace(tzinfo=None), "us")
+            for _, column in SENSORS:
+                values[column][k] = r[column]
+            fleet.advance_time(interval)
+
+        stamps = np.repeat(stamps, fleet.n)
+        plot_column = np.tile(plots, n_ticks)
+
+        if wide:
+            yield pd.DataFrame({
+                "timestamp": pd.DatetimeIndex(stamps).tz_localize(timezone.utc),
+                "plot": plot_column,
+                **{sensor: values[column].ravel() for sensor, column in SENSORS},
+                "source": pd.Categorical.from_codes(np.zeros(len(stamps), dtype=np.int8), [source]),
+            })
+            continue
+
+        yield pd.DataFrame({
+            "timestamp": pd.DatetimeIndex(np.tile(stamps, len(SENSORS))).tz_localize(timezone.utc),
+            "plot": np.tile(plot_column, len(SENSORS)),
+            "sensor_type": pd.Categorical.from_codes(
+                np.repeat(np.arange(len(SENSORS), dtype=np.int8), len(stamps)),
+                [sensor for sensor, _ in SENSORS],
+            ),
+            "value": np.concatenate([values[column].ravel() for _, column in SENSORS]),
+            "source": pd.Categorical.from_codes(np.zeros(len(SENSORS) * len(stamps), dtype=np.int8), [source]),
+        })
+
+
+def backfill(plot_ids, start, end, interval=300, seed=0, **kwargs):
+    """Comme iter_backfill, mais retourne un seul DataFrame"""
+    chunks = list(iter_backfill(plot_ids, start, end, interval=interval, seed=seed, **kwargs))
+    if not chunks:
+        return pd.DataFrame(columns=["timestamp", "plot", "sensor_type", "value", "source"])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def write_csv(chunks, path):
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        rows += len(chunk)
+    return rows
+
+
+def write_parquet(chunks, path):
+    """Un row group par bloc (nécessite pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_file(chunks, path):
+    if path.endswith(".parquet"):
+        return write_parquet(chunks, path)
+    return write_csv(chunks, path)
+
+
+def parse_plot_ids(spec):
+    """'1-100,250,300-310' -> [1, ..., 100, 250, 300, ..., 310]"""
+    ids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            low, high = part.split("-", 1)
+            ids.extend(range(int(low), int(high) + 1))
+        elif part:
+            ids.append(int(part))
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historique des lectures capteurs")
+    parser.add_argument("--plots", required=True, help="ex: 1-1000 ou 1,2,5")
+    parser.add_argument("--start", help="date de début (YYYY-MM-DD, UTC)")
+    parser.add_argument("--end", help="date de fin exclue (YYYY-MM-DD, UTC)")
+    parser.add_argument("--days", type=int, default=90, help="si --start absent : N derniers jours")
+    parser.add_argument("--interval", type=int, default=300, help="secondes entre deux lectures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cross-effects", action="store_true")
+    parser.add_argument("--wide", action="store_true", help="une colonne par capteur")
+    parser.add_argument("--output", required=True, help="fichier .csv ou .parquet")
+    args = parser.parse_args()
+
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    start = datetime.fromisoformat(args.start) if args.start else _aware(end) - timedelta(days=args.days)
+    plot_ids = parse_plot_ids(args.plots)
+
+    print(f"🚀 Backfill de {len(plot_ids)} plots du {start} au {end} (intervalle {args.interval}s)")
+    t0 = time.time()
+    chunks = iter_backfill(plot_ids, start, end, interval=args.interval, seed=args.seed,
+                           cross_effects=args.cross_effects, wide=args.wide)
+    rows = write_file(chunks, args.output)
+    print(f"✅ {rows} lignes écrites dans {os.path.abspath(args.output)} en {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+
+# Codes des modes (même ordre que CleanSensorSimulator.anomaly_list)
+NORMAL = 0
+ANOMALIES = [
+    "temp_spike",
+    "temp_low",
+    "humidity_spike",
+    "humidity_drop",
+    "moisture_drop",
+    "moisture_leak",
+]
+RECOVERY = len(ANOMALIES) + 1
+MODE_NAMES = np.array(["normal"] + ANOMALIES + ["recovery"])
+
+TEMP_SPIKE, TEMP_LOW, HUMIDITY_SPIKE, HUMIDITY_DROP, MOISTURE_DROP, MOISTURE_LEAK = range(1, 7)
+
+# Tirages aléatoires consommés par plot et par tick (voir _draws)
+_DRIFT_T, _DRIFT_H, _DRIFT_S, _IRR_INC, _IRR_INT, _HUM_NOISE, _NOISE_T, _NOISE_H, _NOISE_S, _ANOMALY, _REC_HUM = range(11)
+_DRAWS_PER_TICK = 11
+
+
+class FleetSimulator:
+    """
+    Simule N plots dans un seul processus.
+
+    Reprend le modèle de CleanSensorSimulator (dérive, cycle diurne,
+    irrigation, anomalies, recovery) mais stocke l'état de tous les plots
+    dans des tableaux NumPy et avance toute la flotte à chaque tick.
+
+    Chaque plot a son propre flux np.random.Generator, dérivé de
+    (seed, plot_id) : la sortie d'un plot est reproductible et ne dépend
+    pas des autres plots de la flotte. Les tirages sont faits par blocs de
+    `block_ticks` ticks pour amortir le coût d'appel par plot.
+    """
+
+    def __init__(
+        self,
+        plot_ids,
+        seed=0,
+        start_time=None,
+        fast_simulate=False,
+        sim_speed_factor=1,
+        cross_effects=False,
+        normal_duration=(2 * 3600, 3 * 3600),
+        anomaly_duration=(1 * 3600, 2 * 3600),
+        recovery_duration=(30 * 60, 45 * 60),
+        scenario_delay=(30 * 60, 90 * 60),
+        scenario_duration=3600,
+        block_ticks=32,
+    ):
+        self.plot_ids = np.asarray(plot_ids, dtype=np.int64)
+        self.n = len(self.plot_ids)
+        self.seed = seed
+        self.current_time = start_time or datetime.now()
+        self.fast_simulate = fast_simulate
+        self.sim_speed_factor = sim_speed_factor
+        self.cross_effects = cross_effects
+        self.block_ticks = block_ticks
+
+        self.base_temperature = 23.0
+        self.base_humidity = 60.0
+        self.base_soil_moisture = 65.0
+        self.drift_rate = 0.005
+
+        # Un flux indépendant par plot
+        self.rngs = [
+            np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(int(pid),))))
+            for pid in self.plot_ids
+        ]
+        init = np.array([rng.random(9) for rng in self.rngs]).reshape(self.n, 9).T
+        self._block = None
+        self._block_pos = 0
+
+        t0 = self._epoch(self.current_time)
+
+        self.temperature = 20 + 6 * init[0]
+        self.humidity = 55 + 15 * init[1]
+        self.soil_moisture = 55 + 15 * init[2]
+
+        self.drift_temp = np.zeros(self.n)
+        self.drift_hum = np.zeros(self.n)
+        self.drift_soil = np.zeros(self.n)
+
+        self.last_irrigation = np.full(self.n, t0 - 12 * 3600)
+        self.irrigation_interval = (12 + 12 * init[3]) * 3600
+
+        self.normal_duration = self._spread(normal_duration, init[4])
+        self.anomaly_duration = self._spread(anomaly_duration, init[5])
+        self.recovery_duration = self._spread(recovery_duration, init[6])
+
+        self.mode = np.zeros(self.n, dtype=np.int8)
+        self.mode_start = np.full(self.n, t0)
+        self.recovery_targets = np.full((3, self.n), np.nan)
+
+        # Anomalie scriptée (une par plot), comme run_simulation_for_plot
+        if scenario_delay is None:
+            self.scenario_start = np.full(self.n, np.inf)
+        else:
+            self.scenario_start = t0 + self._spread(scenario_delay, init[7])
+        self.scenario_mode = np.minimum(init[8] * len(ANOMALIES), len(ANOMALIES) - 1).astype(np.int8) + 1
+        self.scenario_duration = np.full(self.n, float(scenario_duration))
+
+    # ------------------------------------------------------------------
+    # Utilitaires
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _epoch(dt):
+        return dt.timestamp()
+
+    @staticmethod
+    def _spread(bounds, u):
+        """Valeur fixe, ou tirage uniforme par plot si bounds = (low, high)"""
+        if np.isscalar(bounds):
+            return np.full(len(u), float(bounds))
+        low, high = bounds
+        return low + (high - low) * u
+
+    def _draws(self):
+        """Tirages uniformes [0, 1) du tick courant, forme (_DRAWS_PER_TICK, n)"""
+        if self._block is None or self._block_pos >= self.block_ticks:
+            self._block = np.stack(
+                [rng.random((self.block_ticks, _DRAWS_PER_TICK)) for rng in self.rngs], axis=2
+            ) if self.n else np.empty((self.block_ticks, _DRAWS_PER_TICK, 0))
+            self._block_pos = 0
+        u = self._block[self._block_pos]
+        self._block_pos += 1
+        return u
+
+    def _diurnal_targets(self, now, hum_noise):
+        hour = self.current_time.hour + self.current_time.minute / 60.0
+        temp_phase = (hour - 6) / 24 * 2 * np.pi
+        temp_amplitude = 5.0
+        target_temp = np.full(self.n, self.base_temperature + temp_amplitude * np.sin(temp_phase))
+        target_hum = self.base_humidity - 0.8 * temp_amplitude * np.sin(temp_phase) + hum_noise
+
+        hours_since_irrigation = (now - self.last_irrigation) / 3600
+        soil_decrease_rate = 0.15 if 10 <= hour <= 18 else 0.05
+        target_soil = np.maximum(45, self.base_soil_moisture - soil_decrease_rate * hours_since_irrigation)
+        return target_temp, target_hum, target_soil
+
+    # ------------------------------------------------------------------
+    # Un pas de simulation
+    # ------------------------------------------------------------------
+    def _switch_modes(self, now, u):
+        mode = self.mode
+        elapsed = now - self.mode_start
+
+        scripted = (mode == NORMAL) & (now >= self.scenario_start)
+        to_anomaly = (mode == NORMAL) & (elapsed >= self.normal_duration) & ~scripted
+        is_anomaly = (mode > NORMAL) & (mode < RECOVERY)
+        to_recovery = is_anomaly & (elapsed >= self.anomaly_duration)
+        to_normal = (mode == RECOVERY) & (elapsed >= self.recovery_duration)
+
+        if scripted.any():
+            mode[scripted] = self.scenario_mode[scripted]
+            self.anomaly_duration[scripted] = self.scenario_duration[scripted]
+            self.mode_start[scripted] = now
+            self.scenario_start[scripted] = np.inf
+
+        if to_anomaly.any():
+            choice = np.minimum((u[_ANOMALY] * len(ANOMALIES)).astype(np.int8), len(ANOMALIES) - 1)
+            mode[to_anomaly] = choice[to_anomaly] + 1
+            self.mode_start[to_anomaly] = now
+
+        if to_recovery.any():
+            targets = np.array(self._diurnal_targets(now, -2 + 4 * u[_REC_HUM]))
+            self.recovery_targets[:, to_recovery] = targets[:, to_recovery]
+            mode[to_recovery] = RECOVERY
+            self.mode_start[to_recovery] = now
+
+        if to_normal.any():
+            mode[to_normal] = NORMAL
+            self.mode_start[to_normal] = now
+            self.recovery_targets[:, to_normal] = np.nan
+
+    def _update_values(self, now, u):
+        rate = self.drift_rate
+        self.drift_temp = np.clip(self.drift_temp + rate * (2 * u[_DRIFT_T] - 1),
+                                  -0.2 * self.base_temperature, 0.2 * self.base_temperature)
+        self.drift_hum = np.clip(self.drift_hum + rate * (2 * u[_DRIFT_H] - 1),
+                                 -0.2 * self.base_humidity, 0.2 * self.base_humidity)
+        self.drift_soil = np.clip(self.drift_soil + rate * (2 * u[_DRIFT_S] - 1),
+                                  -0.2 * self.base_soil_moisture, 0.2 * self.base_soil_moisture)
+
+        # Irrigation
+        irrigate = (now - self.last_irrigation) >= self.irrigation_interval
+        if irrigate.any():
+            increase = 15 + 10 * u[_IRR_INC]
+            self.soil_moisture = np.where(irrigate, np.minimum(75, self.soil_moisture + increase), self.soil_moisture)
+            self.last_irrigation[irrigate] = now
+            self.irrigation_interval[irrigate] = (12 + 12 * u[_IRR_INT][irrigate]) * 3600
+
+        target_temp, target_hum, target_soil = self._diurnal_targets(now, -2 + 4 * u[_HUM_NOISE])
+        temp, hum, soil = self.temperature, self.humidity, self.soil_moisture
+        mode = self.mode
+
+        # Recovery : interpolation vers les cibles mémorisées
+        recovering = (mode == RECOVERY) & ~np.isnan(self.recovery_targets[0])
+        if recovering.any():
+            progress = np.clip((now - self.mode_start) / self.recovery_duration, 0.0, 1.0)
+            rt = self.recovery_targets
+            target_temp = np.where(recovering, temp + (rt[0] - temp) * progress, target_temp)
+            target_hum = np.where(recovering, hum + (rt[1] - hum) * progress, target_hum)
+            target_soil = np.where(recovering, soil + (rt[2] - soil) * progress, target_soil)
+
+        calm = (mode == NORMAL) | (mode == RECOVERY)
+        new_temp = np.where(calm, temp + 0.15 * (target_temp - temp) + 0.3 * (2 * u[_NOISE_T] - 1) + self.drift_temp, temp)
+        new_hum = np.where(calm, hum + 0.15 * (target_hum - hum) + 0.8 * (2 * u[_NOISE_H] - 1) + self.drift_hum, hum)
+        new_soil = np.where(calm, soil + 0.1 * (target_soil - soil) + 0.15 * (2 * u[_NOISE_S] - 1) + self.drift_soil, soil)
+
+        # Anomalies
+        if not calm.all():
+            p = np.minimum(1.0, (now - self.mode_start) / 10)
+            cross = 1.0 if self.cross_effects else 0.0
+
+            m = mode == TEMP_SPIKE
+            new_temp = np.where(m, temp + p * (38.0 - temp) / 5, new_temp)
+            new_hum = np.where(m, hum - cross * p * 3 / 5, new_hum)
+
+            m = mode == TEMP_LOW
+            new_temp = np.where(m, temp + p * (8.0 - temp) / 5, new_temp)
+            new_hum = np.where(m, hum + cross * p * 2 / 5, new_hum)
+
+            m = mode == HUMIDITY_SPIKE
+            new_hum = np.where(m, hum + p * (95.0 - hum) / 5, new_hum)
+            new_temp = np.where(m, temp - cross * p * 1 / 5, new_temp)
+
+            m = mode == HUMIDITY_DROP
+            new_hum = np.where(m, hum + p * (20.0 - hum) / 5, new_hum)
+            new_soil = np.where(m, soil - cross * p * 2 / 5, new_soil)
+
+            m = mode == MOISTURE_DROP
+            new_soil = np.where(m, soil - p * 35 / 3, new_soil)
+            new_hum = np.where(m, hum - cross * p * 4 / 3, new_hum)
+
+            m = mode == MOISTURE_LEAK
+            new_soil = np.where(m, soil + p * (85.0 - soil) / 5, new_soil)
+            new_hum = np.where(m, hum + cross * p * 3 / 5, new_hum)
+
+        # Limites physiques
+        self.temperature = np.clip(new_temp, 5, 45)
+        self.humidity = np.clip(new_hum, 15, 95)
+        self.soil_moisture = np.clip(new_soil, 25, 85)
+
+    def tick(self):
+        """Génère une lecture pour tous les plots au temps courant"""
+        now = self._epoch(self.current_time)
+        u = self._draws()
+        self._switch_modes(now, u)
+        self._update_values(now, u)
+        return {
+            "timestamp": self.current_time,
+            "plot_id": self.plot_ids,
+            "mode": self.mode.copy(),
+            "temperature": np.round(self.temperature, 2),
+            "humidity": np.round(self.humidity, 2),
+            "soil_moisture": np.round(self.soil_moisture, 2),
+        }
+
+    def advance_time(self, interval):
+        if self.fast_simulate:
+            self.current_time += timedelta(seconds=interval * self.sim_speed_factor)
+        else:
+            time.sleep(interval)
+            self.current_time = datetime.now()
+
+    def run(self, interval=300, on_tick=None, ticks=None):
+        """
+        Boucle unique d'ordonnancement : un tick pour toute la flotte toutes
+        les `interval` secondes (sans dérive d'horloge en temps réel).
+        """
+        count = 0
+        next_deadline = time.monotonic()
+        while ticks is None or count < ticks:
+            reading = self.tick()
+            if on_tick is not None:
+                on_tick(reading)
+            count += 1
+
+            if self.fast_simulate:
+                self.advance_time(interval)
+            else:
+                next_deadline += interval
+                time.sleep(max(0.0, next_deadline - time.monotonic()))
+                self.current_time = datetime.now()
+        return count
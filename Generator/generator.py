@@ -1,15 +1,16 @@
-import threading
 import time
 from datetime import datetime, timedelta
 import os
 import random
 
 from decouple import Config, RepositoryEnv
+import numpy as np
 from simulator import CleanSensorSimulator
+from fleet_simulator import FleetSimulator, MODE_NAMES
 from HttpGenerator import HTTPEnabledSensorSimulator  
 
 
-def run_simulation_for_plot(plot_id, http_sim, seed_offset=0, interval=300):
+def run_simulation_for_plot(plot_id, http_sim, seed_offset=0, interval=300, uploader=None):
 
     start_anomaly = datetime.now() + timedelta(minutes=random.uniform(30, 90))
     anomalies = [
@@ -60,8 +61,10 @@ def run_simulation_for_plot(plot_id, http_sim, seed_offset=0, interval=300):
                 print(f"\n📌 PLOT {plot_id} [{r['timestamp']}] (lecture #{iteration})")
                 sim.display(r)
             
-            # Envoyer à Django si disponible
-            if http_sim is not None:
+            # Envoyer à Django si disponible (envoi groupé si un uploader est fourni)
+            if uploader is not None:
+                uploader.submit_reading(plot_id, r, timestamp=sim.current_time.astimezone())
+            elif http_sim is not None:
                 try:
                     http_sim.send_reading(plot_id, "temperature", r["temperature"])
                     http_sim.send_reading(plot_id, "humidity", r["humidity"])
@@ -124,8 +127,13 @@ def test_single_plot_fast():
 '''
 
 
-def run_production():
-    """MODE PRODUCTION : Envoi toutes les 5 minutes (300s)"""
+def run_production(seed=None):
+    """
+    MODE PRODUCTION : Envoi toutes les 5 minutes (300s)
+
+    ``seed`` (ou la variable d'environnement SIMULATOR_SEED) rend la flotte
+    reproductible ; sans graine, une graine aléatoire est tirée et affichée.
+    """
     print("\n🚀 MODE PRODUCTION : Simulation avec envoi BD toutes les 5 minutes\n")
     print("=" * 60)
     
@@ -146,6 +154,7 @@ def run_production():
         
         token = HTTPEnabledSensorSimulator.get_jwt_token(USERNAME, PASSWORD)
         http_sim = HTTPEnabledSensorSimulator(BASE_URL, token=token)
+        uploader = http_sim.create_uploader().start()
         
 
         plots = http_sim.fetch_plots()
@@ -160,43 +169,48 @@ def run_production():
         print("❌ Aucun plot disponible dans la BD")
         return
 
-    print(f"\n🚀 Démarrage de {len(plots)} simulateurs (intervalle 5min = 300s)...\n")
+    print(f"\n🚀 Démarrage de la flotte : {len(plots)} plots (intervalle 5min = 300s)...\n")
     print("⏰ Prochaine lecture dans 5 minutes...")
     print("📊 Affichage console toutes les 15 minutes (3 lectures)")
     print("=" * 60)
     
-    # Démarrer 1 thread par plot avec intervalle 5min
-    threads = []
-    for idx, plot in enumerate(plots):
-        plot_id = plot["id"]
-        
-        thread = threading.Thread(
-            target=run_simulation_for_plot,
-            args=(plot_id, http_sim, idx * 123, 300),  # interval=300s (5min)
-            daemon=True,
-            name=f"Plot-{plot_id}"
-        )
-        thread.start()
-        threads.append(thread)
-        time.sleep(1)  # Décalage de 1s entre threads
-
-    print(f"\n🟢 {len(threads)} simulateurs en cours (production)")
+    # Une seule boucle pour toute la flotte (état vectorisé, 1 flux aléatoire par plot)
+    plot_ids = [plot["id"] for plot in plots]
+    if seed is None:
+        seed = os.environ.get("SIMULATOR_SEED")
+    seed = int(seed) if seed is not None else random.randrange(2**32)
+    print(f"🎲 Graine de la flotte : {seed} (SIMULATOR_SEED={seed} pour rejouer la même simulation)")
+    fleet = FleetSimulator(plot_ids, seed=seed)
+    iteration = 0
+
+    def send_tick(r):
+        nonlocal iteration
+        iteration += 1
+        ts = r["timestamp"].astimezone()
+        for i, plot_id in enumerate(r["plot_id"].tolist()):
+            uploader.submit(plot_id, "temperature", r["temperature"][i], ts)
+            uploader.submit(plot_id, "humidity", r["humidity"][i], ts)
+            uploader.submit(plot_id, "moisture", r["soil_moisture"][i], ts)
+
+        # Affichage console (toutes les 3 lectures = 15min)
+        if iteration % 3 == 0:
+            modes, counts = np.unique(MODE_NAMES[r["mode"]], return_counts=True)
+            summary = ", ".join(f"{m}={c}" for m, c in zip(modes, counts))
+            print(f"\n📌 [{r['timestamp']:%Y-%m-%d %H:%M:%S}] lecture #{iteration} : {summary}")
+            print(f"📤 Uploader : {uploader.stats}")
+
+    print(f"\n🟢 {fleet.n} plots simulés dans un seul processus (production)")
     print("💡 Appuyez sur Ctrl+C pour arrêter\n")
     print("=" * 60)
 
     try:
-        while True:
-            time.sleep(30)  # Check toutes les 30s
-            
-            # Vérifier threads actifs
-            alive = sum(1 for t in threads if t.is_alive())
-            if alive < len(threads):
-                print(f"⚠️  ALERTE : {len(threads) - alive} thread(s) terminé(s) !")
-    
+        fleet.run(interval=300, on_tick=send_tick)  # interval=300s (5min)
+
     except KeyboardInterrupt:
         print("\n\n🛑 Arrêt demandé par l'utilisateur")
-        print("⏳ Les threads vont se terminer...")
-        time.sleep(2)
+        print("⏳ Envoi des dernières lectures...")
+        uploader.close(timeout=10)
+        print(f"📤 Uploader : {uploader.stats}")
 
 
 if __name__ == "__main__":
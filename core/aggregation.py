@@ -0,0 +1,132 @@
+"""
+Server-side time-bucket aggregation of sensor readings.
+
+One ``GROUP BY plot, sensor_type, date_bin(bucket, timestamp)`` query
+returns count/min/max/avg/last per bucket, so charts receive a few hundred
+points instead of every raw reading.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Aggregate, Avg, Count, DateTimeField, F, FloatField, Func, Max, Min
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import SensorReading
+
+
+BUCKETS = {
+    '1m': timedelta(minutes=1),
+    '5m': timedelta(minutes=5),
+    '15m': timedelta(minutes=15),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+
+MAX_POINTS = getattr(settings, 'SENSOR_AGGREGATE_MAX_POINTS', 20000)
+DEFAULT_WINDOW = timedelta(days=1)
+
+# Buckets are aligned on this origin (UTC midnight).
+BUCKET_ORIGIN = '2000-01-01T00:00:00+00:00'
+
+
+class DateBin(Func):
+    """``date_bin(stride, source, origin)`` (PostgreSQL 14+)."""
+    function = 'DATE_BIN'
+    output_field = DateTimeField()
+
+    def __init__(self, expression, stride, **extra):
+        self.stride = stride
+        super().__init__(expression, **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        seconds = int(self.stride.total_seconds())
+        return (
+            f"DATE_BIN(INTERVAL '{seconds} seconds', {sql}, TIMESTAMPTZ '{BUCKET_ORIGIN}')",
+            params,
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        seconds = int(self.stride.total_seconds())
+        return (
+            f"datetime((CAST(strftime('%%s', {sql}) AS INTEGER) / {seconds}) * {seconds}, 'unixepoch')",
+            params,
+        )
+
+
+class Last(Aggregate):
+    """
+    Value of the most recent row of the group (``value`` ordered by
+    ``timestamp``, a datetime column).
+    """
+    name = 'Last'
+    output_field = FloatField()
+
+    def __init__(self, expression, ordering, **extra):
+        super().__init__(expression, ordering, **extra)
+
+    def _compile(self, compiler):
+        value, ordering = self.get_source_expressions()[:2]
+        value_sql, value_params = compiler.compile(value)
+        order_sql, order_params = compiler.compile(ordering)
+        return value_sql, value_params, order_sql, order_params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        value_sql, value_params, order_sql, order_params = self._compile(compiler)
+        return (
+            f'(ARRAY_AGG({value_sql} ORDER BY {order_sql} DESC))[1]',
+            (*value_params, *order_params),
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # No ordered aggregates: MAX() of '<timestamp> \x01 <value>'. SQLite
+        # stores datetimes as ISO text, which sorts chronologically up to the
+        # separator (below every character of a timestamp), and 17
+        # significant digits give the float back exactly.
+        value_sql, value_params, order_sql, order_params = self._compile(compiler)
+        latest = f"MAX({order_sql} || char(1) || printf('%%!.17g', {value_sql}))"
+        params = (*order_params, *value_params)
+        return f'CAST(substr({latest}, instr({latest}, char(1)) + 1) AS REAL)', (*params, *params)
+
+
+def bucket_size(name):
+    try:
+        return BUCKETS[name]
+    except KeyError:
+        raise ValidationError({'bucket': f'Expected one of {", ".join(BUCKETS)}.'})
+
+
+def check_point_budget(start, end, stride, series):
+    points = (end - start) / stride * max(series, 1)
+    if points > MAX_POINTS:
+        raise ValidationError({
+            'bucket': f'{int(points)} points requested (max {MAX_POINTS}); use a larger bucket or a shorter range.'
+        })
+
+
+def default_range(start, end):
+    end = end or timezone.now()
+    start = start or end - DEFAULT_WINDOW
+    if start >= end:
+        raise ValidationError({'start': 'start must be before end.'})
+    return start, end
+
+
+def aggregate_readings(queryset, stride, start, end):
+    """Rows of ``plot, sensor_type, bucket, count, min, max, avg, last`` ordered by bucket."""
+    return (
+        queryset
+        .filter(timestamp__gte=start, timestamp__lt=end)
+        .annotate(bucket=DateBin(F('timestamp'), stride))
+        .values('plot', 'sensor_type', 'bucket')
+        .annotate(
+            count=Count('id'),
+            min=Min('value'),
+            max=Max('value'),
+            avg=Avg('value'),
+            last=Last('value', F('timestamp')),
+        )
+        .order_by('plot', 'sensor_type', 'bucket')
+    )
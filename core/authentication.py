@@ -0,0 +1,223 @@
+"""
+Cached authentication: JWT users and plot-scoped device tokens.
+
+``CachedJWTAuthentication`` checks the token signature and expiry as
+usual, then takes the user, the role and the farm/plot ids from one cache
+read instead of three or four queries. The request's scope is built from
+them (``get_scope()``), so the views do not query them again.
+
+``DeviceTokenAuthentication`` authenticates ingestion clients with
+``Authorization: Device <token>``. A device acts for its owner but only on
+its plots, and only on the actions its views allow (``device_actions``).
+Tokens are created with ``python manage.py create_device_token``; only
+their SHA-256 is stored.
+
+Entries are dropped when what they were built from changes:
+
+- user or profile saved or deleted: that user's entry (``revoke_user()``),
+- device saved, revoked, deleted or plots changed: that device's entry,
+- farm or plot saved or deleted: every entry, through the ``plots``
+  generation of core/response_cache.py (read from RESPONSE_CACHE's
+  cache, whichever cache holds the entries).
+
+Settings (``AUTH_CACHE``):
+
+    CACHE    cache alias (default 'default'); shared between the
+             processes, so revocations reach all of them
+    TIMEOUT  seconds an entry is kept (default None: the remaining
+             lifetime of the access token; 300 for devices). Keep it short
+             with a per-process cache.
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import response_cache
+from .models import DeviceToken, UserProfile
+from .scopes import Scope
+
+
+CONFIG = {
+    'CACHE': 'default',
+    'TIMEOUT': None,
+    **getattr(settings, 'AUTH_CACHE', {}),
+}
+
+KEY_PREFIX = 'auth'
+DEVICE_TIMEOUT = 300
+DEVICE_KEYWORD = b'device'
+
+
+def get_cache():
+    return caches[CONFIG['CACHE']]
+
+
+def user_key(user_id):
+    return f'{KEY_PREFIX}:user:{user_id}'
+
+
+def device_key(key_hash):
+    return f'{KEY_PREFIX}:device:{key_hash}'
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_device_token(owner, name, plots):
+    """``(DeviceToken, token)``: the token itself is only known here."""
+    key = secrets.token_urlsafe(32)
+    device = DeviceToken.objects.create(owner=owner, name=name, key_hash=hash_key(key))
+    device.plots.set(plots)
+    return device, key
+
+
+def _resolve(user):
+    """``(is_admin, farm_ids, plot_ids)`` of ``user``, from the database."""
+    scope = Scope(user)
+    return scope.is_admin, scope.farm_ids, scope.plot_ids
+
+
+def _cached(key, build, timeout):
+    """
+    The entry under ``key`` if it was stored under the current ``plots``
+    generation, else ``build()`` stored with it. ``build`` returns ``None``
+    for a value that must not be cached.
+    """
+    cache = get_cache()
+    generation = response_cache.generation_key('plots')
+    # The generation lives in the response cache, where invalidate() bumps it.
+    generation_cache = response_cache.get_cache()
+    if CONFIG['CACHE'] == response_cache.CONFIG['CACHE']:
+        found = cache.get_many([key, generation])
+    else:
+        found = {**generation_cache.get_many([generation]), **cache.get_many([key])}
+    generations = response_cache.current_generations(generation_cache, ['plots'], found)
+    entry = found.get(key)
+    if entry is not None and entry[0] == generations:
+        return entry[1]
+    value = build()
+    if value is not None:
+        cache.set(key, (generations, value), timeout)
+    return value
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user, token = result
+            request._scope = Scope.resolved(user, *self._principal(token)[1:])
+        return result
+
+    def get_user(self, validated_token):
+        return self._principal(validated_token)[0]
+
+    def _principal(self, validated_token):
+        """``(user, is_admin, farm_ids, plot_ids)`` of the token's user."""
+        cached = getattr(validated_token, '_principal', None)
+        if cached is not None:
+            return cached
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed('Token contained no recognizable user identification.')
+
+        def build():
+            user = super(CachedJWTAuthentication, self).get_user(validated_token)
+            return (user, *_resolve(user))
+
+        timeout = CONFIG['TIMEOUT']
+        if timeout is None:
+            timeout = max(1, int(validated_token['exp'] - timezone.now().timestamp()))
+        principal = _cached(user_key(user_id), build, timeout)
+        if not principal[0].is_active:
+            raise AuthenticationFailed('User is inactive.')
+        validated_token._principal = principal
+        return principal
+
+
+class DeviceTokenAuthentication(BaseAuthentication):
+    """``Authorization: Device <token>``; ``request.auth`` is the DeviceToken id."""
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() != DEVICE_KEYWORD:
+            return None
+        if len(parts) != 2:
+            raise AuthenticationFailed('Invalid device token header.')
+        key_hash = hash_key(parts[1].decode(errors='replace'))
+
+        def build():
+            device = (DeviceToken.objects.select_related('owner')
+                      .filter(key_hash=key_hash, revoked_at__isnull=True).first())
+            if device is None:
+                return None
+            owner_plots = Scope(device.owner).plot_ids
+            plot_ids = frozenset(device.plots.values_list('id', flat=True))
+            if owner_plots is not None:
+                plot_ids &= owner_plots
+            return device.id, device.owner, plot_ids
+
+        entry = _cached(device_key(key_hash), build, CONFIG['TIMEOUT'] or DEVICE_TIMEOUT)
+        if entry is None or not entry[1].is_active:
+            raise AuthenticationFailed('Invalid or revoked device token.')
+        device_id, owner, plot_ids = entry
+        request._scope = Scope.resolved(owner, False, frozenset(), plot_ids)
+        return owner, DeviceToken(id=device_id)
+
+    def authenticate_header(self, request):
+        return 'Device'
+
+
+def _drop(key):
+    """Delete ``key`` now and again on commit, like ``response_cache.invalidate()``."""
+    get_cache().delete(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().delete(key))
+
+
+def revoke_user(user_id):
+    _drop(user_key(user_id))
+
+
+def revoke_device(key_hash):
+    _drop(device_key(key_hash))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, **kwargs):
+    revoke_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def _profile_changed(sender, instance, **kwargs):
+    revoke_user(instance.user_id)
+
+
+@receiver(post_save, sender=DeviceToken)
+@receiver(post_delete, sender=DeviceToken)
+def _device_changed(sender, instance, **kwargs):
+    revoke_device(instance.key_hash)
+
+
+@receiver(m2m_changed, sender=DeviceToken.plots.through)
+def _device_plots_changed(sender, instance, **kwargs):
+    if isinstance(instance, DeviceToken):
+        revoke_device(instance.key_hash)
+    else:  # Changed from the plot side.
+        response_cache.invalidate('plots')
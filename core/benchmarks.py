@@ -0,0 +1,368 @@
+"""
+Reproducible benchmarks of the ingest and query paths.
+
+``run()`` seeds farms, plots and simulated readings (the fleet simulator of
+Generator/backfill.py, written with ``ingest.copy_rows()``), then times
+every selected scenario and returns a JSON-serialisable report: per
+scenario the number of calls, the items handled, the throughput and the
+min/mean/p50/p95/p99/max latency in milliseconds.
+
+The HTTP scenarios go through the whole Django stack -- middleware, JWT
+authentication, permissions, views, response cache -- with DRF's
+in-process client, without a network or an application server: they
+measure the application and the database, not uvicorn or the kernel.
+
+Scenarios (``SCENARIOS``, run in this order):
+
+    ingest_single   POST /sensor-readings/, one reading per call
+    ingest_bulk     POST /sensor-readings/bulk/, ``bulk_size`` readings per call
+    by_plot         GET /sensor-readings/plot/<id>/ of a seeded day, response cache cleared
+    by_plot_cached  the same requests, answered from the response cache
+    list            GET /sensor-readings/ of a plot, one keyset page per call
+    aggregate       GET /sensor-readings/aggregate/, hourly buckets (rollup tables)
+    aggregate_raw   GET /sensor-readings/aggregate/, 5-minute buckets (raw readings)
+    detection       detection.run_once() until every reading is scored
+
+``python manage.py benchmark`` runs them on a throwaway test database, like
+the test runner: the report of two runs with the same options and seed
+differs only by the machine and the timings.
+"""
+import itertools
+import math
+import platform
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import detection, ingest, ingest_queue, response_cache, rollups
+from .enumerations import CropVariety
+from .models import FarmProfile, FieldPlot, UserProfile
+
+
+DEFAULTS = {
+    'farms': 2,
+    'plots_per_farm': 5,
+    'hours': 24,
+    'interval': 300,
+    'iterations': 200,
+    'warmup': 10,
+    'bulk_size': 500,
+    'page_size': 100,
+    'seed': 0,
+}
+
+SOURCE = 'benchmark'
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(durations, items):
+    """Statistics of a scenario from its call durations (seconds) and item count."""
+    ordered = sorted(durations)
+    total = sum(ordered)
+    summary = {
+        'calls': len(ordered),
+        'items': items,
+        'seconds': round(total, 6),
+        'throughput': round(items / total, 2) if total else None,
+    }
+    if ordered:
+        summary['latency_ms'] = {
+            'min': round(ordered[0] * 1000, 3),
+            'mean': round(total / len(ordered) * 1000, 3),
+            **{f'p{p}': round(percentile(ordered, p) * 1000, 3) for p in PERCENTILES},
+            'max': round(ordered[-1] * 1000, 3),
+        }
+    return summary
+
+
+def measure(call, iterations, warmup=0, setup=None):
+    """
+    Time ``iterations`` calls of ``call()`` after ``warmup`` untimed ones.
+    ``call`` returns the number of items it handled (readings written,
+    rows returned...); ``setup()`` runs untimed before each call.
+    """
+    durations = []
+    items = 0
+    for index in range(warmup + iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        handled = call()
+        elapsed = time.perf_counter() - started
+        if index >= warmup:
+            durations.append(elapsed)
+            items += handled
+    return summarize(durations, items)
+
+
+def _expect(response, *codes):
+    if response.status_code not in codes:
+        raise AssertionError(f'{response.request["PATH_INFO"]} answered {response.status_code}: {response.content[:200]!r}')
+    return response
+
+
+class Context:
+    """The seeded data and an authenticated client, shared by the scenarios."""
+
+    def __init__(self, options, user, plot_ids, start, end):
+        self.options = options
+        self.user = user
+        self.plot_ids = plot_ids
+        self.start = start
+        self.end = end
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        # New readings are stamped after the seeded range, one second apart.
+        self.clock = end
+
+    def next_timestamp(self):
+        self.clock += timedelta(seconds=1)
+        return self.clock.isoformat()
+
+    def plot(self, index):
+        return self.plot_ids[index % len(self.plot_ids)]
+
+
+def seed(options):
+    """Create the farms, plots and readings. Returns ``(Context, seed report)``."""
+    from .management.commands.backfill_readings import load_backfill_module
+
+    if options['plots_per_farm'] > len(CropVariety.values):
+        # A farm has at most one plot per crop variety.
+        raise ValueError(f'At most {len(CropVariety.values)} plots per farm.')
+    started = time.perf_counter()
+    user = User.objects.create_user('benchmark', 'benchmark@example.com', 'benchmark')
+    UserProfile.objects.create(user=user, role='admin')
+    plot_ids = []
+    for farm_index in range(options['farms']):
+        farm = FarmProfile.objects.create(owner=user, location=f'Benchmark farm {farm_index + 1}', size=10.0)
+        plots = FieldPlot.objects.bulk_create(
+            FieldPlot(farm=farm, crop_variety=variety)
+            for variety in CropVariety.values[:options['plots_per_farm']]
+        )
+        plot_ids += [plot.id for plot in plots]
+    if not plot_ids:
+        raise ValueError('At least one farm and one plot per farm are needed.')
+
+    end = timezone.now().astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=options['hours'])
+    backfill = load_backfill_module()
+    readings = 0
+    for chunk in backfill.iter_backfill(plot_ids, start, end, interval=options['interval'],
+                                        seed=options['seed'], source=SOURCE):
+        readings += ingest.copy_rows(zip(
+            chunk['timestamp'].dt.to_pydatetime(),
+            chunk['plot'].tolist(),
+            chunk['sensor_type'].astype(str).tolist(),
+            chunk['value'].tolist(),
+            chunk['source'].astype(str).tolist(),
+        ))
+    loaded = time.perf_counter() - started
+    rollups.refresh()
+
+    report = {
+        'farms': options['farms'],
+        'plots': len(plot_ids),
+        'readings': readings,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'load_seconds': round(loaded, 3),
+        'rollup_seconds': round(time.perf_counter() - started - loaded, 3),
+    }
+    return Context(options, user, plot_ids, start, end), report
+
+
+def ingest_single(context):
+    counter = itertools.count()
+
+    def call():
+        response = context.client.post('/api/sensor-readings/', {
+            'plot': context.plot(next(counter)),
+            'sensor_type': 'temperature',
+            'value': 21.5,
+            'timestamp': context.next_timestamp(),
+            'source': SOURCE,
+        }, format='json')
+        _expect(response, 201, 202)
+        return 1
+
+    return call, None
+
+
+def ingest_bulk(context):
+    size = context.options['bulk_size']
+
+    def call():
+        rows = []
+        for index in range(size):
+            if index % len(context.plot_ids) == 0:
+                timestamp = context.next_timestamp()
+            rows.append({
+                'plot': context.plot(index),
+                'sensor_type': 'humidity',
+                'value': 60.0,
+                'timestamp': timestamp,
+                'source': SOURCE,
+            })
+        _expect(context.client.post('/api/sensor-readings/bulk/', rows, format='json'), 201, 202)
+        return size
+
+    return call, None
+
+
+def _by_plot(context):
+    day = (context.end - timedelta(seconds=1)).date().isoformat()
+    counter = itertools.count()
+
+    def call():
+        response = context.client.get(f'/api/sensor-readings/plot/{context.plot(next(counter))}/', {'date': day})
+        return len(_expect(response, 200).json())
+
+    return call
+
+
+def by_plot(context):
+    return _by_plot(context), lambda: response_cache.get_cache().clear()
+
+
+def by_plot_cached(context):
+    call = _by_plot(context)
+    # Fill the cache for every plot first.
+    for _ in context.plot_ids:
+        call()
+    return call, None
+
+
+def list_pages(context):
+    params = {
+        'plot': context.plot_ids[0],
+        'start': context.start.isoformat(),
+        'end': context.end.isoformat(),
+        'page_size': context.options['page_size'],
+    }
+    state = {'next': None}
+
+    def call():
+        if state['next']:
+            response = context.client.get(state['next'])
+        else:
+            response = context.client.get('/api/sensor-readings/', params)
+        body = _expect(response, 200).json()
+        # Start over from the first page once the last one is reached.
+        state['next'] = body['next']
+        return len(body['results'])
+
+    return call, lambda: response_cache.get_cache().clear()
+
+
+def _aggregate(context, bucket):
+    params = {
+        'plot': ','.join(str(plot_id) for plot_id in context.plot_ids),
+        'bucket': bucket,
+        'start': context.start.isoformat(),
+        'end': context.end.isoformat(),
+    }
+
+    def call():
+        return len(_expect(context.client.get('/api/sensor-readings/aggregate/', params), 200).json())
+
+    return call, None
+
+
+def aggregate(context):
+    return _aggregate(context, '1h')
+
+
+def aggregate_raw(context):
+    return _aggregate(context, '5m')
+
+
+def score(context):
+    config = detection.get_config()
+
+    def call():
+        return detection.run_once(config=config)[0]
+
+    return call, None
+
+
+# name: (scenario, timed like the others); the detection scenario runs
+# until the backlog is empty instead of a fixed number of iterations.
+SCENARIOS = {
+    'ingest_single': (ingest_single, True),
+    'ingest_bulk': (ingest_bulk, True),
+    'by_plot': (by_plot, True),
+    'by_plot_cached': (by_plot_cached, True),
+    'list': (list_pages, True),
+    'aggregate': (aggregate, True),
+    'aggregate_raw': (aggregate_raw, True),
+    'detection': (score, False),
+}
+
+
+def run_scenario(context, name):
+    scenario, fixed = SCENARIOS[name]
+    call, setup = scenario(context)
+    if fixed:
+        return measure(call, context.options['iterations'], context.options['warmup'], setup)
+
+    durations, items = [], 0
+    while True:
+        started = time.perf_counter()
+        handled = call()
+        elapsed = time.perf_counter() - started
+        if not handled:
+            break
+        durations.append(elapsed)
+        items += handled
+    return summarize(durations, items)
+
+
+def _database_version():
+    if connection.vendor == 'postgresql':
+        connection.ensure_connection()
+        return connection.pg_version
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version
+    return None
+
+
+def run(scenarios=None, **options):
+    """
+    Seed the database and run ``scenarios`` (default: all of them, in
+    ``SCENARIOS`` order). Options are those of ``DEFAULTS``.
+    """
+    options = {**DEFAULTS, **options}
+    names = [name for name in SCENARIOS if scenarios is None or name in scenarios]
+    unknown = set(scenarios or ()) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f'Unknown scenarios: {", ".join(sorted(unknown))}.')
+
+    context, seeded = seed(options)
+    return {
+        'created': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'database_version': _database_version(),
+            'machine': platform.machine(),
+            'ingest_queue': ingest_queue.is_enabled(),
+            'response_cache': settings.CACHES[response_cache.CONFIG['CACHE']]['BACKEND'],
+        },
+        'options': options,
+        'seed': seeded,
+        'scenarios': {name: run_scenario(context, name) for name in names},
+    }
@@ -0,0 +1,226 @@
+"""
+Compaction of old sensor readings into the wide ``sensor_samples`` table.
+
+A tick of a plot is three rows of sensor_readings, each carrying its own
+id, timestamp, plot, sensor type and source next to an 8-byte value (and
+entries in five indexes). ``compact()`` moves complete ticks -- the three
+sensors of a (plot, timestamp, source) -- older than a cutoff into a
+single ``SensorSample`` row.
+
+On PostgreSQL sensor_readings is compacted one whole range partition at a
+time (core/partitions.py), once the partition is entirely older than the
+cutoff: the samples are inserted, the readings that stay are copied into
+a new table and that table replaces the partition (detach, drop, attach).
+Nothing is DELETEd, so there are no dead tuples left for VACUUM. Writers
+of the partition wait for the whole swap. The DETACH locks all of
+sensor_readings (a concurrent DETACH is not allowed next to a default
+partition) until the commit, so every reader and writer of the table
+waits for the end of the swap; the copy, its indexes and constraints are
+ready before it, leaving catalog changes and a scan of the default
+partition inside that window. Rows of the default partition wait until
+their range partition exists. Other backends delete the compacted
+readings, one day per transaction.
+
+Readings are left in place while something still points at them or has
+not seen them yet:
+
+- readings referenced by an anomaly event or by a heartbeat,
+- readings above the lowest ``ProcessingWatermark`` (not yet scored or
+  rolled up),
+- ticks missing one of the sensors.
+
+The ``sensor_reading_history`` view (``SensorReadingHistory``) shows both
+tables as readings again, compacted ones with the id ``-(sample id * 4 +
+k)``, and serves the list, by_plot, export, aggregate and re-scoring
+reads. A compacted reading can no longer be fetched, updated or deleted
+by id. Re-sending a reading of a compacted tick stores nothing: ingestion
+drops it (``drop_compacted()``), as it drops duplicates of stored readings.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from . import partitions
+from .enumerations import SensorType
+from .models import AnomalyEvent, ProcessingWatermark, SensorHeartbeat, SensorReading, SensorSample
+
+
+DAY = timedelta(days=1)
+
+# Column of sensor_samples holding each sensor type.
+COLUMNS = {
+    SensorType.MOISTURE: 'moisture',
+    SensorType.TEMPERATURE: 'temperature',
+    SensorType.HUMIDITY: 'humidity',
+}
+
+
+def _movable(quote):
+    """SQL condition (on ``r``) for readings that may leave sensor_readings."""
+    return (
+        f'r.id <= %(watermark)s '
+        f'AND NOT EXISTS (SELECT 1 FROM {quote(AnomalyEvent._meta.db_table)} a WHERE a.sensor_reading_id = r.id) '
+        f'AND NOT EXISTS (SELECT 1 FROM {quote(SensorHeartbeat._meta.db_table)} h WHERE h.last_reading_id = r.id)'
+    )
+
+
+def _insert_samples(cursor, readings, condition, params):
+    """Insert the complete movable ticks of ``readings`` (a table) matching ``condition``."""
+    quote = connection.ops.quote_name
+    pivot = ', '.join(
+        f"MAX(CASE WHEN r.sensor_type = '{sensor_type}' THEN r.value END)"
+        for sensor_type in COLUMNS
+    )
+    cursor.execute(
+        f'INSERT INTO {quote(SensorSample._meta.db_table)} (plot_id, "timestamp", source, {", ".join(COLUMNS.values())}) '
+        f'SELECT r.plot_id, r."timestamp", r.source, {pivot} FROM {readings} r '
+        f'WHERE {condition} AND {_movable(quote)} '
+        f'GROUP BY r.plot_id, r."timestamp", r.source '
+        f'HAVING COUNT(*) = %(sensors)s '
+        f'ON CONFLICT (plot_id, "timestamp", source) DO NOTHING',
+        {**params, 'sensors': len(COLUMNS)},
+    )
+    return cursor.rowcount
+
+
+def _compacted():
+    """SQL condition (on ``r``) for movable readings whose tick is in sensor_samples."""
+    quote = connection.ops.quote_name
+    return (
+        f'{_movable(quote)} AND EXISTS (SELECT 1 FROM {quote(SensorSample._meta.db_table)} s '
+        f'WHERE s.plot_id = r.plot_id AND s."timestamp" = r."timestamp" AND s.source = r.source)'
+    )
+
+
+def compact_range(start, end, watermark):
+    """Compact the readings of ``[start, end)`` with a DELETE. Returns ``(samples, readings)`` moved."""
+    readings = connection.ops.quote_name(SensorReading._meta.db_table)
+    params = {
+        'start': connection.ops.adapt_datetimefield_value(start),
+        'end': connection.ops.adapt_datetimefield_value(end),
+        'watermark': watermark,
+    }
+    in_range = 'r."timestamp" >= %(start)s AND r."timestamp" < %(end)s'
+    with transaction.atomic(), connection.cursor() as cursor:
+        moved_samples = _insert_samples(cursor, readings, in_range, params)
+        # Every movable reading of a compacted tick is now in sensor_samples
+        # (a re-sent copy of an already compacted tick is simply dropped).
+        cursor.execute(
+            f'DELETE FROM {readings} WHERE id IN (SELECT r.id FROM {readings} r WHERE {in_range} AND {_compacted()})',
+            params,
+        )
+        return moved_samples, cursor.rowcount
+
+
+def compact_partition(name, start, end, watermark):
+    """
+    Compact the sensor_readings partition ``name`` (``[start, end)``) by
+    replacing it with a copy of the readings that stay. Returns
+    ``(samples, readings)`` moved.
+    """
+    quote = connection.ops.quote_name
+    partition = quote(name)
+    replacement = quote(f'{name}_compacted')
+    params = {'watermark': watermark}
+    interval = 'day' if end - start == DAY else 'month'
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Writes to the partition would be lost with it.
+        cursor.execute(f'LOCK TABLE {partition} IN EXCLUSIVE MODE')
+        partitions.create_partition(cursor, start, interval, table=partitions.SAMPLES_TABLE)
+        moved_samples = _insert_samples(cursor, partition, 'TRUE', params)
+        cursor.execute(f'SELECT COUNT(*) FROM {partition} r WHERE {_compacted()}', params)
+        moved_readings = cursor.fetchone()[0]
+        if not moved_readings:
+            return moved_samples, 0
+        # Everything ATTACH would otherwise build or check while the parent
+        # is locked is prepared first: the indexes (ATTACH adopts them), the
+        # foreign keys and a CHECK of the range (ATTACH then skips its scan).
+        cursor.execute(f'CREATE TABLE {replacement} (LIKE {partition} INCLUDING ALL)')
+        cursor.execute(f'INSERT INTO {replacement} SELECT r.* FROM {partition} r WHERE NOT ({_compacted()})', params)
+        cursor.execute(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [name],
+        )
+        for (definition,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {replacement} ADD {definition}')
+        bounds = quote(f'{name}_bounds')
+        cursor.execute(
+            f'ALTER TABLE {replacement} ADD CONSTRAINT {bounds} CHECK ("timestamp" >= %(start)s AND "timestamp" < %(end)s)',
+            {'start': start, 'end': end},
+        )
+
+        # From the DETACH to the commit sensor_readings is locked (ACCESS
+        # EXCLUSIVE), for catalog changes and a scan of the default partition.
+        partitions.detach_partition(cursor, name, drop=True)
+        cursor.execute(f'ALTER TABLE {replacement} RENAME TO {partition}')
+        cursor.execute(
+            f'ALTER TABLE {quote(partitions.TABLE)} ATTACH PARTITION {partition} '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        cursor.execute(f'ALTER TABLE {partition} DROP CONSTRAINT {bounds}')
+        return moved_samples, moved_readings
+
+
+def _expired_partitions(before):
+    if not partitions.is_supported():
+        return None
+    with connection.cursor() as cursor:
+        if not partitions.is_partitioned(cursor):
+            return None
+        return [partition for partition in partitions.list_partitions(cursor) if partition[2] <= before]
+
+
+def compact(before):
+    """
+    Compact every reading older than ``before``: the range partitions
+    entirely older than ``before`` on PostgreSQL, one day at a time
+    elsewhere. Returns ``(samples, readings)`` moved.
+    """
+    watermark = ProcessingWatermark.objects.aggregate(low=Min('last_reading_id'))['low']
+    if watermark is None:
+        watermark = SensorReading.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    moved = [0, 0]
+    expired = _expired_partitions(before)
+    if expired is not None:
+        for name, start, end in expired:
+            for total, count in enumerate(compact_partition(name, start, end, watermark)):
+                moved[total] += count
+        return tuple(moved)
+
+    first = SensorReading.objects.filter(timestamp__lt=before).order_by('timestamp').values_list('timestamp', flat=True).first()
+    if first is None:
+        return tuple(moved)
+    start = partitions.floor_bound(first, 'day')
+    while start < before:
+        end = min(start + DAY, before)
+        for total, count in enumerate(compact_range(start, end, watermark)):
+            moved[total] += count
+        start = end
+    return tuple(moved)
+
+
+def drop_compacted(rows):
+    """
+    ``rows`` (``(timestamp, plot_id, sensor_type, value, source)`` tuples)
+    without the readings of ticks already compacted into sensor_samples,
+    which the natural key of sensor_readings cannot catch.
+    """
+    newest = SensorSample.objects.aggregate(newest=Max('timestamp'))['newest']
+    if newest is None:
+        return rows
+    old = [row for row in rows if row[0] <= newest]
+    if not old:
+        return rows
+    compacted = set(
+        SensorSample.objects
+        .filter(
+            plot_id__in={row[1] for row in old},
+            timestamp__gte=min(row[0] for row in old),
+            timestamp__lte=max(row[0] for row in old),
+        )
+        .values_list('plot_id', 'timestamp', 'source')
+    )
+    if not compacted:
+        return rows
+    return [row for row in rows if (row[1], row[0], row[4]) not in compacted]
@@ -0,0 +1,253 @@
+"""
+Streaming anomaly detection on incoming sensor readings.
+
+``run_once()`` reads the readings inserted since the ``detector``
+watermark in id order, up to the last id no in-flight transaction can
+still commit below (core/watermarks.py), and keeps a constant-size state
+per (plot, sensor_type) series (``DetectorState``):
+
+- an EWMA mean and variance (z-score),
+- a running median and mean absolute deviation (robust z-score, barely
+  moved by the outliers it is looking for),
+- a two-sided CUSUM of the standardized residual (slow drift).
+
+A reading is scored by the smaller of the two z-scores, so both estimates
+have to agree before a spike is reported. Readings outside the physical
+range of the sensor are reported as SENSOR_FAILURE. Silent sensors
+(DATA_GAP, SENSOR_FAILURE) are the heartbeat sweeper's business, see
+core/heartbeat.py. An event is created when a series enters an anomalous
+state, not for every reading while it stays there. Events, states and the
+watermark are written in one transaction.
+
+Settings (``ANOMALY_DETECTION``):
+
+    ALPHA            EWMA smoothing factor (default 0.05)
+    WARMUP           readings per series before z-scores are trusted (default 30)
+    Z_THRESHOLD      score above which a reading is anomalous (default 4.0)
+    CUSUM_SLACK      CUSUM allowance, in standard deviations (default 1.0)
+    CUSUM_LIMIT      CUSUM alarm level (default 30.0)
+    GAP_SECONDS      silence reported as DATA_GAP by the heartbeat sweeper,
+                     see core/heartbeat.py (default 900)
+    FAILURE_SECONDS  silence reported as SENSOR_FAILURE by the heartbeat
+                     sweeper (default 21600)
+    MIN_STD          per sensor type floor of the standard deviation
+    VALID_RANGES     per sensor type physically possible values
+"""
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .enumerations import AnomalyType, SensorType, SeverityLevel
+from . import watermarks
+from .models import AnomalyEvent, DetectorState, ProcessingWatermark, SensorReading
+
+
+WATERMARK = 'detector'
+
+DEFAULTS = {
+    'ALPHA': 0.05,
+    'WARMUP': 30,
+    'Z_THRESHOLD': 4.0,
+    'CUSUM_SLACK': 1.0,
+    'CUSUM_LIMIT': 30.0,
+    'GAP_SECONDS': 900,
+    'FAILURE_SECONDS': 6 * 3600,
+    'MIN_STD': {
+        SensorType.MOISTURE: 0.5,
+        SensorType.TEMPERATURE: 0.3,
+        SensorType.HUMIDITY: 0.5,
+    },
+    'VALID_RANGES': {
+        SensorType.MOISTURE: (0.0, 100.0),
+        SensorType.TEMPERATURE: (-40.0, 70.0),
+        SensorType.HUMIDITY: (0.0, 100.0),
+    },
+}
+
+# (below the baseline, above the baseline) per sensor type
+DIRECTIONAL_TYPES = {
+    SensorType.MOISTURE: (AnomalyType.MOISTURE_DROP, AnomalyType.MOISTURE_SPIKE),
+    SensorType.TEMPERATURE: (AnomalyType.TEMPERATURE_LOW, AnomalyType.TEMPERATURE_HIGH),
+    SensorType.HUMIDITY: (AnomalyType.HUMIDITY_LOW, AnomalyType.HUMIDITY_HIGH),
+}
+
+# Score as a multiple of Z_THRESHOLD -> severity
+SEVERITY_STEPS = (
+    (2.0, SeverityLevel.CRITICAL),
+    (1.5, SeverityLevel.HIGH),
+    (1.2, SeverityLevel.MEDIUM),
+)
+
+STATE_FIELDS = [
+    'count', 'mean', 'variance', 'median', 'deviation',
+    'cusum_high', 'cusum_low', 'last_timestamp', 'active_anomaly',
+]
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ANOMALY_DETECTION', {})}
+
+
+def severity(ratio):
+    """Severity of a score ``ratio`` times the alarm threshold."""
+    for step, level in SEVERITY_STEPS:
+        if ratio >= step:
+            return level
+    return SeverityLevel.LOW
+
+
+def confidence(ratio):
+    """0.5 at the alarm threshold, approaching 0.99 as the score grows."""
+    return round(min(0.99, 1.0 - 0.5 / ratio), 3)
+
+
+def update_statistics(state, value, config):
+    """Fold ``value`` into the EWMA, median/deviation and count of ``state``."""
+    if state.count == 0:
+        state.mean = state.median = value
+        state.variance = state.deviation = 0.0
+        state.count = 1
+        return
+    alpha = config['ALPHA']
+    diff = value - state.mean
+    increment = alpha * diff
+    state.mean += increment
+    state.variance = (1 - alpha) * (state.variance + diff * increment)
+    step = alpha * max(state.deviation, config['MIN_STD'][state.sensor_type])
+    state.median += step if value > state.median else -step if value < state.median else 0.0
+    state.deviation += alpha * (abs(value - state.median) - state.deviation)
+    state.count += 1
+
+
+def score(state, value, timestamp, config):
+    """
+    Update ``state`` with one reading and return the ``(anomaly_type,
+    ratio)`` findings, ``ratio`` being the score over its alarm level.
+    """
+    findings = []
+    if state.last_timestamp is None or timestamp > state.last_timestamp:
+        state.last_timestamp = timestamp
+
+    low, high = config['VALID_RANGES'][state.sensor_type]
+    if not low <= value <= high:
+        # Impossible values say nothing about the series: keep them out of the statistics.
+        findings.append((AnomalyType.SENSOR_FAILURE, SEVERITY_STEPS[0][0]))
+        return findings
+
+    threshold = config['Z_THRESHOLD']
+    if state.count < config['WARMUP']:
+        update_statistics(state, value, config)
+        return findings
+
+    min_std = config['MIN_STD'][state.sensor_type]
+    std = max(math.sqrt(state.variance), min_std)
+    robust_std = max(1.4826 * state.deviation, min_std)
+    z = (value - state.mean) / std
+    robust_z = (value - state.median) / robust_std
+    if z * robust_z > 0 and min(abs(z), abs(robust_z)) >= threshold:
+        below, above = DIRECTIONAL_TYPES[state.sensor_type]
+        findings.append((above if z > 0 else below, min(abs(z), abs(robust_z)) / threshold))
+    else:
+        slack, limit = config['CUSUM_SLACK'], config['CUSUM_LIMIT']
+        state.cusum_high = max(0.0, state.cusum_high + z - slack)
+        state.cusum_low = max(0.0, state.cusum_low - z - slack)
+        drift = max(state.cusum_high, state.cusum_low)
+        if drift > limit:
+            findings.append((AnomalyType.SENSOR_DRIFT, drift / limit))
+            state.cusum_high = state.cusum_low = 0.0
+
+    # Clip the value so that a spike does not drag the baseline along.
+    clipped = min(max(value, state.mean - threshold * std), state.mean + threshold * std)
+    update_statistics(state, clipped, config)
+    return findings
+
+
+def detect(state, reading_id, value, timestamp, config):
+    """
+    Score one reading of ``state``'s series and return the AnomalyEvents
+    to create (not saved).
+    """
+    events = []
+    active = ''
+    for anomaly_type, ratio in score(state, value, timestamp, config):
+        active = anomaly_type
+        if anomaly_type == state.active_anomaly:
+            continue
+        events.append(AnomalyEvent(
+            timestamp=timestamp,
+            plot_id=state.plot_id,
+            anomaly_type=anomaly_type,
+            severity=severity(ratio),
+            model_confidence=confidence(ratio),
+            sensor_reading_id=reading_id,
+        ))
+    state.active_anomaly = active
+    return events
+
+
+def load_states(keys):
+    """``{(plot_id, sensor_type): DetectorState}`` for ``keys``, new states included."""
+    plot_ids = {plot_id for plot_id, _ in keys}
+    states = {
+        (state.plot_id, state.sensor_type): state
+        for state in DetectorState.objects.filter(plot_id__in=plot_ids)
+    }
+    for plot_id, sensor_type in keys:
+        if (plot_id, sensor_type) not in states:
+            states[plot_id, sensor_type] = DetectorState(plot_id=plot_id, sensor_type=sensor_type)
+    return states
+
+
+def save_states(states):
+    DetectorState.objects.bulk_create(
+        states,
+        update_conflicts=True,
+        unique_fields=['plot', 'sensor_type'],
+        update_fields=STATE_FIELDS,
+    )
+
+
+def run_once(batch_size=5000, config=None):
+    """
+    Score the next ``batch_size`` readings after the watermark, up to the
+    last settled id (see core/watermarks.py): a reading committed late,
+    below readings already visible, is still scored, and only once.
+    Returns ``(readings processed, events created, last reading timestamp)``.
+    """
+    config = config or get_config()
+    ProcessingWatermark.objects.get_or_create(name=WATERMARK)
+    with transaction.atomic():
+        observation = watermarks.observe()
+        watermark = ProcessingWatermark.objects.select_for_update().get(name=WATERMARK)
+        settled = watermarks.horizon(watermark, observation)
+        readings = list(
+            SensorReading.objects
+            .filter(id__gt=watermark.last_reading_id, id__lte=settled)
+            .order_by('id')
+            .values_list('id', 'plot_id', 'sensor_type', 'value', 'timestamp')[:batch_size]
+        )
+        if not readings:
+            watermark.save(update_fields=['pending', 'updated_at'])
+            return 0, 0, None
+
+        keys = {(plot_id, sensor_type) for _, plot_id, sensor_type, _, _ in readings}
+        states = load_states(keys)
+        events = []
+        for reading_id, plot_id, sensor_type, value, timestamp in readings:
+            events.extend(detect(states[plot_id, sensor_type], reading_id, value, timestamp, config))
+
+        save_states([states[key] for key in keys])
+        # Reprocessed ranges hit the (timestamp, plot, anomaly_type) constraint.
+        AnomalyEvent.objects.bulk_create(events, ignore_conflicts=True)
+        watermark.last_reading_id = readings[-1][0]
+        watermark.save(update_fields=['last_reading_id', 'pending', 'updated_at'])
+    return len(readings), len(events), max(r[4] for r in readings)
+
+
+def backlog():
+    """Number of readings waiting to be scored."""
+    last = ProcessingWatermark.objects.filter(name=WATERMARK).values_list('last_reading_id', flat=True).first()
+    top = SensorReading.objects.aggregate(top=Max('id'))['top'] or 0
+    return max(top - (last or 0), 0)
@@ -0,0 +1,157 @@
+"""
+Streaming export of sensor history (CSV, NDJSON, Parquet, Arrow IPC).
+
+Rows are read with ``QuerySet.iterator()`` (a server-side cursor on
+PostgreSQL) in chunks of ``CHUNK_SIZE`` and each chunk is encoded and
+sent before the next one is fetched, so memory stays bounded by one chunk
+whatever the size of the export. The columnar formats write one Parquet
+row group / Arrow record batch per chunk and need ``pyarrow``.
+
+Django serves a sync iterator under ASGI by collecting it in a thread
+first, which would hold the whole export in memory: ASGI requests get the
+stream through ``aiterate()``, which produces one chunk per
+``sync_to_async`` call instead.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .serializers import sensor_reading_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only the columnar formats need it.
+    pa = pq = None
+
+
+CHUNK_SIZE = getattr(settings, 'SENSOR_EXPORT_CHUNK_SIZE', 10000)
+
+COLUMNS = ['id', 'timestamp', 'plot', 'sensor_type', 'value', 'source']
+
+
+def chunks(queryset):
+    """Lists of ``values()`` rows in ``(timestamp, id)`` order, one chunk at a time."""
+    rows = sensor_reading_rows.values(queryset.order_by('timestamp', 'id')).iterator(chunk_size=CHUNK_SIZE)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        yield chunk
+
+
+def represented(queryset):
+    """Chunks of rows in their API representation, restricted to ``COLUMNS``."""
+    for chunk in chunks(queryset):
+        yield [{name: row[name] for name in COLUMNS} for row in sensor_reading_rows.represent(chunk)]
+
+
+def stream_csv(queryset):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for rows in represented(queryset):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(queryset):
+    for rows in represented(queryset):
+        yield ''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file whose content is taken out after every batch."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+        ('plot', pa.int64()),
+        ('sensor_type', pa.string()),
+        ('value', pa.float64()),
+        ('source', pa.string()),
+    ])
+
+
+def _record_batches(queryset, schema):
+    for chunk in chunks(queryset):
+        yield pa.record_batch([
+            [row['id'] for row in chunk],
+            [row['timestamp'] for row in chunk],
+            [row['plot_id'] for row in chunk],
+            [row['sensor_type'] for row in chunk],
+            [row['value'] for row in chunk],
+            [row['source'] for row in chunk],
+        ], schema=schema)
+
+
+def stream_parquet(queryset):
+    schema, sink = _schema(), _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    for batch in _record_batches(queryset, schema):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_arrow(queryset):
+    schema, sink = _schema(), _Sink()
+    writer = pa.ipc.new_stream(sink, schema)
+    for batch in _record_batches(queryset, schema):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def aiterate(stream):
+    """``stream`` (a sync iterator of chunks) as an async iterator, one chunk per thread hop."""
+    # Thread-sensitive: every chunk is read on the thread holding the cursor.
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (chunk := await step(stream, done)) is not done:
+            yield chunk
+    finally:
+        await sync_to_async(stream.close, thread_sensitive=True)()
+
+
+# format: (content type, file extension, stream function, needs pyarrow)
+FORMATS = {
+    'csv': ('text/csv', 'csv', stream_csv, False),
+    'ndjson': ('application/x-ndjson', 'ndjson', stream_ndjson, False),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', stream_parquet, True),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows', stream_arrow, True),
+}
+
+
+def available(export_format):
+    return export_format in FORMATS and (pa is not None or not FORMATS[export_format][3])
@@ -0,0 +1,94 @@
+"""
+Query-string filters shared by the list endpoints.
+
+Time filters are always turned into half-open ``[start, end)`` timestamp
+ranges so that the planner can use the (plot, sensor_type, timestamp)
+index; filtering on ``timestamp__date`` would wrap the column in a cast
+and force a sequential scan.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_instant(value, param):
+    """Parse an ISO datetime or a date (local midnight) from a query param."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is not None:
+                parsed = datetime.combine(day, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({param: f'Invalid datetime "{value}".'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def day_range(day):
+    """Half-open range covering a local calendar day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def time_range(params):
+    """``(start, end)`` from the ``start``/``end`` query params (either may be None)."""
+    start = parse_instant(params['start'], 'start') if params.get('start') else None
+    end = parse_instant(params['end'], 'end') if params.get('end') else None
+    return start, end
+
+
+def filter_time_range(queryset, params, field='timestamp'):
+    start, end = time_range(params)
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset
+
+
+def id_list(params, name):
+    """Ids from ``?name=1,2`` and/or ``?name=1&name=2``."""
+    ids = []
+    for raw in params.getlist(name):
+        for part in raw.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                ids.append(int(part))
+            except ValueError:
+                raise ValidationError({name: f'"{part}" is not a valid id.'})
+    return ids
+
+
+def value_list(params, name, choices):
+    values = [v.strip() for raw in params.getlist(name) for v in raw.split(',') if v.strip()]
+    invalid = [v for v in values if v not in choices]
+    if invalid:
+        raise ValidationError({name: f'"{invalid[0]}" is not a valid choice.'})
+    return values
+
+
+def filter_plots(queryset, params, plot_field='plot'):
+    """``?plot=`` and ``?farm=`` filters (comma separated or repeated)."""
+    plots = id_list(params, 'plot')
+    if plots:
+        queryset = queryset.filter(**{f'{plot_field}_id__in': plots})
+    farms = id_list(params, 'farm')
+    if farms:
+        queryset = queryset.filter(**{f'{plot_field}__farm_id__in': farms})
+    return queryset
+
+
+def filter_choices(queryset, params, field, choices):
+    values = value_list(params, field, choices)
+    if values:
+        queryset = queryset.filter(**{f'{field}__in': values})
+    return queryset
@@ -0,0 +1,100 @@
+"""
+"Last seen" index of the sensors, for DATA_GAP / SENSOR_FAILURE detection.
+
+Every write path calls ``touch()``, which upserts one ``SensorHeartbeat``
+row per (plot, sensor_type) of the batch, only ever moving ``last_seen``
+forward (backfilled history does not make a silent sensor look alive).
+``sweep()`` then finds the silent sensors by reading this table, one row
+per sensor, instead of looking up the latest reading of every series in
+sensor_readings. A silence is reported once as DATA_GAP after
+``GAP_SECONDS`` and once more as SENSOR_FAILURE after ``FAILURE_SECONDS``
+(``ANOMALY_DETECTION`` settings); the next reading re-arms the sensor.
+Sensors of a plot silent since the same time share one event.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import detection
+from .enumerations import AnomalyType
+from .models import AnomalyEvent, SensorHeartbeat
+
+
+def touch(readings):
+    """Record the latest of ``readings`` (saved SensorReadings) per series."""
+    latest = {}
+    for reading in readings:
+        key = (reading.plot_id, reading.sensor_type)
+        seen = latest.get(key)
+        if seen is None or (reading.timestamp, reading.pk) > seen:
+            latest[key] = (reading.timestamp, reading.pk)
+    if not latest:
+        return
+
+    table = connection.ops.quote_name(SensorHeartbeat._meta.db_table)
+    params = []
+    # Sorted keys: concurrent batches lock the rows in the same order.
+    for (plot_id, sensor_type), (timestamp, pk) in sorted(latest.items()):
+        params += [plot_id, sensor_type, connection.ops.adapt_datetimefield_value(timestamp), pk]
+    values = ', '.join(["(%s, %s, %s, %s, '')"] * len(latest))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (plot_id, sensor_type, last_seen, last_reading_id, reported) "
+            f"VALUES {values} "
+            f"ON CONFLICT (plot_id, sensor_type) DO UPDATE SET "
+            f"last_seen = excluded.last_seen, last_reading_id = excluded.last_reading_id, reported = '' "
+            f"WHERE {table}.last_seen < excluded.last_seen",
+            params,
+        )
+
+
+def sweep(now=None, config=None):
+    """Create the events of the sensors that went silent. Returns the events created."""
+    config = config or detection.get_config()
+    now = now or timezone.now()
+    events = {}
+    with transaction.atomic():
+        # Longest silence first: a sensor found silent for hours is a failure, not a gap.
+        for anomaly_type, seconds, pending in (
+            (AnomalyType.SENSOR_FAILURE, config['FAILURE_SECONDS'], ['', AnomalyType.DATA_GAP]),
+            (AnomalyType.DATA_GAP, config['GAP_SECONDS'], ['']),
+        ):
+            cutoff = now - timedelta(seconds=seconds)
+            silent = SensorHeartbeat.objects.filter(last_seen__lt=cutoff, reported__in=pending)
+            # Locked rows belong to a concurrent sweep, which reports them.
+            rows = list(
+                silent.select_for_update(skip_locked=True).order_by('id')
+                .values_list('id', 'plot_id', 'last_seen', 'last_reading_id')
+            )
+            for _, plot_id, last_seen, reading_id in rows:
+                timestamp = last_seen + timedelta(seconds=seconds)
+                # The sensors of a logger go silent together: one event per
+                # plot and time (the events are unique on that).
+                if (plot_id, timestamp, anomaly_type) in events:
+                    continue
+                if anomaly_type == AnomalyType.SENSOR_FAILURE:
+                    ratio = detection.SEVERITY_STEPS[0][0]
+                else:
+                    ratio = (now - last_seen).total_seconds() / seconds
+                events[plot_id, timestamp, anomaly_type] = AnomalyEvent(
+                    timestamp=timestamp,
+                    plot_id=plot_id,
+                    anomaly_type=anomaly_type,
+                    severity=detection.severity(ratio),
+                    model_confidence=detection.confidence(ratio),
+                    sensor_reading_id=reading_id,
+                )
+            # `last_seen` is checked again: a sensor that reported meanwhile stays armed.
+            silent.filter(id__in=[row[0] for row in rows]).update(reported=anomaly_type)
+        if events:
+            # Another sensor of the plot, silent since the same time, may
+            # have been reported by an earlier sweep.
+            reported = set(AnomalyEvent.objects.filter(
+                plot_id__in={plot_id for plot_id, _, _ in events},
+                timestamp__in={timestamp for _, timestamp, _ in events},
+                anomaly_type__in=[AnomalyType.SENSOR_FAILURE, AnomalyType.DATA_GAP],
+            ).values_list('plot_id', 'timestamp', 'anomaly_type'))
+            events = [event for key, event in events.items() if key not in reported]
+            AnomalyEvent.objects.bulk_create(events)
+    return list(events)
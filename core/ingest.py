@@ -0,0 +1,221 @@
+"""
+Bulk ingestion of sensor readings.
+
+Rows are validated column by column in a single pass (one query for the
+referenced plots, set lookups for the sensor types) and written with a
+single ``INSERT .. ON CONFLICT DO NOTHING``, or with ``COPY`` on PostgreSQL
+for large batches (see core/pgcopy.py). Readings are identified by their
+natural key (plot, sensor_type, timestamp, source): re-sending a batch
+inserts nothing twice. Invalid rows are reported individually and never
+abort the rest of the batch.
+"""
+import math
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import compaction, heartbeat, latest, pgcopy, response_cache
+from .enumerations import SensorType
+from .models import FieldPlot, SensorReading
+
+
+BULK_MAX_ROWS = getattr(settings, 'SENSOR_BULK_MAX_ROWS', 10000)
+BULK_BATCH_SIZE = getattr(settings, 'SENSOR_BULK_BATCH_SIZE', 2000)
+# Batches of at least COPY_MIN_ROWS readings are written with COPY, in
+# transactions of at most COPY_BATCH_SIZE rows.
+COPY_MIN_ROWS = getattr(settings, 'SENSOR_COPY_MIN_ROWS', 1000)
+COPY_BATCH_SIZE = getattr(settings, 'SENSOR_COPY_BATCH_SIZE', 50000)
+
+SENSOR_TYPES = frozenset(SensorType.values)
+SOURCE_MAX_LENGTH = SensorReading._meta.get_field('source').max_length
+
+
+def _parse_plot(raw):
+    if isinstance(raw, bool):
+        return None
+    try:
+        plot_id = int(raw)
+    except (TypeError, ValueError):
+        return None
+    return plot_id if plot_id > 0 else None
+
+
+def _parse_value(raw):
+    if isinstance(raw, bool) or raw is None:
+        return None
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _parse_timestamp(raw):
+    if isinstance(raw, str):
+        try:
+            ts = parse_datetime(raw)
+        except ValueError:
+            return None
+    elif isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        try:
+            ts = datetime.fromtimestamp(raw, tz=timezone.get_current_timezone())
+        except (OverflowError, OSError, ValueError):
+            return None
+    else:
+        return None
+    if ts is not None and timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+    return ts
+
+
+def validate_readings(rows, plot_ids=None):
+    """
+    Validate a batch of raw reading dicts.
+
+    ``plot_ids`` optionally restricts the plots the rows may reference;
+    otherwise every existing plot is accepted. Returns ``(readings, errors)``
+    where ``readings`` are unsaved ``SensorReading`` instances and
+    ``errors`` is a list of ``{"index": i, "errors": {...}}`` dicts.
+    """
+    errors = {}
+
+    def fail(index, field, message):
+        errors.setdefault(index, {})[field] = [message]
+
+    parsed = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index] = {'non_field_errors': ['Expected an object.']}
+            parsed.append(None)
+            continue
+        parsed.append((
+            _parse_plot(row.get('plot')),
+            row.get('sensor_type'),
+            _parse_value(row.get('value')),
+            row.get('timestamp'),
+            row.get('source', 'simulator'),
+        ))
+
+    # One query for every plot referenced by the batch.
+    requested = {p[0] for p in parsed if p is not None and p[0] is not None}
+    if plot_ids is not None:
+        requested &= set(plot_ids)
+    known_plots = set(FieldPlot.objects.filter(id__in=requested).values_list('id', flat=True))
+
+    readings = []
+    for index, fields in enumerate(parsed):
+        if fields is None:
+            continue
+        plot_id, sensor_type, value, raw_ts, source = fields
+
+        if plot_id is None:
+            fail(index, 'plot', 'A valid plot id is required.')
+        elif plot_id not in known_plots:
+            fail(index, 'plot', f'Invalid pk "{plot_id}" - object does not exist.')
+        if sensor_type not in SENSOR_TYPES:
+            fail(index, 'sensor_type', f'"{sensor_type}" is not a valid choice.')
+        if value is None:
+            fail(index, 'value', 'A valid finite number is required.')
+        if not isinstance(source, str) or not source or len(source) > SOURCE_MAX_LENGTH:
+            fail(index, 'source', f'A string of at most {SOURCE_MAX_LENGTH} characters is required.')
+
+        timestamp = None
+        if raw_ts is not None:
+            timestamp = _parse_timestamp(raw_ts)
+            if timestamp is None:
+                fail(index, 'timestamp', 'Datetime has wrong format.')
+
+        if index in errors:
+            continue
+        reading = SensorReading(plot_id=plot_id, sensor_type=sensor_type, value=value, source=source)
+        if timestamp is not None:
+            reading.timestamp = timestamp
+        readings.append(reading)
+
+    error_list = [{'index': index, 'errors': errors[index]} for index in sorted(errors)]
+    return readings, error_list
+
+
+def write_readings(readings):
+    """
+    Insert validated readings in as few statements as possible. Readings
+    already stored (same plot, sensor_type, timestamp and source) are
+    skipped, so a retried batch is not counted twice. Returns how many
+    were inserted.
+    """
+    return copy_rows(
+        (reading.timestamp, reading.plot_id, reading.sensor_type, reading.value, reading.source)
+        for reading in readings
+    )
+
+
+def copy_rows(rows):
+    """
+    Insert an iterable of valid ``(timestamp, plot_id, sensor_type, value,
+    source)`` tuples (aware timestamps), one transaction per
+    ``COPY_BATCH_SIZE`` rows, so that loads of any size keep a bounded
+    memory. Duplicates of stored (or compacted) readings are skipped.
+    Returns how many rows were inserted.
+    """
+    rows = iter(rows)
+    total = 0
+    while batch := list(islice(rows, COPY_BATCH_SIZE)):
+        batch = compaction.drop_compacted(batch)
+        with transaction.atomic():
+            if pgcopy.is_supported() and len(batch) >= COPY_MIN_ROWS:
+                inserted, newest = pgcopy.copy_rows(batch)
+            else:
+                inserted, newest = insert_rows(batch)
+            record_written(newest)
+        total += inserted
+    return total
+
+
+def insert_rows(rows):
+    """
+    ``INSERT .. VALUES .. ON CONFLICT DO NOTHING`` of row tuples, in
+    statements of ``BULK_BATCH_SIZE`` rows. Returns ``(inserted count,
+    inserted SensorReadings)``.
+    """
+    table = connection.ops.quote_name(SensorReading._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in pgcopy.COLUMNS)
+    adapt = connection.ops.adapt_datetimefield_value
+    inserted = []
+    with connection.cursor() as cursor:
+        for first in range(0, len(rows), BULK_BATCH_SIZE):
+            chunk = rows[first:first + BULK_BATCH_SIZE]
+            # The inserted rows are matched back to their tuple by natural key.
+            by_key = {}
+            params = []
+            for row in chunk:
+                timestamp, plot_id, sensor_type, value, source = row
+                params += [adapt(timestamp), plot_id, sensor_type, value, source]
+                by_key.setdefault((plot_id, sensor_type, adapt(timestamp), source), row)
+            values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {values} '
+                f'ON CONFLICT ({pgcopy.NATURAL_KEY}) DO NOTHING '
+                f'RETURNING id, plot_id, sensor_type, "timestamp", source',
+                params,
+            )
+            for pk, plot_id, sensor_type, timestamp, source in cursor.fetchall():
+                row = by_key[plot_id, sensor_type, adapt(timestamp), source]
+                inserted.append(SensorReading(
+                    id=pk, timestamp=row[0], plot_id=plot_id, sensor_type=sensor_type, value=row[3], source=source,
+                ))
+    return len(inserted), inserted
+
+
+def record_written(readings):
+    """
+    Bookkeeping of every write path, to be called in the inserting
+    transaction: the heartbeat table and the cached responses of the plots
+    now, the latest-value cache once the transaction has committed.
+    """
+    heartbeat.touch(readings)
+    response_cache.invalidate(*{response_cache.readings(reading.plot_id) for reading in readings})
+    transaction.on_commit(lambda: latest.update(readings))
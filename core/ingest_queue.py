@@ -0,0 +1,213 @@
+"""
+Write-behind queue of sensor readings.
+
+With ``SENSOR_INGEST_QUEUE['ENABLED']``, POST /sensor-readings/ and /bulk/
+validate the request, append the valid readings to a local SQLite file
+(WAL journal, ``synchronous=FULL``: an accepted batch survives a crash of
+the process or the machine) and answer 202 without touching PostgreSQL.
+``drain()`` -- ``python manage.py drain_ingest_queue --loop`` -- moves
+them to sensor_readings in large ``COPY`` transactions, and the detector
+then scores them as usual, from its watermark.
+
+Crash recovery: a worker claims entries for ``LEASE_SECONDS`` and deletes
+them only once their readings are committed. Entries of a worker that
+died are claimed again when the lease expires; the natural key of the
+readings makes the second write a no-op for the part already committed.
+
+Backpressure: ``stats()`` reports the entries and readings waiting and
+the age of the oldest one. Above ``MAX_PENDING`` readings the API answers
+503 with a ``Retry-After`` header, and the devices keep the readings in
+their own spool until the worker has caught up.
+
+The file is local to the machine: every API host needs its own worker.
+
+Settings (``SENSOR_INGEST_QUEUE``):
+
+    ENABLED        queue the API writes (default False)
+    PATH           SQLite file (default BASE_DIR / 'var' / 'ingest-queue.sqlite3')
+    MAX_PENDING    readings waiting above which writes are refused (default 2,000,000)
+    BATCH_SIZE     readings written per drain transaction (default 50,000)
+    LEASE_SECONDS  time before the entries of a silent worker are retried (default 300)
+    RETRY_AFTER    seconds suggested to refused clients (default 30)
+"""
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import ingest
+from .models import FieldPlot
+
+
+CONFIG = {
+    'ENABLED': False,
+    'PATH': Path(settings.BASE_DIR) / 'var' / 'ingest-queue.sqlite3',
+    'MAX_PENDING': 2_000_000,
+    'BATCH_SIZE': 50_000,
+    'LEASE_SECONDS': 300,
+    'RETRY_AFTER': 30,
+    **getattr(settings, 'SENSOR_INGEST_QUEUE', {}),
+}
+
+
+class QueueFull(Exception):
+    """More than ``MAX_PENDING`` readings are waiting."""
+
+
+def is_enabled():
+    return CONFIG['ENABLED']
+
+
+def connect():
+    path = Path(CONFIG['PATH'])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=FULL')
+    if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'entries_deleted'").fetchone() is None:
+        db.execute('BEGIN IMMEDIATE')
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.execute('COMMIT')
+    return db
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' enqueued REAL NOT NULL,'
+    ' claimed REAL,'
+    ' size INTEGER NOT NULL,'
+    ' rows TEXT NOT NULL)',
+    # Running totals, updated by the triggers in the transaction that
+    # writes the entries: checking the backlog does not scan the queue.
+    'CREATE TABLE IF NOT EXISTS totals ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+    ' entries INTEGER NOT NULL,'
+    ' readings INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO totals SELECT 1, COUNT(*), COALESCE(SUM(size), 0) FROM entries',
+    'CREATE TRIGGER IF NOT EXISTS entries_inserted AFTER INSERT ON entries BEGIN'
+    ' UPDATE totals SET entries = entries + 1, readings = readings + NEW.size; END',
+    'CREATE TRIGGER IF NOT EXISTS entries_deleted AFTER DELETE ON entries BEGIN'
+    ' UPDATE totals SET entries = entries - 1, readings = readings - OLD.size; END',
+)
+
+
+def _pending(db):
+    """``(entries, readings)`` waiting."""
+    return db.execute('SELECT entries, readings FROM totals').fetchone()
+
+
+def stats():
+    """``{'entries', 'readings', 'oldest_age'}`` of the queue (age in seconds, ``None`` when empty)."""
+    db = connect()
+    try:
+        count, size = _pending(db)
+        # Ids grow with time: the first entry is the oldest.
+        oldest = db.execute('SELECT enqueued FROM entries ORDER BY id LIMIT 1').fetchone()
+    finally:
+        db.close()
+    return {
+        'entries': count,
+        'readings': size,
+        'oldest_age': None if oldest is None else max(0.0, time.time() - oldest[0]),
+    }
+
+
+def enqueue(readings):
+    """
+    Append validated (unsaved) ``SensorReading``s as one entry. Raises
+    ``QueueFull`` when the queue is over ``MAX_PENDING`` readings.
+    """
+    rows = [
+        [reading.timestamp.isoformat(), reading.plot_id, reading.sensor_type, reading.value, reading.source]
+        for reading in readings
+    ]
+    if not rows:
+        return 0
+    db = connect()
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if _pending(db)[1] + len(rows) > CONFIG['MAX_PENDING']:
+                raise QueueFull()
+            db.execute(
+                'INSERT INTO entries (enqueued, size, rows) VALUES (?, ?, ?)',
+                (time.time(), len(rows), json.dumps(rows, separators=(',', ':'))),
+            )
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+    finally:
+        db.close()
+    return len(rows)
+
+
+def claim(db, limit):
+    """
+    Lease the oldest entries, up to about ``limit`` readings (at least one
+    entry). Returns ``[(entry id, rows)]``.
+    """
+    now = time.time()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        candidates = db.execute(
+            'SELECT id, size FROM entries WHERE claimed IS NULL OR claimed < ? ORDER BY id',
+            (now - CONFIG['LEASE_SECONDS'],),
+        )
+        ids, total = [], 0
+        for entry_id, size in candidates:
+            if ids and total + size > limit:
+                break
+            ids.append(entry_id)
+            total += size
+        entries = []
+        if ids:
+            placeholders = ', '.join('?' * len(ids))
+            db.execute(f'UPDATE entries SET claimed = ? WHERE id IN ({placeholders})', [now, *ids])
+            entries = db.execute(f'SELECT id, rows FROM entries WHERE id IN ({placeholders}) ORDER BY id', ids).fetchall()
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+    return [(entry_id, json.loads(rows)) for entry_id, rows in entries]
+
+
+def acknowledge(db, entry_ids):
+    placeholders = ', '.join('?' * len(entry_ids))
+    db.execute(f'DELETE FROM entries WHERE id IN ({placeholders})', list(entry_ids))
+
+
+def drain(batch_size=None):
+    """
+    Write queued readings to the database until the queue is empty.
+    Readings whose plot was deleted in the meantime are dropped. Returns
+    ``(written, duplicates, dropped)``.
+    """
+    batch_size = batch_size or CONFIG['BATCH_SIZE']
+    written = duplicates = dropped = 0
+    db = connect()
+    try:
+        while True:
+            entries = claim(db, batch_size)
+            if not entries:
+                break
+            rows = [row for _, entry_rows in entries for row in entry_rows]
+            plot_ids = set(FieldPlot.objects.filter(id__in={row[1] for row in rows}).values_list('id', flat=True))
+            valid = [
+                (parse_datetime(timestamp), plot_id, sensor_type, value, source)
+                for timestamp, plot_id, sensor_type, value, source in rows
+                if plot_id in plot_ids
+            ]
+            inserted = ingest.copy_rows(valid)
+            acknowledge(db, [entry_id for entry_id, _ in entries])
+            written += inserted
+            duplicates += len(valid) - inserted
+            dropped += len(rows) - len(valid)
+    finally:
+        db.close()
+    return written, duplicates, dropped
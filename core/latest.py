@@ -0,0 +1,153 @@
+"""
+Write-through cache of the latest reading of every (plot, sensor_type).
+
+The write paths call ``update()`` once their transaction has committed;
+an entry is only replaced by a newer reading, so backfilled history never
+hides the live value. Updating or deleting a reading calls ``refresh()``
+for the series it leaves and the one it joins. ``get_many()`` answers a whole fleet with one cache
+round trip. Cold entries are filled from the heartbeat table (one query
+for the heartbeats, one for the readings they point to), and series that
+have no heartbeat yet fall back to an index lookup.
+
+Settings (``SENSOR_LATEST_CACHE``):
+
+    CACHE    cache alias (default 'default'). The default local-memory
+             cache is per process: with several workers, use a shared
+             backend (Redis, Memcached) so every worker sees the writes.
+    TIMEOUT  seconds an entry is kept (default 300); bounds how stale a
+             per-process cache can get.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.fields import DateTimeField
+
+from .enumerations import SensorType
+from .models import SensorHeartbeat, SensorReading
+
+
+CONFIG = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    **getattr(settings, 'SENSOR_LATEST_CACHE', {}),
+}
+
+KEY_PREFIX = 'sensor-latest'
+
+
+def get_cache():
+    return caches[CONFIG['CACHE']]
+
+
+def cache_key(plot_id, sensor_type):
+    return f'{KEY_PREFIX}:{plot_id}:{sensor_type}'
+
+
+def _newer(entry, cached):
+    return cached is None or entry[:2] > cached[:2]
+
+
+def update(readings):
+    """Record ``readings`` (saved SensorReadings) where they are the newest of their series."""
+    latest = {}
+    for reading in readings:
+        key = cache_key(reading.plot_id, reading.sensor_type)
+        entry = (reading.timestamp, reading.pk, reading.value)
+        if key not in latest or _newer(entry, latest[key]):
+            latest[key] = entry
+    if not latest:
+        return
+    cache = get_cache()
+    cached = cache.get_many(latest)
+    fresh = {key: entry for key, entry in latest.items() if _newer(entry, cached.get(key))}
+    if fresh:
+        cache.set_many(fresh, CONFIG['TIMEOUT'])
+
+
+def lookup(plot_id, sensor_type):
+    """``(timestamp, id, value)`` of the latest reading of one series, or None."""
+    return (
+        SensorReading.objects
+        .filter(plot_id=plot_id, sensor_type=sensor_type)
+        .order_by('-timestamp', '-id')
+        .values_list('timestamp', 'id', 'value')
+        .first()
+    )
+
+
+def refresh(series):
+    """Reload the entries of ``series`` (``(plot_id, sensor_type)`` pairs) from the database."""
+    get_cache().set_many(
+        {cache_key(plot_id, sensor_type): lookup(plot_id, sensor_type) for plot_id, sensor_type in set(series)},
+        CONFIG['TIMEOUT'],
+    )
+
+
+def load(series):
+    """``{(plot_id, sensor_type): (timestamp, id, value) or None}`` from the database."""
+    wanted = set(series)
+    beats = {
+        (plot_id, sensor_type): (reading_id, last_seen)
+        for plot_id, sensor_type, reading_id, last_seen in (
+            SensorHeartbeat.objects
+            .filter(plot_id__in={plot_id for plot_id, _ in wanted})
+            .values_list('plot_id', 'sensor_type', 'last_reading_id', 'last_seen')
+        )
+        if (plot_id, sensor_type) in wanted
+    }
+    found = dict.fromkeys(wanted)
+    if beats:
+        # The timestamps let PostgreSQL prune the partitions.
+        rows = SensorReading.objects.filter(
+            id__in=[reading_id for reading_id, _ in beats.values()],
+            timestamp__in=[last_seen for _, last_seen in beats.values()],
+        ).values_list('plot_id', 'sensor_type', 'timestamp', 'id', 'value')
+        for plot_id, sensor_type, timestamp, reading_id, value in rows:
+            found[plot_id, sensor_type] = (timestamp, reading_id, value)
+
+    # Series written before the heartbeat table existed, or whose last
+    # reading has since been deleted or moved.
+    for plot_id, sensor_type in wanted:
+        if found[plot_id, sensor_type] is None:
+            found[plot_id, sensor_type] = lookup(plot_id, sensor_type)
+    return found
+
+
+def get_many(plot_ids):
+    """``{plot_id: {sensor_type: (timestamp, id, value) or None}}``."""
+    keys = {cache_key(plot_id, sensor_type): (plot_id, sensor_type)
+            for plot_id in plot_ids for sensor_type in SensorType.values}
+    cache = get_cache()
+    cached = cache.get_many(keys)
+    entries = {keys[key]: entry for key, entry in cached.items()}
+
+    missing = [series for key, series in keys.items() if key not in cached]
+    if missing:
+        loaded = load(missing)
+        # Empty series are cached too (as None) so they are not looked up again.
+        cache.set_many({cache_key(*series): entry for series, entry in loaded.items()}, CONFIG['TIMEOUT'])
+        entries.update(loaded)
+
+    result = {plot_id: {} for plot_id in plot_ids}
+    for (plot_id, sensor_type), entry in entries.items():
+        result[plot_id][sensor_type] = entry
+    return result
+
+
+_timestamp_field = DateTimeField()
+
+
+def represent(plot_id, series):
+    """API representation of one plot's entries."""
+    readings = {}
+    for sensor_type in SensorType.values:
+        entry = series.get(sensor_type)
+        if entry is None:
+            readings[sensor_type] = None
+            continue
+        timestamp, reading_id, value = entry
+        readings[sensor_type] = {
+            'id': reading_id,
+            'value': value,
+            'timestamp': _timestamp_field.to_representation(timestamp),
+        }
+    return {'plot': plot_id, 'readings': readings}
@@ -0,0 +1,206 @@
+"""
+Server-sent events of new readings and anomaly events.
+
+One tailer task per process follows sensor_readings and anomaly_events by
+primary key (``POLL_INTERVAL``), reading only the rows of the subscribed
+plots, and fans every new row out to the subscriptions of its plot. The
+rows are queried and encoded once whatever the number of clients; a
+client receives only what was committed after it connected instead of
+polling the whole day. Whichever process wrote the
+rows (API workers, the ingest queue worker, the detector) does not matter.
+
+Each subscription buffers at most ``BUFFER`` frames. A client too slow to
+keep up is sent an ``overflow`` event and disconnected, so that it reloads
+the current state (by_plot) and reconnects instead of growing the buffer.
+
+Ids are assigned at insert time but transactions commit in any order: the
+tailer only moves past the ids that are settled (core/watermarks.py), so
+a row committed after a newer one is still sent. Each poll reads until
+it has caught up, ``BATCH`` rows per query.
+
+The stream holds a connection open per client and needs an ASGI server
+(``uvicorn Anomaly_Detection_Platform.asgi:application``).
+
+Settings (``SENSOR_LIVE_STREAM``):
+
+    POLL_INTERVAL  seconds between two tails of the tables (default 1.0)
+    BUFFER         frames buffered per client (default 1000)
+    KEEPALIVE      seconds of silence before a keep-alive comment (default 15)
+    BATCH          rows read per query (default 5000)
+"""
+import asyncio
+import json
+from collections import defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Max
+
+from . import watermarks
+from .models import AnomalyEvent, ProcessingWatermark, SensorReading
+from .serializers import anomaly_event_rows, sensor_reading_rows
+
+
+CONFIG = {
+    'POLL_INTERVAL': 1.0,
+    'BUFFER': 1000,
+    'KEEPALIVE': 15.0,
+    'BATCH': 5000,
+    **getattr(settings, 'SENSOR_LIVE_STREAM', {}),
+}
+
+# event name: (model, row serializer)
+SOURCES = {
+    'reading': (SensorReading, sensor_reading_rows),
+    'anomaly': (AnomalyEvent, anomaly_event_rows),
+}
+
+
+def frame(event, row):
+    data = json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event}\ndata: {data}\n\n'
+
+
+class Subscription:
+
+    def __init__(self, plot_ids):
+        self.plot_ids = frozenset(plot_ids)
+        self.frames = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, text):
+        if len(self.frames) >= CONFIG['BUFFER']:
+            self.overflowed = True
+        else:
+            self.frames.append(text)
+        self.ready.set()
+
+    async def get(self, timeout):
+        """The frames received so far, waiting up to ``timeout`` seconds for one."""
+        if not self.frames and not self.overflowed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.clear()
+        frames = list(self.frames)
+        self.frames.clear()
+        return frames
+
+
+def _start():
+    """In-memory watermarks of the sources, at their newest rows."""
+    return {
+        event: ProcessingWatermark(
+            name=f'live:{event}', last_reading_id=model.objects.aggregate(top=Max('id'))['top'] or 0,
+        )
+        for event, (model, _) in SOURCES.items()
+    }
+
+
+def _settle(event, watermark):
+    """Highest id of the source ``event`` up to which every row is committed."""
+    model = SOURCES[event][0]
+    with transaction.atomic():
+        return watermarks.horizon(watermark, watermarks.observe(model), model)
+
+
+def _read(event, after, settled, plot_ids):
+    """
+    ``(position, rows)``: at most ``BATCH`` rows of the source ``event``
+    in ``(after, settled]`` on ``plot_ids``, and the position to read on from.
+    """
+    model, serializer = SOURCES[event]
+    batch = list(serializer.values(
+        model.objects.filter(id__gt=after, id__lte=settled, plot_id__in=plot_ids).order_by('id')[:CONFIG['BATCH']]
+    ))
+    position = batch[-1]['id'] if len(batch) == CONFIG['BATCH'] else settled
+    return position, [(event, row) for row in serializer.represent(batch)]
+
+
+class Hub:
+    """Subscriptions of this process and the task tailing the tables for them."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.by_plot = defaultdict(set)
+        self.watermarks = None
+        self.task = None
+
+    def subscribe(self, plot_ids):
+        subscription = Subscription(plot_ids)
+        self.subscriptions.add(subscription)
+        for plot_id in subscription.plot_ids:
+            self.by_plot[plot_id].add(subscription)
+        if self.task is None or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.watermarks = None
+            self.task = asyncio.create_task(self.run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+        for plot_id in subscription.plot_ids:
+            subscribers = self.by_plot.get(plot_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.by_plot[plot_id]
+
+    def publish(self, event, row):
+        subscribers = self.by_plot.get(row['plot'])
+        if subscribers:
+            text = frame(event, row)
+            for subscription in subscribers:
+                subscription.push(text)
+
+    async def poll(self):
+        """Publish the rows committed since the last poll, however many there are."""
+        if self.watermarks is None:
+            self.watermarks = await sync_to_async(_start)()
+            return
+        for event, watermark in self.watermarks.items():
+            settled = await sync_to_async(_settle)(event, watermark)
+            position = watermark.last_reading_id
+            while position < settled and self.by_plot:
+                position, rows = await sync_to_async(_read)(event, position, settled, list(self.by_plot))
+                for _, row in rows:
+                    self.publish(event, row)
+            watermark.last_reading_id = settled
+
+    async def run(self):
+        while self.subscriptions:
+            try:
+                await self.poll()
+            except DatabaseError:
+                # Database unavailable: reconnect at the next tick.
+                await sync_to_async(close_old_connections)()
+            await asyncio.sleep(CONFIG['POLL_INTERVAL'])
+
+
+hub = Hub()
+
+
+async def stream(plot_ids, hub=hub):
+    """
+    Body of an SSE response: the frames of the plots until overflow or
+    disconnect. The subscription is only taken once the body is iterated,
+    so a response that is never sent holds none.
+    """
+    subscription = None
+    try:
+        subscription = hub.subscribe(plot_ids)
+        yield 'retry: 3000\n\n'
+        while True:
+            frames = await subscription.get(CONFIG['KEEPALIVE'])
+            if frames:
+                yield ''.join(frames)
+            if subscription.overflowed:
+                yield frame('overflow', {'detail': 'Too far behind, reload and reconnect.'})
+                return
+            if not frames:
+                yield ': keepalive\n\n'
+    finally:
+        if subscription is not None:
+            hub.unsubscribe(subscription)
@@ -0,0 +1,92 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import ingest
+from core.models import FieldPlot
+
+
+def load_backfill_module():
+    """The simulators live in the standalone Generator/ scripts directory."""
+    generator_dir = str(settings.BASE_DIR / 'Generator')
+    if generator_dir not in sys.path:
+        sys.path.insert(0, generator_dir)
+    import backfill
+    return backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate historical sensor readings with the fleet simulator (fast-forward, "
+        "no sleeping) and write them to the database or to a CSV/Parquet file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plots', help="Plot ids, e.g. '1-100,250'. Defaults to every plot.")
+        parser.add_argument('--farm', type=int, help="Only the plots of this farm.")
+        parser.add_argument('--start', help="Start date (YYYY-MM-DD), inclusive.")
+        parser.add_argument('--end', help="End date (YYYY-MM-DD), exclusive.")
+        parser.add_argument('--days', type=int, default=90,
+                            help="Days to generate when --start or --end is omitted (ending today by default).")
+        parser.add_argument('--interval', type=int, default=300, help="Seconds between readings.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write to this .csv/.parquet file instead of the database.")
+
+    def handle(self, *args, **options):
+        backfill = load_backfill_module()
+
+        plots = FieldPlot.objects.all()
+        if options['farm']:
+            plots = plots.filter(farm_id=options['farm'])
+        if options['plots']:
+            plots = plots.filter(id__in=backfill.parse_plot_ids(options['plots']))
+        plot_ids = list(plots.order_by('id').values_list('id', flat=True))
+        if not plot_ids:
+            raise CommandError("No matching plots.")
+
+        days = timedelta(days=options['days'])
+        if options['start']:
+            start = self._parse_date(options['start'])
+            end = self._parse_date(options['end']) if options['end'] else start + days
+        else:
+            end = self._parse_date(options['end']) if options['end'] else timezone.now().replace(
+                hour=0, minute=0, second=0, microsecond=0)
+            start = end - days
+        if start >= end:
+            raise CommandError("--start must be before --end.")
+
+        self.stdout.write(f"Backfilling {len(plot_ids)} plots from {start} to {end} every {options['interval']}s")
+        started = time.monotonic()
+        chunks = backfill.iter_backfill(plot_ids, start, end, interval=options['interval'], seed=options['seed'])
+
+        if options['output']:
+            rows = backfill.write_file(chunks, options['output'])
+        else:
+            rows = 0
+            for chunk in chunks:
+                rows += self._write_chunk(chunk)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"{rows} readings written in {elapsed:.1f}s"))
+
+    @staticmethod
+    def _parse_date(value):
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Invalid date: {value}")
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+    @staticmethod
+    def _write_chunk(chunk):
+        return ingest.copy_rows(zip(
+            chunk['timestamp'].dt.to_pydatetime(),
+            chunk['plot'].tolist(),
+            chunk['sensor_type'].astype(str).tolist(),
+            chunk['value'].tolist(),
+            chunk['source'].astype(str).tolist(),
+        ))
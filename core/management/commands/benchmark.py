@@ -0,0 +1,74 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from core import benchmarks
+from core.enumerations import CropVariety
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with simulated farms, plots and readings, "
+        "then measure the ingest, query and detection paths (throughput and "
+        "p50/p95/p99 latency) and write a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        defaults = benchmarks.DEFAULTS
+        parser.add_argument('--scenario', action='append', choices=list(benchmarks.SCENARIOS),
+                            help="Run only this scenario (repeatable). Defaults to all of them.")
+        parser.add_argument('--farms', type=int, default=defaults['farms'])
+        parser.add_argument('--plots-per-farm', type=int, default=defaults['plots_per_farm'])
+        parser.add_argument('--hours', type=int, default=defaults['hours'], help="Hours of readings to seed.")
+        parser.add_argument('--interval', type=int, default=defaults['interval'],
+                            help="Seconds between seeded readings.")
+        parser.add_argument('--iterations', type=int, default=defaults['iterations'],
+                            help="Timed calls per scenario.")
+        parser.add_argument('--warmup', type=int, default=defaults['warmup'],
+                            help="Untimed calls before each scenario.")
+        parser.add_argument('--bulk-size', type=int, default=defaults['bulk_size'],
+                            help="Readings per bulk request.")
+        parser.add_argument('--page-size', type=int, default=defaults['page_size'])
+        parser.add_argument('--seed', type=int, default=defaults['seed'], help="Simulator seed.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the test database (it is emptied at the start of each run).")
+
+    def handle(self, *args, **options):
+        if options['farms'] < 1 or options['plots_per_farm'] < 1 or options['iterations'] < 1:
+            raise CommandError("--farms, --plots-per-farm and --iterations must be at least 1.")
+        if options['plots_per_farm'] > len(CropVariety.values):
+            raise CommandError(f"--plots-per-farm is at most {len(CropVariety.values)} (one plot per crop variety).")
+        settings = {name: options[name] for name in benchmarks.DEFAULTS}
+
+        # Never on the real data: the test runner's database, created for the run.
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if options['keepdb']:
+                call_command('flush', interactive=False, verbosity=0)
+            self.stderr.write(
+                f"Seeding {options['farms'] * options['plots_per_farm']} plots with "
+                f"{options['hours']}h of readings every {options['interval']}s"
+            )
+            report = benchmarks.run(options['scenario'], **settings)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for name, result in report['scenarios'].items():
+            latency = result.get('latency_ms', {})
+            self.stderr.write(
+                f"{name:15} {result['calls']:6} calls  {result['throughput'] or 0:>12,.1f} items/s  "
+                f"p50 {latency.get('p50', 0):8.2f} ms  p95 {latency.get('p95', 0):8.2f} ms  "
+                f"p99 {latency.get('p99', 0):8.2f} ms"
+            )
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import compaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the complete (moisture, temperature, humidity) ticks older than "
+        "--older-than days from sensor_readings into sensor_samples, one row per "
+        "tick. Readings still referenced or not yet processed stay in place. On "
+        "PostgreSQL a partition is compacted (rewritten) once it is entirely older. "
+        "Meant to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, help="Age in days of the readings to compact.")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError("--older-than must be at least 1 day.")
+        before = timezone.now() - timedelta(days=options['older_than'])
+        samples, readings = compaction.compact(before)
+        self.stdout.write(self.style.SUCCESS(
+            f"{readings} readings compacted into {samples} samples (before {before:%Y-%m-%d %H:%M})"
+        ))
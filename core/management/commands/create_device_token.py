@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core import authentication
+from core.models import FieldPlot
+from core.scopes import Scope
+
+
+class Command(BaseCommand):
+    help = (
+        "Create an ingestion token for a logger or gateway, limited to some plots "
+        "of its owner. The token is printed once; send it as 'Authorization: Device <token>'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name')
+        parser.add_argument('--owner', required=True, help="Username of the owner of the plots.")
+        parser.add_argument('--plot', type=int, action='append', required=True,
+                            help="Plot the device may write to (repeatable).")
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(username=options['owner']).first()
+        if owner is None:
+            raise CommandError(f"Unknown user {options['owner']}.")
+        scope = Scope(owner)
+        plots = list(scope.restrict(FieldPlot.objects.filter(id__in=options['plot']), plot_field=None))
+        missing = set(options['plot']) - {plot.id for plot in plots}
+        if missing:
+            raise CommandError(f"Plots not owned by {owner.username}: {', '.join(map(str, sorted(missing)))}.")
+        device, key = authentication.create_device_token(owner, options['name'], plots)
+        self.stdout.write(f"Device token {device.id} ({device.name}) for plots {sorted(options['plot'])}:")
+        self.stdout.write(key)
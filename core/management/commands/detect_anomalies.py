@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import detection
+
+
+class Command(BaseCommand):
+    help = (
+        "Score newly ingested sensor readings and create AnomalyEvents "
+        "(ANOMALY_DETECTION settings). Keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Readings scored per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new readings until interrupted.")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to wait with --loop when there is nothing to score.")
+
+    def handle(self, *args, **options):
+        config = detection.get_config()
+        while True:
+            processed, created, latest = detection.run_once(options['batch_size'], config)
+            if processed:
+                lag = (timezone.now() - latest).total_seconds()
+                self.stdout.write(f"{processed} readings scored, {created} anomalies, lag {lag:.1f}s")
+            if not options['loop']:
+                return
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import detection, ingest_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the readings accepted by the API into the write-behind queue "
+        "(SENSOR_INGEST_QUEUE) to the database, then score them. Keep it "
+        "running with --loop on every API host."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Readings written per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep draining until interrupted.")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to wait with --loop when the queue is empty.")
+        parser.add_argument('--no-detect', action='store_true',
+                            help="Leave the scoring to a separate detect_anomalies process.")
+
+    def handle(self, *args, **options):
+        config = detection.get_config()
+        while True:
+            written, duplicates, dropped = ingest_queue.drain(options['batch_size'])
+            if written or duplicates or dropped:
+                self.stdout.write(
+                    f"{written} readings written, {duplicates} duplicates, {dropped} dropped "
+                    f"({ingest_queue.stats()['readings']} queued)"
+                )
+            # The detector follows its own watermark: score what was just committed.
+            while written and not options['no_detect']:
+                processed, created, _ = detection.run_once(config=config)
+                if not processed:
+                    break
+                self.stdout.write(f"{processed} readings scored, {created} anomalies")
+            if not options['loop']:
+                return
+            if not (written or duplicates or dropped):
+                time.sleep(options['interval'])
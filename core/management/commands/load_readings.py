@@ -0,0 +1,116 @@
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import ingest
+from core.enumerations import SensorType
+from core.models import FieldPlot
+
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.parquet': 'parquet'}
+
+
+def read_chunks(path, file_format, chunk_size):
+    """DataFrames of at most ``chunk_size`` rows, read lazily from the file."""
+    if file_format == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={'sensor_type': str, 'source': str, 'timestamp': str})
+    elif file_format == 'ndjson':
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False, convert_dates=False)
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+
+
+def parse_timestamps(column):
+    """
+    Aware UTC timestamps (NaT where invalid). Strings and datetimes without
+    an offset are in the current time zone, numbers are Unix seconds.
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        return pd.to_datetime(column, unit='s', utc=True, errors='coerce')
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        return column.dt.tz_convert('UTC')
+    if not pd.api.types.is_datetime64_any_dtype(column):
+        try:
+            column = pd.to_datetime(column, format='ISO8601', errors='coerce')
+        except ValueError:
+            # Mixed offsets: parse each value like the API does.
+            column = pd.to_datetime(column.map(ingest._parse_timestamp), utc=True)
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        return column.dt.tz_convert('UTC')
+    return column.dt.tz_localize(timezone.get_current_timezone(), ambiguous='NaT', nonexistent='NaT').dt.tz_convert('UTC')
+
+
+def valid_rows(frame, plot_ids, default_source):
+    """``(rows, rejected)``: the valid rows as tuples for ``ingest.copy_rows``."""
+    plot_column = 'plot' if 'plot' in frame else 'plot_id'
+    if plot_column not in frame or 'sensor_type' not in frame or 'value' not in frame or 'timestamp' not in frame:
+        raise CommandError("Files need timestamp, plot, sensor_type and value columns.")
+
+    plots = pd.to_numeric(frame[plot_column], errors='coerce')
+    values = pd.to_numeric(frame['value'], errors='coerce')
+    timestamps = parse_timestamps(frame['timestamp'])
+    sources = frame['source'].fillna(default_source).astype(str) if 'source' in frame else None
+
+    valid = (
+        plots.isin(plot_ids)
+        & frame['sensor_type'].isin(SensorType.values)
+        & np.isfinite(values)
+        & timestamps.notna()
+    )
+    if sources is not None:
+        valid &= sources.str.len().between(1, ingest.SOURCE_MAX_LENGTH)
+
+    frame_valid = valid.to_numpy()
+    count = int(frame_valid.sum())
+    rows = zip(
+        timestamps[frame_valid].dt.to_pydatetime(),
+        plots[frame_valid].astype('int64').tolist(),
+        frame['sensor_type'][frame_valid].tolist(),
+        values[frame_valid].astype(float).tolist(),
+        sources[frame_valid].tolist() if sources is not None else [default_source] * count,
+    )
+    return rows, len(frame) - count
+
+
+class Command(BaseCommand):
+    help = (
+        "Load sensor readings from CSV, NDJSON or Parquet files (columns timestamp, plot, "
+        "sensor_type, value and optionally source) with PostgreSQL COPY. Rows with an "
+        "unknown plot, an invalid sensor type, value or timestamp are skipped and counted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--format', choices=sorted(set(FORMATS.values())),
+                            help="File format; guessed from the extension by default.")
+        parser.add_argument('--chunk-size', type=int, default=ingest.COPY_BATCH_SIZE,
+                            help="Rows read from the file at a time.")
+        parser.add_argument('--source', default='import', help="Source of the rows without one.")
+
+    def handle(self, *args, **options):
+        plot_ids = set(FieldPlot.objects.values_list('id', flat=True))
+        started = time.monotonic()
+        written = rejected = 0
+        for path in options['paths']:
+            file_format = options['format'] or FORMATS.get(Path(path).suffix.lower())
+            if file_format is None:
+                raise CommandError(f"Cannot guess the format of {path}; use --format.")
+            for frame in read_chunks(path, file_format, options['chunk_size']):
+                rows, skipped = valid_rows(frame, plot_ids, options['source'])
+                written += ingest.copy_rows(rows)
+                rejected += skipped
+            self.stdout.write(f"{path}: {written} readings written so far")
+
+        elapsed = time.monotonic() - started
+        rate = written / elapsed if elapsed else math.inf
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} readings written, {rejected} rejected, in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        ))
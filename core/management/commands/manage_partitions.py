@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-create upcoming sensor_readings and sensor_samples partitions and detach/drop the ones "
+        "older than the retention policy (SENSOR_READINGS_PARTITIONING). "
+        "Meant to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--premake', type=int, help="Future partitions to keep ready.")
+        parser.add_argument('--retention-days', type=int, help="Override RETENTION_DAYS.")
+        parser.add_argument('--detach-only', action='store_true',
+                            help="Detach expired partitions but keep them as standalone tables "
+                                 "(the anomaly events of their readings are kept).")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be done.")
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported():
+            raise CommandError("Partitioning requires PostgreSQL.")
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                raise CommandError("sensor_readings is not partitioned; run the core migrations first.")
+
+        config = partitions.get_config()
+        if options['premake'] is not None:
+            config['PREMAKE'] = options['premake']
+        retention_days = options['retention_days']
+
+        expired = [
+            partition for table in partitions.TABLES
+            for partition in partitions.expired_partitions(config=config, retention_days=retention_days, table=table)
+        ]
+        if options['dry_run']:
+            for name, start, end in expired:
+                self.stdout.write(f"Would {'detach' if options['detach_only'] else 'drop'} {name} [{start}, {end})")
+            return
+
+        for name in partitions.premake(config=config):
+            self.stdout.write(f"Partition ready: {name}")
+
+        for name in partitions.apply_retention(
+            config=config, retention_days=retention_days, drop=not options['detach_only']
+        ):
+            action = 'Detached' if options['detach_only'] else 'Dropped'
+            self.stdout.write(self.style.SUCCESS(f"{action} {name}"))
+
+        for table in partitions.TABLES:
+            with connection.cursor() as cursor:
+                stray = partitions.default_partition_rows(cursor, table)
+            if stray:
+                self.stdout.write(self.style.WARNING(
+                    f"{stray} rows are in {partitions.default_partition(table)} (outside every range partition); "
+                    "creating their range partitions (partitions.create_partition) moves them out."
+                ))
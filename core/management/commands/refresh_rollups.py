@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the sensor readings inserted since the last run into the hourly "
+        "and daily rollup tables. Run it from cron, or keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200_000,
+                            help="Reading ids processed per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep refreshing until interrupted.")
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help="Seconds between refreshes with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            buckets = rollups.refresh(batch_size=options['batch_size'])
+            watermark = rollups.get_watermark()
+            self.stdout.write(f"{buckets} hourly buckets refreshed (watermark: reading {watermark.last_reading_id})")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
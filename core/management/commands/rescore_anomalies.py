@@ -0,0 +1,69 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core import rescoring
+from core.management.commands.backfill_readings import load_backfill_module
+from core.models import FieldPlot, SensorReadingHistory
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-score historical sensor readings with the current ANOMALY_DETECTION "
+        "settings (vectorized, one process per CPU) and create the AnomalyEvents."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plots', help="Plot ids, e.g. '1-100,250'. Defaults to every plot.")
+        parser.add_argument('--farm', type=int, help="Only the plots of this farm.")
+        parser.add_argument('--start', help="Start date (YYYY-MM-DD), inclusive. Defaults to the first reading.")
+        parser.add_argument('--end', help="End date (YYYY-MM-DD), exclusive. Defaults to after the last reading.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes.")
+        parser.add_argument('--replace', action='store_true',
+                            help="Delete the events re-scoring produces in the range first (with their "
+                                 "recommendations). The heartbeat sweeper's silence events are kept.")
+
+    def handle(self, *args, **options):
+        plots = FieldPlot.objects.all()
+        if options['farm']:
+            plots = plots.filter(farm_id=options['farm'])
+        if options['plots']:
+            plots = plots.filter(id__in=load_backfill_module().parse_plot_ids(options['plots']))
+        plot_ids = list(plots.order_by('id').values_list('id', flat=True))
+        if not plot_ids:
+            raise CommandError("No matching plots.")
+
+        bounds = SensorReadingHistory.objects.filter(plot_id__in=plot_ids).aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            raise CommandError("No readings for these plots.")
+        start = self._parse_date(options['start']) if options['start'] else bounds['first']
+        end = self._parse_date(options['end']) if options['end'] else bounds['last'] + timedelta(seconds=1)
+        if start >= end:
+            raise CommandError("--start must be before --end.")
+
+        self.stdout.write(f"Re-scoring {len(plot_ids)} plots from {start} to {end} with {options['workers']} workers")
+        started = time.monotonic()
+        done = []
+
+        def progress(plot_id, events):
+            done.append(plot_id)
+            if len(done) % 100 == 0:
+                self.stdout.write(f"{len(done)}/{len(plot_ids)} plots")
+
+        events = rescoring.rescore(
+            plot_ids, start, end, replace=options['replace'], workers=options['workers'], on_plot=progress,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"{events} anomaly events emitted in {elapsed:.1f}s"))
+
+    @staticmethod
+    def _parse_date(value):
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Invalid date: {value}")
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import heartbeat
+
+
+class Command(BaseCommand):
+    help = (
+        "Report DATA_GAP / SENSOR_FAILURE anomalies for the sensors that stopped "
+        "sending readings (ANOMALY_DETECTION settings). Run it every minute from "
+        "cron, or keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping until interrupted.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between sweeps with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            events = heartbeat.sweep()
+            if events or not options['loop']:
+                self.stdout.write(f"{len(events)} silence events created")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
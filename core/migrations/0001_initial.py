@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('anomaly_type', models.CharField(choices=[('moisture_drop', 'Moisture Drop'), ('moisture_spike', 'Moisture Spike'), ('temperature_high', 'High Temperature'), ('temperature_low', 'Low Temperature'), ('humidity_high', 'High Humidity'), ('humidity_low', 'Low Humidity'), ('sensor_drift', 'Sensor Drift'), ('sensor_failure', 'Sensor Failure'), ('data_gap', 'Missing Data')], max_length=20)),
+                ('severity', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], default='medium', max_length=10)),
+                ('model_confidence', models.FloatField(help_text='Model confidence (0-1)')),
+            ],
+            options={
+                'verbose_name': 'Anomaly Event',
+                'verbose_name_plural': 'Anomaly Events',
+                'db_table': 'anomaly_events',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('recommended_action', models.CharField(max_length=50)),
+                ('explanation_text', models.TextField()),
+                ('confidence', models.CharField(max_length=20)),
+                ('anomaly_event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.anomalyevent')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FarmProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=300)),
+                ('size', models.FloatField(help_text='Size in hectares')),
+                ('crop_type', models.CharField(choices=[('cereals', 'Cereals'), ('vegetables', 'Vegetables'), ('fruits', 'Fruits')], default='vegetables', max_length=50)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Farm Profile',
+                'verbose_name_plural': 'Farm Profiles',
+                'db_table': 'farm_profiles',
+            },
+        ),
+        migrations.CreateModel(
+            name='FieldPlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('crop_variety', models.CharField(choices=[('durum_wheat', 'Durum Wheat'), ('soft_wheat', 'Soft Wheat'), ('hybrid_corn', 'Hybrid Corn'), ('sweet_corn', 'Sweet Corn'), ('basmati_rice', 'Basmati Rice'), ('winter_barley', 'Winter Barley'), ('oats', 'Oats'), ('cherry_tomato', 'Cherry Tomato'), ('round_tomato', 'Round Tomato'), ('nantes_carrot', 'Nantes Carrot'), ('romaine_lettuce', 'Romaine Lettuce'), ('oakleaf_lettuce', 'Oakleaf Lettuce'), ('diamond_zucchini', 'Diamond Zucchini'), ('black_pearl_eggplant', 'Black Pearl Eggplant'), ('red_bell_pepper', 'Red Bell Pepper'), ('cucumber', 'Cucumber'), ('valencia_orange', 'Valencia Orange'), ('golden_apple', 'Golden Apple'), ('granny_smith_apple', 'Granny Smith Apple'), ('chardonnay_grape', 'Chardonnay Grape'), ('cabernet_grape', 'Cabernet Grape'), ('cavendish_banana', 'Cavendish Banana'), ('lime', 'Lime'), ('mandarin', 'Mandarin'), ('apricot', 'Apricot'), ('peach', 'Peach')], default='cherry_tomato', max_length=50)),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.farmprofile')),
+            ],
+            options={
+                'verbose_name': 'Field Plot',
+                'verbose_name_plural': 'Field Plots',
+                'db_table': 'field_plots',
+                'ordering': ['farm'],
+            },
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='plot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot'),
+        ),
+        migrations.CreateModel(
+            name='SensorReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('value', models.FloatField()),
+                ('source', models.CharField(default='simulator', max_length=50)),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot')),
+            ],
+            options={
+                'verbose_name': 'Sensor Reading',
+                'verbose_name_plural': 'Sensor Readings',
+                'db_table': 'sensor_readings',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='sensor_reading',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.sensorreading'),
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('admin', 'Admin'), ('farmer', 'Farmer')], default='farmer', max_length=10)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='userprofile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='farmprofile',
+            constraint=models.UniqueConstraint(fields=('owner', 'location'), name='unique_farm_per_owner_location'),
+        ),
+        migrations.AddConstraint(
+            model_name='fieldplot',
+            constraint=models.UniqueConstraint(fields=('farm', 'crop_variety'), name='unique_plot_per_farm_crop'),
+        ),
+        migrations.AddConstraint(
+            model_name='anomalyevent',
+            constraint=models.UniqueConstraint(fields=('timestamp', 'plot', 'anomaly_type'), name='unique_anomaly_per_plot_time_type'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+
+COMPOSITE_INDEX = models.Index(fields=['plot', 'sensor_type', 'timestamp'], name='sensor_plot_type_ts_idx')
+
+# BRIN indexes are tiny (a few pages per million rows) and work well as long
+# as rows are appended in roughly timestamp order, which is the case for
+# live ingestion. PostgreSQL only.
+BRIN_INDEX_NAME = 'sensor_readings_ts_brin'
+
+
+def create_indexes(apps, schema_editor):
+    SensorReading = apps.get_model('core', 'SensorReading')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.add_index(SensorReading, COMPOSITE_INDEX)
+        return
+    # CONCURRENTLY: do not block ingestion while building on a large table.
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS sensor_plot_type_ts_idx '
+        'ON sensor_readings (plot_id, sensor_type, "timestamp")'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {BRIN_INDEX_NAME} '
+        'ON sensor_readings USING brin ("timestamp") WITH (pages_per_range = 32)'
+    )
+
+
+def drop_indexes(apps, schema_editor):
+    SensorReading = apps.get_model('core', 'SensorReading')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.remove_index(SensorReading, COMPOSITE_INDEX)
+        return
+    schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {BRIN_INDEX_NAME}')
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS sensor_plot_type_ts_idx')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='sensorreading', index=COMPOSITE_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,148 @@
+"""
+Convert sensor_readings into a table range-partitioned by timestamp.
+
+PostgreSQL only; other backends keep a plain table. Existing rows are
+copied into monthly (or daily, see SENSOR_READINGS_PARTITIONING) partitions
+inside the migration transaction, so run it during a maintenance window on
+large tables. Afterwards `manage.py manage_partitions` keeps future
+partitions ready and applies the retention policy.
+"""
+from datetime import datetime, time, timedelta, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+TABLE = 'sensor_readings'
+OLD_TABLE = 'sensor_readings_unpartitioned'
+
+
+def _interval():
+    return getattr(settings, 'SENSOR_READINGS_PARTITIONING', {}).get('INTERVAL', 'month')
+
+
+def _floor(moment, interval):
+    moment = moment.astimezone(timezone.utc)
+    if interval == 'day':
+        return datetime.combine(moment.date(), time.min, tzinfo=timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def _next(start, interval):
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def _index_definitions(cursor, table):
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes i "
+        "WHERE i.tablename = %s AND i.schemaname = current_schema() "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname AND c.contype = 'p')",
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _swap_table(cursor, create_sql):
+    """Rename the current table, create the new one, copy rows, restore indexes."""
+    indexes = _index_definitions(cursor, TABLE)
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+    cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey')
+    cursor.execute(f"SELECT conname FROM pg_constraint WHERE conrelid = '{OLD_TABLE}'::regclass AND contype = 'f'")
+    foreign_keys = [row[0] for row in cursor.fetchall()]
+    for name in foreign_keys:
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} DROP CONSTRAINT {name}')
+
+    create_sql(cursor)
+
+    cursor.execute(
+        f'INSERT INTO {TABLE} (id, "timestamp", plot_id, sensor_type, value, source) '
+        f'OVERRIDING SYSTEM VALUE '
+        f'SELECT id, "timestamp", plot_id, sensor_type, value, source FROM {OLD_TABLE}'
+    )
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f"GREATEST((SELECT max(id) FROM {TABLE}), 1), (SELECT max(id) IS NOT NULL FROM {TABLE}))"
+    )
+    cursor.execute(f'DROP TABLE {OLD_TABLE}')
+    for definition in indexes:
+        cursor.execute(definition)
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_plot_id_fk_field_plots_id '
+        f'FOREIGN KEY (plot_id) REFERENCES field_plots (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    interval = _interval()
+
+    def create(cursor):
+        cursor.execute(
+            f'CREATE TABLE {TABLE} ('
+            f' id bigint GENERATED BY DEFAULT AS IDENTITY,'
+            f' "timestamp" timestamp with time zone NOT NULL,'
+            f' sensor_type varchar(20) NOT NULL,'
+            f' value double precision NOT NULL,'
+            f' source varchar(50) NOT NULL,'
+            f' plot_id bigint NOT NULL,'
+            f' PRIMARY KEY (id, "timestamp")'
+            f') PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'SELECT min("timestamp"), max("timestamp") FROM {OLD_TABLE}')
+        first, last = cursor.fetchone()
+        now = datetime.now(timezone.utc)
+        start = _floor(min(first or now, now), interval)
+        end = max(last or now, now) + timedelta(days=93 if interval == 'month' else 3)
+        while start <= end:
+            stop = _next(start, interval)
+            suffix = start.strftime('%Y_%m_%d' if interval == 'day' else '%Y_%m')
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{suffix} PARTITION OF {TABLE} '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{stop.isoformat()}')"
+            )
+            start = stop
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, create)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    def create(cursor):
+        cursor.execute(
+            f'CREATE TABLE {TABLE} ('
+            f' id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,'
+            f' "timestamp" timestamp with time zone NOT NULL,'
+            f' sensor_type varchar(20) NOT NULL,'
+            f' value double precision NOT NULL,'
+            f' source varchar(50) NOT NULL,'
+            f' plot_id bigint NOT NULL'
+            f')'
+        )
+
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, create)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_sensor_reading_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='anomalyevent',
+            name='sensor_reading',
+            field=models.ForeignKey(db_constraint=False, on_delete=models.deletion.CASCADE, to='core.sensorreading'),
+        ),
+        migrations.RunPython(partition, unpartition),
+    ]
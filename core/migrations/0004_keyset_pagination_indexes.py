@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_partition_sensor_readings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='plot',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot'),
+        ),
+        migrations.AddIndex(
+            model_name='agentrecommendation',
+            index=models.Index(fields=['timestamp', 'id'], name='recommendation_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['timestamp', 'id'], name='anomaly_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['plot', 'timestamp', 'id'], name='anomaly_plot_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['plot', 'timestamp', 'id'], name='sensor_plot_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['timestamp', 'id'], name='sensor_ts_id_idx'),
+        ),
+    ]
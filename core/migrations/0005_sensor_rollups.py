@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_reading_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'processing_watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('sum', models.FloatField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('last_value', models.FloatField(null=True)),
+                ('last_timestamp', models.DateTimeField()),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot')),
+            ],
+            options={
+                'verbose_name': 'Daily Sensor Rollup',
+                'verbose_name_plural': 'Daily Sensor Rollups',
+                'db_table': 'sensor_rollups_daily',
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type', 'bucket'), name='unique_daily_rollup_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('sum', models.FloatField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('last_value', models.FloatField(null=True)),
+                ('last_timestamp', models.DateTimeField()),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot')),
+            ],
+            options={
+                'verbose_name': 'Hourly Sensor Rollup',
+                'verbose_name_plural': 'Hourly Sensor Rollups',
+                'db_table': 'sensor_rollups_hourly',
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type', 'bucket'), name='unique_hourly_rollup_bucket')],
+            },
+        ),
+    ]
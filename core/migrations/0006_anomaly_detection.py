@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_sensor_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='anomalyevent',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='DetectorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean', models.FloatField(default=0.0)),
+                ('variance', models.FloatField(default=0.0)),
+                ('median', models.FloatField(default=0.0)),
+                ('deviation', models.FloatField(default=0.0)),
+                ('cusum_high', models.FloatField(default=0.0)),
+                ('cusum_low', models.FloatField(default=0.0)),
+                ('last_timestamp', models.DateTimeField(null=True)),
+                ('active_anomaly', models.CharField(blank=True, choices=[('moisture_drop', 'Moisture Drop'), ('moisture_spike', 'Moisture Spike'), ('temperature_high', 'High Temperature'), ('temperature_low', 'Low Temperature'), ('humidity_high', 'High Humidity'), ('humidity_low', 'Low Humidity'), ('sensor_drift', 'Sensor Drift'), ('sensor_failure', 'Sensor Failure'), ('data_gap', 'Missing Data')], max_length=20)),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot')),
+            ],
+            options={
+                'db_table': 'detector_states',
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type'), name='unique_detector_state')],
+            },
+        ),
+    ]
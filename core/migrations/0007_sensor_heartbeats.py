@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_anomaly_detection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorHeartbeat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('last_seen', models.DateTimeField()),
+                ('last_reading_id', models.BigIntegerField()),
+                ('reported', models.CharField(blank=True, choices=[('moisture_drop', 'Moisture Drop'), ('moisture_spike', 'Moisture Spike'), ('temperature_high', 'High Temperature'), ('temperature_low', 'Low Temperature'), ('humidity_high', 'High Humidity'), ('humidity_low', 'Low Humidity'), ('sensor_drift', 'Sensor Drift'), ('sensor_failure', 'Sensor Failure'), ('data_gap', 'Missing Data')], max_length=20)),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot')),
+            ],
+            options={
+                'db_table': 'sensor_heartbeats',
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type'), name='unique_sensor_heartbeat')],
+            },
+        ),
+    ]
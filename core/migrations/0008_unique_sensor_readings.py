@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:18
+"""
+Unique natural key (plot, sensor_type, timestamp, source) on sensor_readings.
+
+Duplicates already stored (retried uploads) are removed first, keeping the
+oldest row of each key; anomaly events and heartbeats pointing at a
+removed row are moved to the kept one.
+"""
+from django.db import migrations, models
+
+
+KEY = 'plot_id, sensor_type, "timestamp", source'
+
+
+def remove_duplicates(apps, schema_editor):
+    kept = (
+        f'SELECT MIN(k.id) FROM sensor_readings r JOIN sensor_readings k '
+        f'ON k.plot_id = r.plot_id AND k.sensor_type = r.sensor_type '
+        f'AND k."timestamp" = r."timestamp" AND k.source = r.source'
+    )
+    duplicates = f'SELECT id FROM sensor_readings WHERE id NOT IN (SELECT MIN(id) FROM sensor_readings GROUP BY {KEY})'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE anomaly_events SET sensor_reading_id = ({kept} WHERE r.id = anomaly_events.sensor_reading_id) '
+            f'WHERE sensor_reading_id IN ({duplicates})'
+        )
+        cursor.execute(
+            f'UPDATE sensor_heartbeats SET last_reading_id = ({kept} WHERE r.id = sensor_heartbeats.last_reading_id) '
+            f'WHERE last_reading_id IN ({duplicates})'
+        )
+        cursor.execute(f'DELETE FROM sensor_readings WHERE id IN ({duplicates})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_sensor_heartbeats'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sensorreading',
+            constraint=models.UniqueConstraint(fields=('plot', 'sensor_type', 'timestamp', 'source'), name='unique_sensor_reading'),
+        ),
+    ]
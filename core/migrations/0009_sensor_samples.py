@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:24
+
+"""
+Compact sensor_samples table and the sensor_reading_history view.
+
+The view shows every sample as three readings with ids ``-(id * 4 + k)``.
+Each branch has an index on ("timestamp", that id expression), so that
+PostgreSQL can read the view in keyset order (``ORDER BY timestamp, id``)
+with a merge of index scans.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SAMPLE_COLUMNS = (('moisture', 1), ('temperature', 2), ('humidity', 3))
+
+CREATE_VIEW = 'CREATE VIEW sensor_reading_history AS SELECT id, "timestamp", plot_id, sensor_type, value, source FROM sensor_readings' + ''.join(
+    f' UNION ALL SELECT -(id * 4 + {k}), "timestamp", plot_id, CAST(\'{column}\' AS varchar(20)), {column}, source FROM sensor_samples'
+    for column, k in SAMPLE_COLUMNS
+)
+
+CREATE_INDEXES = [
+    f'CREATE INDEX sample_{column}_ts_id_idx ON sensor_samples ("timestamp", (-(id * 4 + {k})))'
+    for column, k in SAMPLE_COLUMNS
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_unique_sensor_readings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorReadingHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField()),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('value', models.FloatField()),
+                ('source', models.CharField(max_length=50)),
+            ],
+            options={
+                'db_table': 'sensor_reading_history',
+                'ordering': ['-timestamp'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SensorSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('source', models.CharField(max_length=50)),
+                ('moisture', models.FloatField()),
+                ('temperature', models.FloatField()),
+                ('humidity', models.FloatField()),
+                ('plot', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.fieldplot')),
+            ],
+            options={
+                'db_table': 'sensor_samples',
+                'constraints': [models.UniqueConstraint(fields=('plot', 'timestamp', 'source'), name='unique_sensor_sample')],
+            },
+        ),
+        migrations.RunSQL(
+            CREATE_INDEXES,
+            [f'DROP INDEX sample_{column}_ts_id_idx' for column, _ in SAMPLE_COLUMNS],
+        ),
+        migrations.RunSQL(CREATE_VIEW, 'DROP VIEW sensor_reading_history'),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_device_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingwatermark',
+            name='pending',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
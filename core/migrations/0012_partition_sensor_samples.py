@@ -0,0 +1,131 @@
+"""
+Convert sensor_samples into a table range-partitioned by timestamp, like
+sensor_readings (0003), so that the retention policy drops its expired
+partitions too.
+
+PostgreSQL only; other backends keep a plain table. The
+sensor_reading_history view is recreated on top of the new table.
+"""
+from datetime import datetime, time, timedelta, timezone
+
+from django.conf import settings
+from django.db import migrations
+
+
+TABLE = 'sensor_samples'
+OLD_TABLE = 'sensor_samples_unpartitioned'
+COLUMNS = 'id, "timestamp", source, moisture, temperature, humidity, plot_id'
+SAMPLE_COLUMNS = (('moisture', 1), ('temperature', 2), ('humidity', 3))
+
+CREATE_VIEW = 'CREATE VIEW sensor_reading_history AS SELECT id, "timestamp", plot_id, sensor_type, value, source FROM sensor_readings' + ''.join(
+    f' UNION ALL SELECT -(id * 4 + {k}), "timestamp", plot_id, CAST(\'{column}\' AS varchar(20)), {column}, source FROM sensor_samples'
+    for column, k in SAMPLE_COLUMNS
+)
+
+
+def _interval():
+    return getattr(settings, 'SENSOR_READINGS_PARTITIONING', {}).get('INTERVAL', 'month')
+
+
+def _floor(moment, interval):
+    moment = moment.astimezone(timezone.utc)
+    if interval == 'day':
+        return datetime.combine(moment.date(), time.min, tzinfo=timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def _next(start, interval):
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def _create(cursor, partitioned):
+    key = 'PRIMARY KEY (id, "timestamp")' if partitioned else 'PRIMARY KEY (id)'
+    partition_by = ' PARTITION BY RANGE ("timestamp")' if partitioned else ''
+    cursor.execute(
+        f'CREATE TABLE {TABLE} ('
+        f' id bigint GENERATED BY DEFAULT AS IDENTITY,'
+        f' "timestamp" timestamp with time zone NOT NULL,'
+        f' source varchar(50) NOT NULL,'
+        f' moisture double precision NOT NULL,'
+        f' temperature double precision NOT NULL,'
+        f' humidity double precision NOT NULL,'
+        f' plot_id bigint NOT NULL,'
+        f' {key},'
+        f' CONSTRAINT unique_sensor_sample UNIQUE (plot_id, "timestamp", source)'
+        f'){partition_by}'
+    )
+    if not partitioned:
+        return
+    interval = _interval()
+    cursor.execute(f'SELECT min("timestamp"), max("timestamp") FROM {OLD_TABLE}')
+    first, last = cursor.fetchone()
+    now = datetime.now(timezone.utc)
+    start = _floor(min(first or now, now), interval)
+    end = max(last or now, now) + timedelta(days=93 if interval == 'month' else 3)
+    while start <= end:
+        stop = _next(start, interval)
+        suffix = start.strftime('%Y_%m_%d' if interval == 'day' else '%Y_%m')
+        cursor.execute(
+            f'CREATE TABLE {TABLE}_p{suffix} PARTITION OF {TABLE} '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{stop.isoformat()}')"
+        )
+        start = stop
+    cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+
+def _swap_table(cursor, partitioned):
+    """Rename the current table, create the new one, copy rows, restore indexes and the view."""
+    cursor.execute('DROP VIEW sensor_reading_history')
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+    # Constraint and index names are per schema: free them for the new table.
+    cursor.execute(f"SELECT conname FROM pg_constraint WHERE conrelid = '{OLD_TABLE}'::regclass AND contype IN ('f', 'u')")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} DROP CONSTRAINT {name}')
+    cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey')
+    for column, _ in SAMPLE_COLUMNS:
+        cursor.execute(f'DROP INDEX sample_{column}_ts_id_idx')
+
+    _create(cursor, partitioned)
+
+    cursor.execute(f'INSERT INTO {TABLE} ({COLUMNS}) OVERRIDING SYSTEM VALUE SELECT {COLUMNS} FROM {OLD_TABLE}')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f"GREATEST((SELECT max(id) FROM {TABLE}), 1), (SELECT max(id) IS NOT NULL FROM {TABLE}))"
+    )
+    cursor.execute(f'DROP TABLE {OLD_TABLE}')
+    for column, k in SAMPLE_COLUMNS:
+        cursor.execute(f'CREATE INDEX sample_{column}_ts_id_idx ON {TABLE} ("timestamp", (-(id * 4 + {k})))')
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_plot_id_fk_field_plots_id '
+        f'FOREIGN KEY (plot_id) REFERENCES field_plots (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(CREATE_VIEW)
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_watermark_pending'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:02
+"""
+Record the hour of every updated or deleted reading in sensor_rollups_stale
+(core/rollups.py recomputes those buckets), with a trigger on
+sensor_readings. On PostgreSQL the trigger is declared on the partitioned
+table, so every partition, attached now or later, gets it.
+"""
+from django.db import migrations, models
+
+
+BUCKET_ORIGIN = '2000-01-01T00:00:00+00:00'
+
+POSTGRESQL_FUNCTION = f'''
+CREATE FUNCTION sensor_rollups_mark_stale() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO sensor_rollups_stale (plot_id, sensor_type, bucket)
+    VALUES (OLD.plot_id, OLD.sensor_type, DATE_BIN(INTERVAL '1 hour', OLD."timestamp", TIMESTAMPTZ '{BUCKET_ORIGIN}'))
+    ON CONFLICT DO NOTHING;
+    IF TG_OP = 'UPDATE' THEN
+        INSERT INTO sensor_rollups_stale (plot_id, sensor_type, bucket)
+        VALUES (NEW.plot_id, NEW.sensor_type, DATE_BIN(INTERVAL '1 hour', NEW."timestamp", TIMESTAMPTZ '{BUCKET_ORIGIN}'))
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$
+'''
+
+
+def _sqlite_insert(row):
+    return (
+        f'INSERT OR IGNORE INTO sensor_rollups_stale (plot_id, sensor_type, bucket) VALUES ({row}.plot_id, {row}.sensor_type, '
+        f'datetime((CAST(strftime(\'%s\', {row}."timestamp") AS INTEGER) / 3600) * 3600, \'unixepoch\'));'
+    )
+
+
+def create_triggers(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        if schema_editor.connection.vendor == 'postgresql':
+            cursor.execute(POSTGRESQL_FUNCTION)
+            cursor.execute(
+                'CREATE TRIGGER sensor_readings_mark_stale AFTER UPDATE OR DELETE ON sensor_readings '
+                'FOR EACH ROW EXECUTE FUNCTION sensor_rollups_mark_stale()'
+            )
+        elif schema_editor.connection.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE TRIGGER sensor_readings_deleted AFTER DELETE ON sensor_readings '
+                f'BEGIN {_sqlite_insert("OLD")} END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER sensor_readings_updated AFTER UPDATE ON sensor_readings '
+                f'BEGIN {_sqlite_insert("OLD")} {_sqlite_insert("NEW")} END'
+            )
+
+
+def drop_triggers(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        if schema_editor.connection.vendor == 'postgresql':
+            cursor.execute('DROP TRIGGER sensor_readings_mark_stale ON sensor_readings')
+            cursor.execute('DROP FUNCTION sensor_rollups_mark_stale()')
+        elif schema_editor.connection.vendor == 'sqlite':
+            cursor.execute('DROP TRIGGER sensor_readings_deleted')
+            cursor.execute('DROP TRIGGER sensor_readings_updated')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_partition_sensor_samples'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleRollupBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plot_id', models.BigIntegerField()),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Air Humidity')], max_length=20)),
+                ('bucket', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'sensor_rollups_stale',
+                'constraints': [models.UniqueConstraint(fields=('plot_id', 'sensor_type', 'bucket'), name='unique_stale_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from .enumerations import *
 from django.contrib.auth.models import User
 
@@ -42,8 +43,9 @@ class FieldPlot(models.Model):
 
 
 class SensorReading(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
-    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Covered by the composite indexes below.
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, db_index=False)
     sensor_type = models.CharField(
         max_length=20,
         choices=SensorType.choices
@@ -55,10 +57,166 @@ class SensorReading(models.Model):
         verbose_name_plural = "Sensor Readings"
         db_table = 'sensor_readings'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['plot', 'sensor_type', 'timestamp'], name='sensor_plot_type_ts_idx'),
+            models.Index(fields=['plot', 'timestamp', 'id'], name='sensor_plot_ts_id_idx'),
+            models.Index(fields=['timestamp', 'id'], name='sensor_ts_id_idx'),
+        ]
+        constraints = [
+            # Natural key: a retried upload of the same reading is ignored (see core/ingest.py).
+            models.UniqueConstraint(fields=['plot', 'sensor_type', 'timestamp', 'source'], name='unique_sensor_reading'),
+        ]
         
 
+class SensorSample(models.Model):
+    """
+    Compact storage of one tick of a plot: its three readings in one row.
+    Old readings are moved here by core/compaction.py.
+    """
+    # Covered by the unique constraint below.
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, db_index=False)
+    timestamp = models.DateTimeField()
+    source = models.CharField(max_length=50)
+    moisture = models.FloatField()
+    temperature = models.FloatField()
+    humidity = models.FloatField()
+
+    class Meta:
+        db_table = 'sensor_samples'
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'timestamp', 'source'], name='unique_sensor_sample'),
+        ]
+
+
+class SensorReadingHistory(models.Model):
+    """
+    Read-only view over sensor_readings and sensor_samples, one row per
+    sensor. Compacted readings get negative ids, see core/compaction.py.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    timestamp = models.DateTimeField()
+    plot = models.ForeignKey(FieldPlot, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    sensor_type = models.CharField(
+        max_length=20,
+        choices=SensorType.choices
+    )
+    value = models.FloatField()
+    source = models.CharField(max_length=50)
+
+    class Meta:
+        managed = False
+        db_table = 'sensor_reading_history'
+        ordering = ['-timestamp']
+
+
+class SensorRollup(models.Model):
+    """Pre-aggregated readings for one (plot, sensor_type, bucket)."""
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE)
+    sensor_type = models.CharField(
+        max_length=20,
+        choices=SensorType.choices
+    )
+    bucket = models.DateTimeField()
+    count = models.IntegerField()
+    sum = models.FloatField()
+    min = models.FloatField()
+    max = models.FloatField()
+    last_value = models.FloatField(null=True)
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+
+class HourlySensorRollup(SensorRollup):
+    class Meta:
+        verbose_name = "Hourly Sensor Rollup"
+        verbose_name_plural = "Hourly Sensor Rollups"
+        db_table = 'sensor_rollups_hourly'
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'sensor_type', 'bucket'], name='unique_hourly_rollup_bucket')
+        ]
+
+
+class DailySensorRollup(SensorRollup):
+    class Meta:
+        verbose_name = "Daily Sensor Rollup"
+        verbose_name_plural = "Daily Sensor Rollups"
+        db_table = 'sensor_rollups_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'sensor_type', 'bucket'], name='unique_daily_rollup_bucket')
+        ]
+
+
+class StaleRollupBucket(models.Model):
+    """
+    Hour of a reading updated or deleted since the last rollup refresh,
+    recorded by a trigger on sensor_readings (see core/rollups.py). No
+    foreign key: the plot may be on its way out.
+    """
+    plot_id = models.BigIntegerField()
+    sensor_type = models.CharField(max_length=20, choices=SensorType.choices)
+    bucket = models.DateTimeField()
+
+    class Meta:
+        db_table = 'sensor_rollups_stale'
+        constraints = [
+            models.UniqueConstraint(fields=['plot_id', 'sensor_type', 'bucket'], name='unique_stale_rollup_bucket')
+        ]
+
+
+class ProcessingWatermark(models.Model):
+    """Highest SensorReading id already consumed by a background job."""
+    name = models.CharField(max_length=50, unique=True)
+    last_reading_id = models.BigIntegerField(default=0)
+    # [transaction id, reading id] observations not settled yet, see core/watermarks.py.
+    pending = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'processing_watermarks'
+
+
+class DetectorState(models.Model):
+    """Online statistics of one (plot, sensor_type) series, see core/detection.py."""
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE)
+    sensor_type = models.CharField(max_length=20, choices=SensorType.choices)
+    count = models.BigIntegerField(default=0)
+    mean = models.FloatField(default=0.0)
+    variance = models.FloatField(default=0.0)
+    median = models.FloatField(default=0.0)
+    deviation = models.FloatField(default=0.0)
+    cusum_high = models.FloatField(default=0.0)
+    cusum_low = models.FloatField(default=0.0)
+    last_timestamp = models.DateTimeField(null=True)
+    active_anomaly = models.CharField(max_length=20, choices=AnomalyType.choices, blank=True)
+
+    class Meta:
+        db_table = 'detector_states'
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'sensor_type'], name='unique_detector_state'),
+        ]
+
+
+class SensorHeartbeat(models.Model):
+    """Latest reading of one (plot, sensor_type) series, see core/heartbeat.py."""
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE)
+    sensor_type = models.CharField(max_length=20, choices=SensorType.choices)
+    last_seen = models.DateTimeField()
+    last_reading_id = models.BigIntegerField()
+    # Anomaly already reported for the current silence, if any.
+    reported = models.CharField(max_length=20, choices=AnomalyType.choices, blank=True)
+
+    class Meta:
+        db_table = 'sensor_heartbeats'
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'sensor_type'], name='unique_sensor_heartbeat'),
+        ]
+
+
 class AnomalyEvent(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Time of the reading that triggered the event.
+    timestamp = models.DateTimeField(default=timezone.now)
     plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE)
     anomaly_type = models.CharField(
         max_length=20,
@@ -70,13 +228,19 @@ class AnomalyEvent(models.Model):
         default=SeverityLevel.MEDIUM
     )
     model_confidence = models.FloatField(help_text="Model confidence (0-1)")
-    sensor_reading = models.ForeignKey(SensorReading, on_delete=models.CASCADE)
+    # sensor_readings is partitioned by timestamp on PostgreSQL: the database
+    # cannot enforce a foreign key on `id` alone, the ORM still cascades.
+    sensor_reading = models.ForeignKey(SensorReading, on_delete=models.CASCADE, db_constraint=False)
 
     class Meta:
         verbose_name = "Anomaly Event"
         verbose_name_plural = "Anomaly Events"
         db_table = 'anomaly_events'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='anomaly_ts_id_idx'),
+            models.Index(fields=['plot', 'timestamp', 'id'], name='anomaly_plot_ts_id_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(fields=['timestamp', 'plot', 'anomaly_type'], name='unique_anomaly_per_plot_time_type')
         ]
@@ -94,6 +258,11 @@ class AgentRecommendation(models.Model):
         max_length=20
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='recommendation_ts_id_idx'),
+        ]
+
 
 class UserProfile(models.Model):
     ROLE_CHOICES = (
@@ -104,6 +273,25 @@ class UserProfile(models.Model):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='farmer')
 
 
+class DeviceToken(models.Model):
+    """
+    Ingestion credential of a logger or gateway, limited to some plots of
+    its owner, see core/authentication.py. Only a hash of the token is stored.
+    """
+    name = models.CharField(max_length=100)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='device_tokens')
+    plots = models.ManyToManyField(FieldPlot, related_name='device_tokens')
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'device_tokens'
+
+    def __str__(self):
+        return self.name
+
+
 
 
 
@@ -0,0 +1,218 @@
+"""
+Keyset (seek) pagination on ``(timestamp, id)``.
+
+Pages are fetched with ``WHERE (timestamp, id) < (cursor) ORDER BY
+timestamp DESC, id DESC LIMIT n``, so the cost of a page does not depend
+on how far the client has scrolled, unlike OFFSET pagination.
+
+Polling clients ask for deltas instead: ``?after=<cursor>`` (or
+``?since=<timestamp>[,<id>]``) returns only the rows after that position,
+oldest first, and a cursor to continue from. ``check_etag()`` answers an
+unchanged poll with a 304 after one aggregate over the rows it would return.
+"""
+import base64
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_str
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import response_cache
+
+
+PAGINATION_SETTINGS = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    **getattr(settings, 'KEYSET_PAGINATION', {}),
+}
+
+
+def encode_cursor(timestamp, pk):
+    raw = f'{timestamp.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(timestamp, id)`` from an opaque cursor, or ``None`` if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def delta_position(params):
+    """
+    The position given by ``?after=<cursor>`` or ``?since=<timestamp>[,<id>]``,
+    ``None`` without either. A bare ``since`` timestamp excludes its own rows.
+    """
+    if params.get('after'):
+        position = decode_cursor(params['after'])
+        if position is None:
+            raise ValidationError({'after': 'Invalid cursor.'})
+        return position
+    if params.get('since'):
+        raw_timestamp, _, raw_id = params['since'].partition(',')
+        try:
+            timestamp = parse_datetime(raw_timestamp.strip())
+            pk = int(raw_id) if raw_id else None
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise ValidationError({'since': 'Expected <ISO 8601 timestamp>[,<id>].'})
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        return timestamp, pk
+    return None
+
+
+def check_etag(request, queryset, generations=()):
+    """
+    ``(etag, response)``: a weak ETag of the request and of the rows of
+    ``queryset``, and a 304 response when the client already has it (else
+    ``None``). The tag covers the count and the lowest and highest id of
+    the rows, which every insert (late or backfilled ones included), delete
+    and compaction changes since ids only grow, and the response_cache
+    ``generations`` that updates in place start anew.
+    """
+    state = queryset.aggregate(count=Count('id'), low=Min('id'), high=Max('id'))
+    tokens = response_cache.tokens(*generations) if generations else ()
+    raw = f'{request.user.pk}|{request.get_full_path()}|{state["count"]}|{state["low"]}|{state["high"]}|{tokens}'
+    etag = f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:24]}"'
+    if etag in {tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')}:
+        return etag, Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return etag, None
+
+
+def seek(queryset, position, field='timestamp', descending=True):
+    """Rows strictly after ``position`` in ``(field, id)`` order."""
+    timestamp, pk = position
+    if descending:
+        # The redundant `<=` bound lets the planner use a plain range scan.
+        return queryset.filter(**{f'{field}__lte': timestamp}).filter(
+            Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+        )
+    return queryset.filter(**{f'{field}__gte': timestamp}).filter(
+        Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk})
+    )
+
+
+def seek_after(queryset, position, field='timestamp'):
+    """Rows after a ``delta_position()`` in ``(field, id)`` order."""
+    timestamp, pk = position
+    if pk is None:
+        return queryset.filter(**{f'{field}__gt': timestamp})
+    return seek(queryset, position, field, descending=False)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest first, ``?cursor=<opaque>&page_size=<n>``; with ``after`` or
+    ``since``, the rows after that position, oldest first.
+
+    Responses look like ``{"next": <url or null>, "results": [...]}``. In
+    delta mode ``next`` is always set: the ``after`` URL to poll next.
+    """
+    field = 'timestamp'
+    page_size = PAGINATION_SETTINGS['PAGE_SIZE']
+    max_page_size = PAGINATION_SETTINGS['MAX_PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    after_query_param = 'after'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+
+        self.delta = delta_position(request.query_params)
+        if self.delta is not None:
+            rows = list(seek_after(queryset, self.delta, self.field).order_by(self.field, 'id')[:size])
+            self.has_next = True
+            self.next_position = self.get_position(rows[-1]) if rows else self.delta
+            return rows
+
+        queryset = queryset.order_by(f'-{self.field}', '-id')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = decode_cursor(cursor)
+            if position is None:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = seek(queryset, position, self.field)
+
+        rows = list(queryset[:size + 1])
+        self.has_next = len(rows) > size
+        rows = rows[:size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return row[self.field], row['id']
+        return getattr(row, self.field), row.pk
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.delta is not None:
+            timestamp, pk = self.next_position
+            if pk is None:  # Nothing new after a bare `since`: poll the same URL.
+                return url
+            url = remove_query_param(url, 'since')
+            return replace_query_param(url, self.after_query_param, encode_cursor(timestamp, pk))
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str('The pagination cursor value.'),
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.after_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str('Only the rows after this cursor, oldest first.'),
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(f'Number of results per page (max {self.max_page_size}).'),
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,247 @@
+"""
+Range partitioning of ``sensor_readings`` and ``sensor_samples`` by
+timestamp (PostgreSQL only).
+
+Each table is declared ``PARTITION BY RANGE ("timestamp")`` with one child
+table per day or per month named ``<table>_pYYYY_MM[_DD]``, plus a
+``<table>_default`` partition catching anything outside the pre-created
+ranges. Retention is applied to both tables by detaching and dropping
+whole partitions instead of running DELETEs.
+
+Settings (``SENSOR_READINGS_PARTITIONING``):
+
+    INTERVAL        'month' (default) or 'day'
+    PREMAKE         number of future partitions to keep ready (default 3)
+    RETENTION_DAYS  drop partitions entirely older than this (default None: keep)
+"""
+import re
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, models, transaction
+
+from . import rollups
+from .models import AnomalyEvent, SensorReading, SensorSample
+
+
+TABLE = SensorReading._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+# Compacted readings (core/compaction.py), partitioned the same way.
+SAMPLES_TABLE = SensorSample._meta.db_table
+TABLES = (TABLE, SAMPLES_TABLE)
+
+DEFAULTS = {
+    'INTERVAL': 'month',
+    'PREMAKE': 3,
+    'RETENTION_DAYS': None,
+}
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_READINGS_PARTITIONING', {})}
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor == 'postgresql'
+
+
+def floor_bound(moment, interval):
+    """Start (UTC) of the partition containing ``moment``."""
+    moment = moment.astimezone(dt_timezone.utc)
+    if interval == 'day':
+        return datetime.combine(moment.date(), time.min, tzinfo=dt_timezone.utc)
+    if interval == 'month':
+        return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+    raise ValueError(f'Unsupported partition interval: {interval!r}')
+
+
+def next_bound(start, interval):
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start, interval, table=TABLE):
+    suffix = start.strftime('%Y_%m_%d' if interval == 'day' else '%Y_%m')
+    return f'{table}_p{suffix}'
+
+
+def default_partition(table=TABLE):
+    return f'{table}_default'
+
+
+def is_partitioned(cursor, table=TABLE):
+    cursor.execute(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+        [table],
+    )
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor, table=TABLE):
+    """``[(name, start, end)]`` for the range partitions (default partition excluded)."""
+    cursor.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s AND pg_table_is_visible(p.oid) "
+        "ORDER BY 1",
+        [table],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = _BOUND_RE.search(bound or '')
+        if match is None:
+            continue
+        start, end = (datetime.fromisoformat(v).astimezone(dt_timezone.utc) for v in match.groups())
+        partitions.append((name, start, end))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(cursor, start, interval, table=TABLE):
+    """
+    Create the partition starting at ``start`` if it does not exist yet.
+
+    PostgreSQL refuses to create a partition while the default partition
+    holds rows of its range: those are moved into the new partition in the
+    same transaction, with the default partition detached meanwhile.
+    """
+    end = next_bound(start, interval)
+    name = partition_name(start, interval, table)
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL", [name, default_partition(table)])
+    exists, has_default = cursor.fetchone()
+    if exists:
+        return name
+    in_range = '"timestamp" >= %s AND "timestamp" < %s'
+    stray = False
+    if has_default:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{default_partition(table)}" WHERE {in_range})', [start, end])
+        stray = cursor.fetchone()[0]
+    if not stray:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" {bounds}')
+        return name
+
+    with transaction.atomic():
+        detach_partition(cursor, default_partition(table), table=table)
+        cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" {bounds}')
+        cursor.execute(f'INSERT INTO "{name}" SELECT * FROM "{default_partition(table)}" WHERE {in_range}', [start, end])
+        cursor.execute(f'DELETE FROM "{default_partition(table)}" WHERE {in_range}', [start, end])
+        cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default_partition(table)}" DEFAULT')
+    return name
+
+
+def create_default_partition(cursor, table=TABLE):
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{default_partition(table)}" PARTITION OF "{table}" DEFAULT')
+
+
+def ensure_partitions(cursor, first, last, interval, table=TABLE):
+    """Create every partition between the ones containing ``first`` and ``last``."""
+    created = []
+    start = floor_bound(first, interval)
+    while start <= last:
+        created.append(create_partition(cursor, start, interval, table))
+        start = next_bound(start, interval)
+    return created
+
+
+def premake(now=None, config=None):
+    """Make sure the current partition and the next ``PREMAKE`` ones exist, for both tables."""
+    config = config or get_config()
+    now = now or datetime.now(dt_timezone.utc)
+    interval = config['INTERVAL']
+    last = floor_bound(now, interval)
+    for _ in range(config['PREMAKE']):
+        last = next_bound(last, interval)
+    with connection.cursor() as cursor:
+        return [name for table in TABLES for name in ensure_partitions(cursor, now, last, interval, table)]
+
+
+def expired_partitions(now=None, config=None, retention_days=None, table=TABLE):
+    """Partitions whose whole range is older than the retention window."""
+    config = config or get_config()
+    retention_days = retention_days if retention_days is not None else config['RETENTION_DAYS']
+    if retention_days is None:
+        return []
+    cutoff = (now or datetime.now(dt_timezone.utc)) - timedelta(days=retention_days)
+    with connection.cursor() as cursor:
+        return [p for p in list_partitions(cursor, table) if p[2] <= cutoff]
+
+
+def delete_dependents(start, end, table=TABLE):
+    """
+    Delete the rows that reference readings of ``[start, end)``.
+
+    Foreign keys to a partitioned table cannot be enforced by PostgreSQL
+    (they would need the partition key), so the ORM cascade is run here
+    before the partition itself goes away. Events on compacted readings
+    carry the (negative) id of the reading in sensor_reading_history.
+    """
+    if table == SAMPLES_TABLE:
+        events = AnomalyEvent.objects.filter(sensor_reading_id__lt=0, timestamp__gte=start, timestamp__lt=end)
+        return events.delete()[0]
+    deleted = 0
+    for relation in SensorReading._meta.related_objects:
+        related_model = relation.related_model
+        lookup = {
+            f'{relation.field.name}__timestamp__gte': start,
+            f'{relation.field.name}__timestamp__lt': end,
+        }
+        dependents = related_model._default_manager.filter(**lookup)
+        if relation.on_delete is models.SET_NULL:
+            deleted += dependents.update(**{relation.field.name: None})
+        else:
+            deleted += dependents.delete()[0]
+    return deleted
+
+
+def detach_partition(cursor, name, drop=False, table=TABLE):
+    """
+    Detach a partition (and optionally drop it).
+
+    A plain DETACH only touches the catalog; CONCURRENTLY is not an option
+    as long as a default partition exists.
+    """
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    if drop:
+        # A table with deferred foreign key checks still queued (rows written
+        # earlier in the transaction) cannot be dropped: run them now.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'DROP TABLE "{name}"')
+
+
+def apply_retention(now=None, config=None, retention_days=None, drop=True):
+    """
+    Detach (and drop) the expired partitions of both tables, with the
+    rollups of their range. Returns the names processed. Detached
+    partitions keep their data and the anomaly events pointing at it stay
+    too, so that attaching the table back restores both (and
+    ``rollups.mark_stale()`` its rollups).
+    """
+    processed = []
+    for table in TABLES:
+        for name, start, end in expired_partitions(now, config, retention_days, table):
+            with transaction.atomic(), connection.cursor() as cursor:
+                if drop:
+                    delete_dependents(start, end, table)
+                rollups.forget(start, end)
+                detach_partition(cursor, name, drop=drop, table=table)
+            processed.append(name)
+    return processed
+
+
+def default_partition_rows(cursor, table=TABLE):
+    name = default_partition(table)
+    cursor.execute(
+        "SELECT to_regclass(%s) IS NOT NULL", [name]
+    )
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute(f'SELECT count(*) FROM "{name}"')
+    return cursor.fetchone()[0]
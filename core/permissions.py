@@ -1,11 +1,17 @@
 from rest_framework.permissions import BasePermission
 
+from .models import DeviceToken
+from .scopes import get_scope
+
+
 class IsOwnerOrAdmin(BasePermission):
-    
+
+    def has_permission(self, request, view):
+        # Device tokens only ingest (see core/authentication.py).
+        if isinstance(request.auth, DeviceToken):
+            return view.action in getattr(view, 'device_actions', ())
+        return True
+
     def has_object_permission(self, request, view, obj):
-        # Admin a accès à tout
-        if request.user.is_superuser:
-            return True
-        
-        # Sinon, un farmer n'a accès qu'à son propre objet
-        return obj.owner == request.user
+        # Admin a accès à tout, un farmer n'a accès qu'aux objets de ses fermes
+        return get_scope(request).allows(obj)
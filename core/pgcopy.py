@@ -0,0 +1,92 @@
+"""
+``COPY FROM STDIN`` writer for sensor_readings (PostgreSQL only).
+
+A batch is encoded as CSV into an in-memory buffer and copied into a
+temporary staging table, then moved into sensor_readings with a single
+``INSERT .. SELECT``: the rows are parsed by the server in one stream
+instead of one parameter set per row. Rows already stored under the same
+natural key are skipped (``ON CONFLICT DO NOTHING``). The insert returns,
+through ``DISTINCT ON``, only the newest inserted row of every (plot,
+sensor_type) of the batch, which is all the heartbeat and latest-value
+bookkeeping needs, along with the number of inserted rows.
+
+Timestamps must be aware datetimes; they are sent as ISO 8601 with their
+UTC offset, so the session time zone plays no part.
+"""
+import csv
+import io
+
+from django.db import connection
+
+from .models import SensorReading
+
+
+TABLE = SensorReading._meta.db_table
+STAGING_TABLE = f'{TABLE}_copy'
+COLUMNS = ('timestamp', 'plot_id', 'sensor_type', 'value', 'source')
+# Unique key of sensor_readings (``unique_sensor_reading``).
+NATURAL_KEY = 'plot_id, sensor_type, "timestamp", source'
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor == 'postgresql'
+
+
+def encode(rows):
+    """CSV buffer of ``(timestamp, plot_id, sensor_type, value, source)`` tuples."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows(
+        (timestamp.isoformat(), plot_id, sensor_type, repr(float(value)), source)
+        for timestamp, plot_id, sensor_type, value, source in rows
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def _copy(cursor, sql, buffer):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):  # psycopg2
+        raw.copy_expert(sql, buffer)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def copy_rows(rows):
+    """
+    Insert ``(timestamp, plot_id, sensor_type, value, source)`` tuples.
+
+    Must run inside a transaction (the staging table is dropped on
+    commit). Returns ``(inserted count, newest inserted reading of every
+    series)``, the readings as ``SensorReading`` instances carrying their id.
+    """
+    columns = ', '.join(connection.ops.quote_name(column) for column in COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {STAGING_TABLE} ('
+            f' "timestamp" timestamp with time zone NOT NULL,'
+            f' plot_id bigint NOT NULL,'
+            f' sensor_type varchar(20) NOT NULL,'
+            f' value double precision NOT NULL,'
+            f' source varchar(50) NOT NULL'
+            f') ON COMMIT DROP'
+        )
+        _copy(cursor, f'COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)', encode(rows))
+        cursor.execute(
+            f'WITH inserted AS ('
+            f' INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {STAGING_TABLE}'
+            f' ON CONFLICT ({NATURAL_KEY}) DO NOTHING'
+            f' RETURNING id, {columns}'
+            f') '
+            f'SELECT DISTINCT ON (plot_id, sensor_type) id, {columns}, count(*) OVER () FROM inserted '
+            f'ORDER BY plot_id, sensor_type, "timestamp" DESC, id DESC'
+        )
+        rows = cursor.fetchall()
+        newest = [
+            SensorReading(id=pk, timestamp=timestamp, plot_id=plot_id,
+                          sensor_type=sensor_type, value=value, source=source)
+            for pk, timestamp, plot_id, sensor_type, value, source, _ in rows
+        ]
+        cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+    return (rows[0][-1] if rows else 0), newest
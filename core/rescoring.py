@@ -0,0 +1,242 @@
+"""
+Vectorized re-scoring of historical sensor readings.
+
+The batch counterpart of core/detection.py, used after the
+``ANOMALY_DETECTION`` thresholds change. Each plot is read in time chunks
+into pandas and scored one series at a time with column operations only:
+
+- the EWMA mean/variance and the median/deviation baselines are
+  ``ewm``/``rolling`` statistics shifted by one reading, so a reading is
+  compared with the readings before it,
+- the CUSUM is the closed form of the Lindley recursion,
+  ``S_n = C_n - min(0, min_k<=n C_k)`` over the cumulative sum ``C``,
+- events are emitted where the classification of a series changes.
+
+The streaming detector clips spikes out of its baseline and restarts its
+CUSUM after an alarm; here the median is a rolling window and a drift is
+reported once per episode, so both agree on the events that matter but
+not necessarily reading for reading.
+
+Silent sensors are not re-scored: DATA_GAP and silence SENSOR_FAILURE
+events belong to the heartbeat sweeper (core/heartbeat.py) and are kept
+by ``rescore_plot(replace=True)``.
+
+Plots are spread over a process pool; events are bulk inserted with
+``ON CONFLICT DO NOTHING`` on ``unique_anomaly_per_plot_time_type``.
+Readings are read from the ``sensor_reading_history`` view, so readings
+compacted into sensor_samples (core/compaction.py) are scored too; their
+events point at the negative id the view gives them.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+import numpy as np
+import pandas as pd
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from . import detection
+from .enumerations import AnomalyType, SensorType
+from .models import AnomalyEvent, SensorReadingHistory
+
+
+COLUMNS = ['id', 'timestamp', 'value']
+# Everything score_series() emits; SENSOR_FAILURE only for an impossible value.
+SCORED_TYPES = frozenset(
+    [anomaly_type for types in detection.DIRECTIONAL_TYPES.values() for anomaly_type in types]
+    + [AnomalyType.SENSOR_DRIFT]
+)
+CHUNK = timedelta(days=31)
+INSERT_BATCH_SIZE = 5000
+
+
+def context_size(config):
+    """Readings of history needed before a chunk for the baselines to settle."""
+    return max(config['WARMUP'], int(10 / config['ALPHA']))
+
+
+def score_series(frame, sensor_type, config, context=0):
+    """
+    Findings for one (plot, sensor_type) series sorted by timestamp.
+
+    ``frame`` has ``id``, ``timestamp`` and ``value`` columns; its first
+    ``context`` rows are history only and never produce findings. Returns
+    a DataFrame of ``id, timestamp, anomaly_type, ratio``.
+    """
+    values = frame['value'].to_numpy(dtype=float)
+    alpha, threshold = config['ALPHA'], config['Z_THRESHOLD']
+    min_std = config['MIN_STD'][sensor_type]
+    low, high = config['VALID_RANGES'][sensor_type]
+
+    valid = (values >= low) & (values <= high)
+    series = pd.Series(values[valid])
+    mean = series.ewm(alpha=alpha, adjust=False).mean().shift(1)
+    std = np.sqrt(series.ewm(alpha=alpha, adjust=False).var(bias=True)).shift(1).clip(lower=min_std)
+    median = series.rolling(max(round(2 / alpha), 3), min_periods=1).median().shift(1)
+    deviation = (series - median).abs().ewm(alpha=alpha, adjust=False).mean().shift(1)
+    robust_std = (1.4826 * deviation).clip(lower=min_std)
+
+    z = ((series - mean) / std).to_numpy()
+    robust_z = ((series - median) / robust_std).to_numpy()
+    warm = np.arange(len(series)) >= config['WARMUP']
+    strength = np.minimum(np.abs(z), np.abs(robust_z))
+    spike = warm & (z * robust_z > 0) & (strength >= threshold)
+
+    steps = np.where(warm & ~spike, z, 0.0)
+    slack, limit = config['CUSUM_SLACK'], config['CUSUM_LIMIT']
+    cusum = np.maximum(_cusum(np.where(steps != 0, steps - slack, 0.0)),
+                       _cusum(np.where(steps != 0, -steps - slack, 0.0)))
+    drift = ~spike & (cusum > limit)
+
+    below, above = detection.DIRECTIONAL_TYPES[sensor_type]
+    valid_state = np.select([spike & (z > 0), spike, drift], [above, below, AnomalyType.SENSOR_DRIFT], '')
+    valid_ratio = np.select([spike, drift], [strength / threshold, cusum / limit], 0.0)
+
+    state = np.full(len(values), AnomalyType.SENSOR_FAILURE.value, dtype=object)
+    state[valid] = valid_state
+    ratio = np.full(len(values), detection.SEVERITY_STEPS[0][0])
+    ratio[valid] = valid_ratio
+
+    previous = np.concatenate([[''], state[:-1]])
+    emitted = (state != '') & (state != previous) & (np.arange(len(values)) >= context)
+    return pd.DataFrame({
+        'id': frame['id'].to_numpy()[emitted],
+        'timestamp': frame['timestamp'].to_numpy()[emitted],
+        'anomaly_type': state[emitted],
+        'ratio': ratio[emitted],
+    })
+
+
+def _cusum(steps):
+    total = np.cumsum(steps)
+    return total - np.minimum.accumulate(np.minimum(total, 0.0))
+
+
+def load_readings(plot_id, start, end):
+    """``{sensor_type: DataFrame}`` of one plot's readings in ``[start, end)``."""
+    rows = (
+        SensorReadingHistory.objects
+        .filter(plot_id=plot_id, timestamp__gte=start, timestamp__lt=end)
+        .order_by('sensor_type', 'timestamp', 'id')
+        .values_list('sensor_type', *COLUMNS)
+    )
+    frame = pd.DataFrame.from_records(list(rows), columns=['sensor_type', *COLUMNS])
+    return {sensor_type: group[COLUMNS].reset_index(drop=True) for sensor_type, group in frame.groupby('sensor_type')}
+
+
+def load_context(plot_id, sensor_type, before, size):
+    """The last ``size`` readings of a series before ``before``, oldest first."""
+    rows = (
+        SensorReadingHistory.objects
+        .filter(plot_id=plot_id, sensor_type=sensor_type, timestamp__lt=before)
+        .order_by('-timestamp', '-id')
+        .values_list(*COLUMNS)[:size]
+    )
+    return pd.DataFrame.from_records(list(rows)[::-1], columns=COLUMNS)
+
+
+def events_from(findings, plot_id):
+    return [
+        AnomalyEvent(
+            timestamp=timestamp,
+            plot_id=plot_id,
+            anomaly_type=anomaly_type,
+            severity=detection.severity(ratio),
+            model_confidence=detection.confidence(ratio),
+            sensor_reading_id=reading_id,
+        )
+        for reading_id, timestamp, anomaly_type, ratio in zip(
+            findings['id'].tolist(),
+            pd.to_datetime(findings['timestamp'], utc=True).dt.to_pydatetime(),
+            findings['anomaly_type'].tolist(),
+            findings['ratio'].tolist(),
+        )
+    ]
+
+
+def replaceable_events(plot_id, start, end):
+    """
+    The plot's events of ``[start, end)`` that re-scoring produces. The
+    sweeper's SENSOR_FAILURE of a silent sensor is stamped after its last
+    reading, an impossible value's at the reading itself.
+    """
+    at_reading = Exists(SensorReadingHistory.objects.filter(id=OuterRef('sensor_reading_id'), timestamp=OuterRef('timestamp')))
+    return AnomalyEvent.objects.filter(plot_id=plot_id, timestamp__gte=start, timestamp__lt=end).filter(
+        Q(anomaly_type__in=SCORED_TYPES) | Q(at_reading, anomaly_type=AnomalyType.SENSOR_FAILURE)
+    )
+
+
+def rescore_plot(plot_id, start, end, config=None, replace=False, chunk=CHUNK):
+    """
+    Re-score one plot's readings of ``[start, end)``. With ``replace`` the
+    events re-scoring produces in the range are deleted first (their
+    recommendations go with them), in the transaction that inserts the new
+    ones. Returns the number of events emitted.
+    """
+    config = config or detection.get_config()
+    if not replace:
+        return _score_plot(plot_id, start, end, config, chunk)
+    with transaction.atomic():
+        replaceable_events(plot_id, start, end).delete()
+        return _score_plot(plot_id, start, end, config, chunk)
+
+
+def _score_plot(plot_id, start, end, config, chunk):
+    size = context_size(config)
+    history = {
+        sensor_type: load_context(plot_id, sensor_type, start, size)
+        for sensor_type in SensorType.values
+    }
+    emitted = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + chunk, end)
+        events = []
+        for sensor_type, frame in load_readings(plot_id, chunk_start, chunk_end).items():
+            context = history[sensor_type]
+            if len(context):
+                frame = pd.concat([context, frame], ignore_index=True)
+            findings = score_series(frame, sensor_type, config, context=len(context))
+            events.extend(events_from(findings, plot_id))
+            history[sensor_type] = frame.iloc[-size:].reset_index(drop=True)
+        with transaction.atomic():
+            AnomalyEvent.objects.bulk_create(events, batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True)
+        emitted += len(events)
+        chunk_start = chunk_end
+    return emitted
+
+
+def _init_worker():
+    django.setup()
+
+
+def _rescore_plot_task(args):
+    return args[0], rescore_plot(*args)
+
+
+def rescore(plot_ids, start, end, config=None, replace=False, workers=None, on_plot=None):
+    """
+    Re-score ``plot_ids`` over ``[start, end)`` with ``workers`` processes
+    (one per CPU by default; 1 runs in this process). ``on_plot(plot_id,
+    events)`` is called as plots complete. Returns the number of events.
+    """
+    config = config or detection.get_config()
+    tasks = [(plot_id, start, end, config, replace) for plot_id in plot_ids]
+    if workers == 1 or len(tasks) <= 1:
+        results = map(_rescore_plot_task, tasks)
+        return _collect(results, on_plot)
+
+    # Forked workers must not share the parent's database connection.
+    connections.close_all()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        return _collect(pool.map(_rescore_plot_task, tasks), on_plot)
+
+
+def _collect(results, on_plot):
+    total = 0
+    for plot_id, events in results:
+        total += events
+        if on_plot is not None:
+            on_plot(plot_id, events)
+    return total
@@ -0,0 +1,158 @@
+"""
+Cache of read responses, per user scope, invalidated by writes.
+
+An entry is keyed by the scope (``admin`` is shared by every admin, other
+users have their own), the path and the query string, and is stored with
+the *generations* of the data it was computed from:
+
+- ``plots``: farms and plots (farm list, plot list, scopes),
+- ``readings:<plot id>``: the readings of one plot,
+- ``anomalies``: anomaly events saved through the ORM (the list's ETag;
+  inserted and deleted events change its row count and ids anyway).
+
+Writes replace the generation tokens they touch (``invalidate()``), so a
+cached entry is used only while every generation it depends on is
+unchanged; one ``get_many`` fetches the entry and its generations. The
+bulk write paths of core/ingest.py invalidate explicitly, ORM writes go
+through the receivers below. Reading deletions are left to the views: a
+``post_delete`` receiver on readings would make every plot deletion load
+the readings it cascades to.
+
+Closed time ranges (a past day of by_plot) are kept ``CLOSED_TIMEOUT``
+seconds, the others ``TIMEOUT``: late readings invalidate them anyway,
+the timeouts only bound what a cache shared by fewer processes than write
+to the database can miss (the local-memory backend is per process, the
+file-based one per host).
+
+Settings (``RESPONSE_CACHE``):
+
+    CACHE           cache alias (default 'default')
+    TIMEOUT         seconds an entry of an open range is kept (default 30)
+    CLOSED_TIMEOUT  seconds an entry of a closed range is kept (default 3600)
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import AnomalyEvent, FarmProfile, FieldPlot, SensorReading
+from .scopes import get_scope
+
+
+CONFIG = {
+    'CACHE': 'default',
+    'TIMEOUT': 30,
+    'CLOSED_TIMEOUT': 3600,
+    **getattr(settings, 'RESPONSE_CACHE', {}),
+}
+
+KEY_PREFIX = 'response'
+# Headers stored and replayed with the cached body.
+HEADERS = ('ETag', 'X-Next-Cursor')
+
+
+def get_cache():
+    return caches[CONFIG['CACHE']]
+
+
+def generation_key(name):
+    return f'{KEY_PREFIX}:generation:{name}'
+
+
+ANOMALIES = 'anomalies'
+
+
+def readings(plot_id):
+    """Generation of the readings of a plot."""
+    return f'readings:{plot_id}'
+
+
+def entry_key(request):
+    scope = get_scope(request)
+    owner = 'admin' if scope.is_admin else f'user-{request.user.pk}'
+    digest = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return f'{KEY_PREFIX}:{owner}:{digest}'
+
+
+def invalidate(*names):
+    """
+    Start new generations of ``names``: now, for the reads of the writing
+    transaction, and again once it commits, for the entries that other
+    requests computed from the data as it was before the commit.
+    """
+    def replace():
+        get_cache().set_many({generation_key(name): uuid.uuid4().hex for name in names}, None)
+    replace()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(replace)
+
+
+def current_generations(cache, names, found):
+    """Current token of every generation, starting the missing ones."""
+    tokens = []
+    for name in names:
+        key = generation_key(name)
+        token = found.get(key)
+        if token is None:
+            # Never seen, or evicted: a fresh token matches no stored entry.
+            cache.add(key, uuid.uuid4().hex, None)
+            token = cache.get(key)
+        tokens.append(token)
+    return tuple(tokens)
+
+
+def tokens(*names):
+    """Current tokens of the ``names`` generations (for ETags)."""
+    cache = get_cache()
+    return current_generations(cache, names, cache.get_many([generation_key(name) for name in names]))
+
+
+def cached(request, dependencies, compute, closed=False):
+    """
+    The response of ``compute()`` for ``request``, from the cache while
+    the ``dependencies`` generations are unchanged. Only 200 responses are
+    stored; ``If-None-Match`` is honoured on hits.
+    """
+    cache = get_cache()
+    key = entry_key(request)
+    found = cache.get_many([key, *(generation_key(name) for name in dependencies)])
+    generations = current_generations(cache, dependencies, found)
+
+    entry = found.get(key)
+    if entry is not None and entry[0] == generations:
+        _, data, headers = entry
+        etag = headers.get('ETag')
+        if etag and etag in {tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')}:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers=headers)
+
+    response = compute()
+    if response.status_code == status.HTTP_200_OK:
+        headers = {name: response[name] for name in HEADERS if response.has_header(name)}
+        timeout = CONFIG['CLOSED_TIMEOUT'] if closed else CONFIG['TIMEOUT']
+        cache.set(key, (generations, response.data, headers), timeout)
+    return response
+
+
+@receiver(post_save, sender=FarmProfile)
+@receiver(post_delete, sender=FarmProfile)
+@receiver(post_save, sender=FieldPlot)
+@receiver(post_delete, sender=FieldPlot)
+def _structure_changed(sender, **kwargs):
+    invalidate('plots')
+
+
+@receiver(post_save, sender=SensorReading)
+def _reading_saved(sender, instance, **kwargs):
+    invalidate(readings(instance.plot_id))
+
+
+@receiver(post_save, sender=AnomalyEvent)
+def _anomaly_saved(sender, **kwargs):
+    invalidate(ANOMALIES)
@@ -0,0 +1,274 @@
+"""
+Incrementally maintained hourly and daily rollups of sensor readings.
+
+``refresh()`` reads the readings inserted since the ``rollups`` watermark
+(a range scan on the primary key), finds the (plot, sensor_type, hour)
+buckets they fall into, recomputes only those buckets from the raw table
+and upserts them; the touched days are then recomputed from the hourly
+rollup. Late readings simply touch an older bucket again.
+
+Readings updated or deleted, by the API, a bulk ``QuerySet`` write or the
+cascade of a plot deletion, are below the watermark: a trigger on
+sensor_readings (migration 0013) records the hours they leave and enter in
+``StaleRollupBucket``, and the next ``refresh()`` recomputes those buckets
+too (a bucket left without readings is deleted). Dropping or detaching
+partitions fires no trigger: ``partitions.apply_retention()`` deletes the
+rollups of the range itself, and ``mark_stale()`` re-rolls a range after
+a partition is attached back.
+
+``aggregate()`` answers ``/aggregate/`` requests from the daily or hourly
+table when the bucket and range line up with it and every reading of the
+range has been rolled up and none of its buckets is stale; anything else
+goes to the raw table. The
+watermark only moves past ids that no in-flight transaction can still
+commit (core/watermarks.py): a reading committed late is above it, so
+its range is not fresh until the next refresh has rolled it up.
+Buckets and raw aggregates are computed from the ``sensor_reading_history``
+view, so readings moved to sensor_samples by compaction still count.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+from . import watermarks
+from .aggregation import DateBin, Last, aggregate_readings
+from .models import (
+    DailySensorRollup, HourlySensorRollup, ProcessingWatermark, SensorReading, SensorReadingHistory, StaleRollupBucket,
+)
+
+
+WATERMARK = 'rollups'
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+KEYS_PER_QUERY = 500
+
+ROLLUP_FIELDS = ['count', 'sum', 'min', 'max', 'last_value', 'last_timestamp']
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _bucket_filter(keys, stride, field):
+    condition = Q()
+    for plot_id, sensor_type, bucket in keys:
+        condition |= Q(plot_id=plot_id, sensor_type=sensor_type,
+                       **{f'{field}__gte': bucket, f'{field}__lt': bucket + stride})
+    return condition
+
+
+def _upsert(model, rows, keys, stride):
+    """Store ``rows`` and delete the buckets of ``keys`` left without any."""
+    model.objects.bulk_create(
+        [model(**row) for row in rows],
+        update_conflicts=True,
+        unique_fields=['plot', 'sensor_type', 'bucket'],
+        update_fields=ROLLUP_FIELDS,
+    )
+    present = {(row['plot_id'], row['sensor_type'], row['bucket']) for row in rows}
+    empty = [key for key in keys if key not in present]
+    if empty:
+        model.objects.filter(_bucket_filter(empty, stride, 'bucket')).delete()
+
+
+def rollup_hours(keys):
+    """Recompute the given (plot_id, sensor_type, hour) buckets from raw readings."""
+    for chunk in _chunks(keys, KEYS_PER_QUERY):
+        rows = (
+            SensorReadingHistory.objects
+            .filter(_bucket_filter(chunk, HOUR, 'timestamp'))
+            .annotate(bucket=DateBin(F('timestamp'), HOUR))
+            .values('plot_id', 'sensor_type', 'bucket')
+            .annotate(
+                count=Count('id'),
+                sum=Sum('value'),
+                min=Min('value'),
+                max=Max('value'),
+                last_value=Last('value', F('timestamp')),
+                last_timestamp=Max('timestamp'),
+            )
+            .order_by()
+        )
+        _upsert(HourlySensorRollup, list(rows), chunk, HOUR)
+
+
+def rollup_days(keys):
+    """Recompute the given (plot_id, sensor_type, day) buckets from the hourly rollup."""
+    for chunk in _chunks(keys, KEYS_PER_QUERY):
+        rows = (
+            HourlySensorRollup.objects
+            .filter(_bucket_filter(chunk, DAY, 'bucket'))
+            .annotate(day=DateBin(F('bucket'), DAY))
+            .values('plot_id', 'sensor_type', 'day')
+            .annotate(
+                total=Sum('count'),
+                total_sum=Sum('sum'),
+                lowest=Min('min'),
+                highest=Max('max'),
+                last=Last('last_value', F('last_timestamp')),
+                latest=Max('last_timestamp'),
+            )
+            .order_by()
+        )
+        _upsert(DailySensorRollup, [
+            {
+                'plot_id': row['plot_id'],
+                'sensor_type': row['sensor_type'],
+                'bucket': row['day'],
+                'count': row['total'],
+                'sum': row['total_sum'],
+                'min': row['lowest'],
+                'max': row['highest'],
+                'last_value': row['last'],
+                'last_timestamp': row['latest'],
+            }
+            for row in rows
+        ], chunk, DAY)
+
+
+def get_watermark(name=WATERMARK):
+    watermark, _ = ProcessingWatermark.objects.get_or_create(name=name)
+    return watermark
+
+
+def refresh(batch_size=200_000):
+    """
+    Roll up the readings inserted since the last refresh, at most
+    ``batch_size`` ids at a time and only up to the last settled id (see
+    core/watermarks.py), and the stale buckets, ``batch_size`` at a time.
+    Returns the number of hourly buckets recomputed.
+    """
+    get_watermark()
+    refreshed = 0
+    while True:
+        with transaction.atomic():
+            observation = watermarks.observe()
+            watermark = ProcessingWatermark.objects.select_for_update().get(name=WATERMARK)
+            low = watermark.last_reading_id
+            high = max(low, min(watermarks.horizon(watermark, observation), low + batch_size))
+            stale = list(
+                StaleRollupBucket.objects.order_by('id').values_list('id', 'plot_id', 'sensor_type', 'bucket')[:batch_size]
+            )
+            if high == low and not stale:
+                watermark.save(update_fields=['pending', 'updated_at'])
+                return refreshed
+
+            hours = set(
+                SensorReading.objects
+                .filter(id__gt=low, id__lte=high)
+                .annotate(bucket=DateBin(F('timestamp'), HOUR))
+                .values_list('plot_id', 'sensor_type', 'bucket')
+                .order_by()
+                .distinct()
+            )
+            hours.update((plot_id, sensor_type, hour) for _, plot_id, sensor_type, hour in stale)
+            rollup_hours(hours)
+            rollup_days({
+                (plot_id, sensor_type, bucket.replace(hour=0, minute=0, second=0, microsecond=0))
+                for plot_id, sensor_type, bucket in hours
+            })
+
+            # Buckets marked stale after the read above stay for the next call.
+            for chunk in _chunks([pk for pk, _, _, _ in stale], KEYS_PER_QUERY):
+                StaleRollupBucket.objects.filter(id__in=chunk).delete()
+
+            watermark.last_reading_id = high
+            watermark.save(update_fields=['last_reading_id', 'pending', 'updated_at'])
+            refreshed += len(hours)
+
+
+def mark_stale(start, end):
+    """
+    Mark the buckets of every reading of ``[start, end)`` stale, for the
+    next ``refresh()`` (after attaching a detached partition back).
+    """
+    hours = (
+        SensorReadingHistory.objects
+        .filter(timestamp__gte=start, timestamp__lt=end)
+        .annotate(hour=DateBin(F('timestamp'), HOUR))
+        .values_list('plot_id', 'sensor_type', 'hour')
+        .order_by()
+        .distinct()
+    )
+    StaleRollupBucket.objects.bulk_create(
+        [StaleRollupBucket(plot_id=plot_id, sensor_type=sensor_type, bucket=hour) for plot_id, sensor_type, hour in hours],
+        ignore_conflicts=True,
+    )
+
+
+def forget(start, end):
+    """Delete the rollups of ``[start, end)`` (both ends on day boundaries)."""
+    for model in (HourlySensorRollup, DailySensorRollup):
+        model.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+
+
+def is_fresh(plot_ids, start, end):
+    """True when every reading of the range is already rolled up and no bucket of it is stale."""
+    watermark = ProcessingWatermark.objects.filter(name=WATERMARK).values_list('last_reading_id', flat=True).first()
+    if watermark is None:
+        return False
+    return not (
+        SensorReading.objects.filter(
+            id__gt=watermark, plot_id__in=plot_ids, timestamp__gte=start, timestamp__lt=end
+        ).exists()
+        or StaleRollupBucket.objects.filter(plot_id__in=plot_ids, bucket__gte=start, bucket__lt=end).exists()
+    )
+
+
+def _aligned(moment, stride):
+    return int(moment.timestamp()) % int(stride.total_seconds()) == 0
+
+
+def rollup_for(stride, start, end):
+    """The coarsest rollup model that can answer this bucket and range, or ``None``."""
+    for model, size in ((DailySensorRollup, DAY), (HourlySensorRollup, HOUR)):
+        if stride % size == timedelta(0) and _aligned(start, size) and _aligned(end, size):
+            return model
+    return None
+
+
+def aggregate_rollup(model, plot_ids, sensor_types, stride, start, end):
+    """Same rows as ``aggregation.aggregate_readings`` computed from a rollup table."""
+    return (
+        model.objects
+        .filter(plot_id__in=plot_ids, sensor_type__in=sensor_types, bucket__gte=start, bucket__lt=end)
+        .annotate(group=DateBin(F('bucket'), stride))
+        .values('plot', 'sensor_type', 'group')
+        .annotate(
+            total=Sum('count'),
+            lowest=Min('min'),
+            highest=Max('max'),
+            total_sum=Sum('sum'),
+            last=Last('last_value', F('last_timestamp')),
+        )
+        .order_by('plot', 'sensor_type', 'group')
+    )
+
+
+def aggregate(plot_ids, sensor_types, stride, start, end):
+    """
+    ``(rows, source)`` where ``source`` is ``'daily'``, ``'hourly'`` or
+    ``'raw'`` depending on the table the rows were computed from.
+    """
+    model = rollup_for(stride, start, end)
+    if model is not None and is_fresh(plot_ids, start, end):
+        rows = [
+            {
+                'plot': row['plot'],
+                'sensor_type': row['sensor_type'],
+                'bucket': row['group'],
+                'count': row['total'],
+                'min': row['lowest'],
+                'max': row['highest'],
+                'avg': row['total_sum'] / row['total'] if row['total'] else None,
+                'last': row['last'],
+            }
+            for row in aggregate_rollup(model, plot_ids, sensor_types, stride, start, end)
+        ]
+        return rows, 'daily' if model is DailySensorRollup else 'hourly'
+
+    queryset = SensorReadingHistory.objects.filter(plot_id__in=plot_ids, sensor_type__in=sensor_types)
+    return list(aggregate_readings(queryset, stride, start, end)), 'raw'
@@ -0,0 +1,92 @@
+"""
+What a user may see: every farm and plot (admins) or those of their own farms.
+
+The scope is resolved once per request and shared by the permission
+checks and the querysets of every ViewSet: at most one query for the
+role, one for the user's plot ids (one more for farm ids on the farm
+endpoints). Querysets are then filtered on ``plot_id IN (...)``, which
+needs no join and uses the plot-leading indexes, and object permissions
+are set lookups instead of walking ``plot -> farm -> owner``.
+"""
+from functools import cached_property
+
+from .models import AgentRecommendation, FarmProfile, FieldPlot, UserProfile
+
+
+class Scope:
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def resolved(cls, user, is_admin, farm_ids, plot_ids):
+        """A scope whose role and ids are already known (see core/authentication.py)."""
+        scope = cls(user)
+        scope.__dict__.update(is_admin=is_admin, farm_ids=farm_ids, plot_ids=plot_ids)
+        return scope
+
+    @cached_property
+    def is_admin(self):
+        if not self.user.is_authenticated:
+            return False
+        if self.user.is_superuser:
+            return True
+        role = UserProfile.objects.filter(user_id=self.user.pk).values_list('role', flat=True).first()
+        return role == 'admin'
+
+    @cached_property
+    def farm_ids(self):
+        """Ids of the user's farms, ``None`` for an admin (no restriction)."""
+        if self.is_admin:
+            return None
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(FarmProfile.objects.filter(owner_id=self.user.pk).values_list('id', flat=True))
+
+    @cached_property
+    def plot_ids(self):
+        """Ids of the plots of the user's farms, ``None`` for an admin."""
+        if self.is_admin:
+            return None
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(FieldPlot.objects.filter(farm__owner_id=self.user.pk).values_list('id', flat=True))
+
+    def restrict(self, queryset, plot_field='plot'):
+        """``queryset`` limited to the plots in scope (``plot_field`` leads to the plot)."""
+        if self.plot_ids is None:
+            return queryset
+        field = 'id' if plot_field is None else f'{plot_field}_id'
+        return queryset.filter(**{f'{field}__in': self.plot_ids})
+
+    def restrict_farms(self, queryset):
+        if self.farm_ids is None:
+            return queryset
+        return queryset.filter(id__in=self.farm_ids)
+
+    def allows_farm(self, farm_id):
+        return self.farm_ids is None or farm_id in self.farm_ids
+
+    def allows_plot(self, plot_id):
+        return self.plot_ids is None or plot_id in self.plot_ids
+
+    def allows(self, obj):
+        """Object-level check for the core models, without extra queries."""
+        if self.is_admin:
+            return True
+        if isinstance(obj, FarmProfile):
+            return obj.id in self.farm_ids
+        if isinstance(obj, FieldPlot):
+            return obj.id in self.plot_ids
+        if isinstance(obj, AgentRecommendation):
+            return obj.anomaly_event.plot_id in self.plot_ids
+        plot_id = getattr(obj, 'plot_id', None)
+        return plot_id is not None and plot_id in self.plot_ids
+
+
+def get_scope(request):
+    """The scope of ``request.user``, resolved once per request."""
+    scope = getattr(request, '_scope', None)
+    if scope is None or scope.user is not request.user:
+        scope = request._scope = Scope(request.user)
+    return scope
@@ -1,4 +1,8 @@
-from rest_framework import serializers
+from functools import cached_property
+
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import *
 
 
@@ -17,6 +21,18 @@ class SensorReadingSerializer(serializers.ModelSerializer):
         model = SensorReading
         fields = '__all__'
 
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # The unique natural key does not cover readings compacted into
+        # sensor_samples (core/compaction.py).
+        tick = {
+            name: attrs[name] if name in attrs else getattr(self.instance, name, SensorReading._meta.get_field(name).get_default())
+            for name in ('plot', 'timestamp', 'source')
+        }
+        if tick['plot'] is not None and tick['timestamp'] is not None and SensorSample.objects.filter(**tick).exists():
+            raise serializers.ValidationError('This reading is already stored (compacted).', code='unique')
+        return attrs
+
 class AnomalyEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnomalyEvent
@@ -27,3 +43,70 @@ class AgentRecommendationSerializer(serializers.ModelSerializer):
         model = AgentRecommendation
         fields = '__all__'
 
+
+def _identity(value):
+    return value
+
+
+class RowSerializer:
+    """
+    Read-only fast path of a ModelSerializer for large listings.
+
+    Rows are fetched with ``.values()`` (no model instances) and turned
+    into the same dicts the ModelSerializer would produce, with one plain
+    conversion per column instead of a field object call per value.
+    Columns without a fast conversion use the field's own
+    ``to_representation``.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def columns(self):
+        """``[(name, attname, field)]`` in the ModelSerializer's field order."""
+        opts = self.serializer_class.Meta.model._meta
+        return [
+            (name, opts.get_field(field.source).attname, field)
+            for name, field in self.serializer_class().fields.items()
+        ]
+
+    def values(self, queryset):
+        return queryset.values(*[attname for _, attname, _ in self.columns])
+
+    def converter(self, field):
+        if isinstance(field, serializers.DateTimeField):
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+                return field.to_representation
+
+            def datetime_to_representation(value):
+                if timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return datetime_to_representation
+        if type(field) is serializers.FloatField:
+            return float
+        if type(field) is serializers.IntegerField:
+            return int
+        # Choices are stored as their string values; related fields as pks.
+        if type(field) in (serializers.CharField, serializers.ChoiceField, serializers.PrimaryKeyRelatedField):
+            return _identity
+        return field.to_representation
+
+    def represent(self, rows):
+        """The representation of ``values()`` rows, identical to ``serializer_class(many=True).data``."""
+        columns = [(name, attname, self.converter(field)) for name, attname, field in self.columns]
+        return [
+            {
+                name: None if row[attname] is None else convert(row[attname])
+                for name, attname, convert in columns
+            }
+            for row in rows
+        ]
+
+
+sensor_reading_rows = RowSerializer(SensorReadingSerializer)
+anomaly_event_rows = RowSerializer(AnomalyEventSerializer)
@@ -1,3 +1,1642 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import skipUnless
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+import pandas as pd
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (
+    authentication, benchmarks, compaction, detection, export, heartbeat, ingest, ingest_queue, latest, live,
+    partitions, rescoring, response_cache, rollups, watermarks,
+)
+from .aggregation import aggregate_readings
+from .filters import day_range
+from .pagination import KeysetPagination, encode_cursor
+from .models import (
+    AnomalyEvent, DailySensorRollup, DetectorState, FarmProfile, FieldPlot, HourlySensorRollup, ProcessingWatermark,
+    SensorHeartbeat, SensorReading, SensorReadingHistory, SensorSample, StaleRollupBucket, UserProfile,
+)
+from .serializers import AnomalyEventSerializer, SensorReadingSerializer, anomaly_event_rows, sensor_reading_rows
+
+# The generator scripts run from Generator/ and import each other by module name.
+sys.path.insert(0, str(settings.BASE_DIR / 'Generator'))
+import HttpGenerator  # noqa: E402
+import backfill  # noqa: E402
+import fleet_simulator  # noqa: E402
+
+
+class SensorReadingIndexTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        UserProfile.objects.create(user=self.user, role='admin')
+        farm = FarmProfile.objects.create(owner=self.user, location='Test farm', size=1.0)
+        self.plot = FieldPlot.objects.create(farm=farm)
+        self.client.force_authenticate(self.user)
+
+    def test_by_plot_returns_readings_of_the_requested_day(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=60.0, timestamp=yesterday)
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=61.0)
+
+        response = self.client.get(f'/api/sensor-readings/plot/{self.plot.id}/')
+        self.assertEqual([r['value'] for r in response.json()], [61.0])
+
+        day = timezone.localtime(yesterday).date().isoformat()
+        response = self.client.get(f'/api/sensor-readings/plot/{self.plot.id}/', {'date': day})
+        self.assertEqual([r['value'] for r in response.json()], [60.0])
+
+    def test_by_plot_sensor_type_filter(self):
+        for sensor_type in ('moisture', 'humidity', 'temperature'):
+            SensorReading.objects.create(plot=self.plot, sensor_type=sensor_type, value=1.0)
+        url = f'/api/sensor-readings/plot/{self.plot.id}/'
+        response = self.client.get(url, {'sensor_type': 'moisture,humidity'})
+        self.assertEqual(sorted(r['sensor_type'] for r in response.json()), ['humidity', 'moisture'])
+        self.assertEqual(len(self.client.get(f'{url}?sensor_type=moisture&sensor_type=humidity').json()), 2)
+        self.assertEqual(self.client.get(url, {'sensor_type': 'bogus'}).status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are PostgreSQL specific')
+    def test_by_plot_uses_plot_time_index(self):
+        # Other plots' readings of the day, so that the time index alone
+        # (which keeps the view in timestamp order) is not the cheaper scan.
+        other = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=self.user, location='Other', size=1.0))
+        now = timezone.now()
+        ingest.copy_rows([(now - timedelta(seconds=i), other.id, 'moisture', 1.0, 'test') for i in range(2000)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE sensor_readings')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/sensor-readings/plot/{self.plot.id}/')
+        # The ETag probe and the rows themselves.
+        statements = [q['sql'] for q in queries.captured_queries if 'sensor_reading_history' in q['sql']]
+        self.assertEqual(len(statements), 2)
+
+        for sql in statements:
+            with connection.cursor() as cursor:
+                # The test table is tiny; make the planner show what it would do at scale.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+            # Any plot-leading composite index qualifies (the natural key
+            # included); on a partitioned table the scan targets the
+            # per-partition copy of the index.
+            self.assertRegex(
+                plan,
+                r'Index (Only )?Scan (Backward )?using \S*(sensor_plot_type_ts_idx|sensor_plot_ts_id_idx'
+                r'|plot_id_sensor_type_timestamp_idx|plot_id_timestamp_id_idx|plot_id_sensor_type_timestamp_sour_key'
+                r'|plot_id_timestamp_source_key)',
+            )
+            self.assertNotIn('Seq Scan', plan)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning is PostgreSQL specific')
+    def test_new_partition_takes_its_rows_from_the_default_partition(self):
+        march = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        reading = SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=60.0, timestamp=march)
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=61.0, timestamp=march - timedelta(days=1))
+        with connection.cursor() as cursor:
+            self.assertEqual(partitions.default_partition_rows(cursor), 2)
+            self.assertEqual(partitions.create_partition(cursor, march, 'month'), 'sensor_readings_p2025_03')
+            self.assertEqual(partitions.default_partition_rows(cursor), 1)
+            cursor.execute('SELECT id FROM sensor_readings_p2025_03')
+            self.assertEqual(cursor.fetchall(), [(reading.id,)])
+            self.assertIn('sensor_readings_p2025_03', [name for name, _, _ in partitions.list_partitions(cursor)])
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning is PostgreSQL specific')
+    def test_recent_readings_prune_to_one_partition(self):
+        start, end = day_range(timezone.now().astimezone(dt_timezone.utc).date())
+        plan = SensorReading.objects.filter(plot=self.plot, timestamp__gte=start, timestamp__lt=end).explain()
+        self.assertEqual(len(re.findall(r' on sensor_readings_\w+', plan)), 1, plan)
+        self.assertNotIn('sensor_readings_default', plan)
+
+
+class ScopeTests(APITestCase):
+
+    def setUp(self):
+        self.farmer = User.objects.create_user('farmer', password='password')
+        other = User.objects.create_user('other', password='password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=self.farmer, location='Mine', size=1.0))
+        self.other_plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=other, location='Theirs', size=1.0))
+        for plot in (self.plot, self.other_plot):
+            SensorReading.objects.bulk_create(
+                SensorReading(plot=plot, sensor_type='moisture', value=float(i)) for i in range(5)
+            )
+        self.client.force_authenticate(self.farmer)
+
+    def test_farmer_only_sees_own_plots_and_readings(self):
+        response = self.client.get('/api/fieldplots/')
+        self.assertEqual([p['id'] for p in response.json()], [self.plot.id])
+
+        response = self.client.get('/api/sensor-readings/')
+        self.assertEqual({r['plot'] for r in response.json()['results']}, {self.plot.id})
+
+        response = self.client.get(f'/api/sensor-readings/plot/{self.other_plot.id}/')
+        self.assertEqual(response.json(), [])
+
+    def test_scope_is_resolved_once_per_request(self):
+        # Role, plot ids, then the page itself.
+        with self.assertNumQueries(3):
+            self.client.get('/api/sensor-readings/')
+
+    def test_object_outside_scope_is_not_found(self):
+        reading = SensorReading.objects.filter(plot=self.other_plot).first()
+        response = self.client.get(f'/api/sensor-readings/{reading.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_writes_cannot_point_outside_the_scope(self):
+        reading = SensorReading.objects.filter(plot=self.plot).first()
+        response = self.client.patch(f'/api/sensor-readings/{reading.id}/', {'plot': self.other_plot.id}, format='json')
+        self.assertEqual(response.status_code, 403)
+        reading.refresh_from_db()
+        self.assertEqual(reading.plot_id, self.plot.id)
+
+        other_reading = SensorReading.objects.filter(plot=self.other_plot).first()
+        event = {'anomaly_type': 'moisture_drop', 'model_confidence': 0.9}
+        for plot, sensor_reading in ((self.other_plot, reading), (self.plot, other_reading)):
+            response = self.client.post(
+                '/api/anomalies/', {**event, 'plot': plot.id, 'sensor_reading': sensor_reading.id}, format='json',
+            )
+            self.assertEqual(response.status_code, 403)
+
+        other_event = AnomalyEvent.objects.create(
+            plot=self.other_plot, sensor_reading=other_reading, anomaly_type='moisture_drop', model_confidence=0.9,
+        )
+        response = self.client.post('/api/recommendations/', {
+            'anomaly_event': other_event.id, 'recommended_action': 'irrigate',
+            'explanation_text': 'Dry soil.', 'confidence': 'high',
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.post('/api/fieldplots/', {'farm': self.other_plot.farm_id, 'crop_variety': 'oats'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.patch(f'/api/farmprofiles/{self.plot.farm_id}/', {'owner': other_event.plot.farm.owner_id}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(AnomalyEvent.objects.count(), 1)
+
+    def test_writes_inside_the_scope_are_allowed(self):
+        reading = SensorReading.objects.filter(plot=self.plot).first()
+        response = self.client.post('/api/anomalies/', {
+            'anomaly_type': 'moisture_drop', 'model_confidence': 0.9, 'plot': self.plot.id, 'sensor_reading': reading.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.patch(f'/api/sensor-readings/{reading.id}/', {'value': 42.0}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.client.force_authenticate(user)
+        start = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc)
+        # Three readings per timestamp: pages have to split the ties by id.
+        SensorReading.objects.bulk_create(
+            SensorReading(plot=self.plot, sensor_type=sensor_type, value=float(minute),
+                          timestamp=start + timedelta(minutes=minute))
+            for minute in range(4)
+            for sensor_type in ('moisture', 'temperature', 'humidity')
+        )
+
+    def walk(self, params):
+        ids, response = [], self.client.get('/api/sensor-readings/', params)
+        while True:
+            body = response.json()
+            ids += [row['id'] for row in body['results']]
+            if body['next'] is None:
+                return ids
+            response = self.client.get(body['next'])
+
+    def expected(self, queryset=SensorReading.objects):
+        return list(queryset.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def test_cursor_walk_visits_every_row_once(self):
+        for size in (1, 2, 4, 12, 20):
+            self.assertEqual(self.walk({'page_size': size}), self.expected())
+
+    def test_cursor_walk_keeps_the_filters(self):
+        ids = self.walk({'page_size': 1, 'sensor_type': 'moisture', 'start': '2025-03-01T10:01:00Z'})
+        self.assertEqual(ids, self.expected(SensorReading.objects.filter(sensor_type='moisture', value__gte=1.0)))
+
+    def test_invalid_cursor_is_not_found(self):
+        valid = encode_cursor(datetime(2025, 3, 1, 10, 2, tzinfo=dt_timezone.utc), 1)
+        bad_id = base64.urlsafe_b64encode(b'2025-03-01T10:02:00+00:00|x').decode()
+        for cursor in ('garbage', valid[:-3], bad_id):
+            self.assertEqual(self.client.get('/api/sensor-readings/', {'cursor': cursor}).status_code, 404)
+
+    def test_page_size_is_clamped(self):
+        def page(size):
+            return len(self.client.get('/api/sensor-readings/', {'page_size': size}).json()['results'])
+
+        self.assertEqual(page(0), 1)
+        self.assertEqual(page(-5), 1)
+        with patch.object(KeysetPagination, 'page_size', 5), patch.object(KeysetPagination, 'max_page_size', 7):
+            self.assertEqual(page('many'), 5)
+            self.assertEqual(page(1000), 7)
+
+
+class RowSerializerTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', password='password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        now = timezone.now().replace(microsecond=0)
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=61, timestamp=now)
+        reading = SensorReading.objects.create(
+            plot=self.plot, sensor_type='temperature', value=21.5, timestamp=now.replace(microsecond=123456)
+        )
+        AnomalyEvent.objects.create(
+            plot=self.plot, sensor_reading=reading, anomaly_type='temperature_high', model_confidence=0.9, timestamp=reading.timestamp
+        )
+
+    def assertSameRepresentation(self, rows, serializer_class, queryset):
+        self.assertEqual(rows.represent(rows.values(queryset)), serializer_class(queryset, many=True).data)
+
+    def test_rows_match_model_serializers(self):
+        self.assertSameRepresentation(sensor_reading_rows, SensorReadingSerializer, SensorReading.objects.order_by('id'))
+        self.assertSameRepresentation(anomaly_event_rows, AnomalyEventSerializer, AnomalyEvent.objects.order_by('id'))
+
+    def test_rows_match_model_serializers_in_other_timezone(self):
+        with timezone.override('Africa/Tunis'):
+            self.assertSameRepresentation(sensor_reading_rows, SensorReadingSerializer, SensorReading.objects.order_by('id'))
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', password='password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        start = timezone.now() - timedelta(hours=1)
+        SensorReading.objects.bulk_create(
+            SensorReading(plot=self.plot, sensor_type='moisture', value=float(i), timestamp=start + timedelta(minutes=i))
+            for i in range(25)
+        )
+        self.client.force_authenticate(user)
+
+    def fetch(self, export_format, **params):
+        with patch.object(export, 'CHUNK_SIZE', 10):
+            response = self.client.get(f'/api/sensor-readings/export/{export_format}/', params)
+            return response, b''.join(response.streaming_content)
+
+    def test_csv_and_ndjson_stream_every_reading_oldest_first(self):
+        response, body = self.fetch('csv', plot=self.plot.id)
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], 'id,timestamp,plot,sensor_type,value,source')
+        self.assertEqual([float(line.split(',')[4]) for line in lines[1:]], [float(i) for i in range(25)])
+
+        response, body = self.fetch('ndjson', plot=self.plot.id, sensor_type='temperature')
+        self.assertEqual(body, b'')
+
+    def test_asgi_export_is_streamed_asynchronously(self):
+        async def fetch():
+            response = await self.async_client.get(
+                '/api/sensor-readings/export/csv/', {'plot': self.plot.id},
+                headers={'Authorization': f'Bearer {AccessToken.for_user(self.plot.farm.owner)}'},
+            )
+            return response.is_async, [chunk async for chunk in response.streaming_content]
+
+        with patch.object(export, 'CHUNK_SIZE', 10):
+            is_async, chunks = async_to_sync(fetch)()
+        # Without an async iterator Django would gather the chunks first.
+        self.assertTrue(is_async)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b''.join(chunks).decode().splitlines()), 26)
+
+    @skipUnless(export.pa is not None, 'pyarrow is not installed')
+    def test_parquet_and_arrow_exports(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        _, body = self.fetch('parquet')
+        parquet = pq.ParquetFile(pa.BufferReader(body))
+        self.assertEqual(parquet.read().column('value').to_pylist(), [float(i) for i in range(25)])
+        self.assertEqual(parquet.num_row_groups, 3)
+
+        _, body = self.fetch('arrow')
+        self.assertEqual(pa.ipc.open_stream(body).read_all().num_rows, 25)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get('/api/sensor-readings/export/xlsx/')
+        self.assertEqual(response.status_code, 400)
+
+
+class LoadReadingsTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', password='password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+
+    def test_csv_rows_are_loaded_with_their_timestamps(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write(
+                'timestamp,plot,sensor_type,value,source\n'
+                f'2025-03-01T10:00:00+01:00,{self.plot.id},moisture,60.5,logger\n'
+                f'2025-03-01T10:05:00Z,{self.plot.id},temperature,21,\n'
+                f'2025-03-01T10:10:00Z,{self.plot.id + 1},moisture,60.0,logger\n'
+                f'not a date,{self.plot.id},moisture,60.0,logger\n'
+                f'2025-03-01T10:15:00Z,{self.plot.id},pressure,1.0,logger\n'
+            )
+        self.addCleanup(os.unlink, handle.name)
+        out = io.StringIO()
+        call_command('load_readings', handle.name, chunk_size=2, stdout=out)
+
+        self.assertIn('2 readings written, 3 rejected', out.getvalue())
+        readings = list(SensorReading.objects.order_by('timestamp').values_list('timestamp', 'sensor_type', 'value', 'source'))
+        self.assertEqual(readings, [
+            (datetime(2025, 3, 1, 9, 0, tzinfo=dt_timezone.utc), 'moisture', 60.5, 'logger'),
+            (datetime(2025, 3, 1, 10, 5, tzinfo=dt_timezone.utc), 'temperature', 21.0, 'import'),
+        ])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is PostgreSQL specific')
+    def test_copy_path_updates_the_heartbeats(self):
+        start = timezone.now() - timedelta(hours=1)
+        rows = [(start + timedelta(minutes=i), self.plot.id, 'moisture', float(i), 'logger') for i in range(10)]
+        self.assertEqual(ingest.copy_rows(rows), 10)
+
+        newest = SensorReading.objects.order_by('-timestamp').first()
+        heartbeat = SensorHeartbeat.objects.get(plot=self.plot, sensor_type='moisture')
+        self.assertEqual((heartbeat.last_seen, heartbeat.last_reading_id), (newest.timestamp, newest.id))
+
+
+class BackfillCommandTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', password='password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+
+    def backfill(self, start, end):
+        call_command('backfill_readings', plots=str(self.plot.id), start=start, end=end, interval=1200, stdout=io.StringIO())
+        return list(SensorReading.objects.order_by('timestamp').values_list('timestamp', flat=True).distinct())
+
+    def test_naive_and_aware_dates(self):
+        with timezone.override('UTC'):
+            self.assertEqual(self.backfill('2025-03-01', '2025-03-01T01:00'), [
+                datetime(2025, 3, 1, 0, minute, tzinfo=dt_timezone.utc) for minute in (0, 20, 40)
+            ])
+        self.assertEqual(self.backfill('2025-03-02T01:00:00+01:00', '2025-03-02T00:40:00Z')[3:], [
+            datetime(2025, 3, 2, 0, minute, tzinfo=dt_timezone.utc) for minute in (0, 20)
+        ])
+
+    def test_invalid_date(self):
+        with self.assertRaisesMessage(CommandError, 'Invalid date: tomorrow'):
+            self.backfill('tomorrow', None)
+
+
+class IdempotentIngestTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.client.force_authenticate(user)
+
+    def test_retried_batch_is_not_written_twice(self):
+        batch = [
+            {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 60.0, 'timestamp': '2025-03-01T10:00:00Z'},
+            {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 61.0, 'timestamp': '2025-03-01T10:05:00Z'},
+        ]
+        response = self.client.post('/api/sensor-readings/bulk/', batch, format='json')
+        self.assertEqual(response.json(), {'created': 2, 'duplicates': 0, 'errors': []})
+
+        batch.append({'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 62.0, 'timestamp': '2025-03-01T10:10:00Z'})
+        response = self.client.post('/api/sensor-readings/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 1, 'duplicates': 2, 'errors': []})
+        self.assertEqual(SensorReading.objects.count(), 3)
+
+        heartbeat = SensorHeartbeat.objects.get(plot=self.plot, sensor_type='moisture')
+        self.assertEqual(heartbeat.last_seen, datetime(2025, 3, 1, 10, 10, tzinfo=dt_timezone.utc))
+
+    def test_copy_path_skips_duplicates(self):
+        start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        rows = [(start + timedelta(minutes=i), self.plot.id, 'moisture', float(i), 'logger') for i in range(10)]
+        with patch.object(ingest, 'COPY_MIN_ROWS', 5):
+            self.assertEqual(ingest.copy_rows(rows), 10)
+            self.assertEqual(ingest.copy_rows(rows + rows[:3]), 0)
+        self.assertEqual(SensorReading.objects.count(), 10)
+
+
+class BulkIngestTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        self.other_plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=other, location='Other', size=1.0))
+        self.client.force_authenticate(user)
+
+    def reading(self, minute, **fields):
+        return {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 60.0,
+                'timestamp': f'2025-03-01T10:{minute:02d}:00Z', **fields}
+
+    def test_invalid_rows_are_reported_by_index(self):
+        response = self.client.post('/api/sensor-readings/bulk/', [
+            self.reading(0),
+            self.reading(1, plot=self.other_plot.id),
+            self.reading(2, sensor_type='pressure', value='nan'),
+            'not an object',
+            self.reading(4, timestamp='yesterday'),
+            self.reading(5, value='61.5'),
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['created'], body['duplicates']), (2, 0))
+        self.assertEqual(
+            [(error['index'], sorted(error['errors'])) for error in body['errors']],
+            [(1, ['plot']), (2, ['sensor_type', 'value']), (3, ['non_field_errors']), (4, ['timestamp'])],
+        )
+        self.assertEqual(sorted(SensorReading.objects.values_list('value', flat=True)), [60.0, 61.5])
+
+        response = self.client.post('/api/sensor-readings/bulk/', [self.reading(6, value=None)], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+
+    def test_ndjson_body(self):
+        lines = [json.dumps(self.reading(minute)) for minute in range(3)]
+        body = '\n'.join([lines[0], '', *lines[1:]]) + '\n'
+        response = self.client.post('/api/sensor-readings/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 3)
+
+        response = self.client.post('/api/sensor-readings/bulk/', lines[0] + '\n{"plot": ', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', response.json()['detail'])
+
+    def test_readings_wrapper(self):
+        response = self.client.post('/api/sensor-readings/bulk/', {'readings': [self.reading(0)]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+
+        response = self.client.post('/api/sensor-readings/bulk/', {'rows': [self.reading(1)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_batch_is_rejected_whole(self):
+        with patch.object(ingest, 'BULK_MAX_ROWS', 2):
+            response = self.client.post('/api/sensor-readings/bulk/', [self.reading(minute) for minute in range(3)], format='json')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(SensorReading.objects.exists())
+
+
+class CompactionTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.client.force_authenticate(user)
+        self.start = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc)
+        # Whole partitions are compacted on PostgreSQL: the month's own.
+        self.before = datetime(2025, 4, 1, tzinfo=dt_timezone.utc)
+        if partitions.is_supported():
+            with connection.cursor() as cursor:
+                partitions.create_partition(cursor, datetime(2025, 3, 1, tzinfo=dt_timezone.utc), 'month')
+        self.rows = [
+            (self.start + timedelta(minutes=5 * i), self.plot.id, sensor_type, float(i), 'logger')
+            for i in range(4)
+            for sensor_type in ('moisture', 'temperature', 'humidity')
+        ]
+        ingest.copy_rows(self.rows[:-1])  # The last tick misses its humidity.
+
+    def readings(self):
+        response = self.client.get(f'/api/sensor-readings/plot/{self.plot.id}/', {'date': '2025-03-01'})
+        return sorted((r['timestamp'], r['sensor_type'], r['value']) for r in response.json())
+
+    def test_history_is_unchanged_by_compaction(self):
+        before = self.readings()
+        event = AnomalyEvent.objects.create(
+            plot=self.plot, sensor_reading=SensorReading.objects.get(sensor_type='moisture', value=1.0),
+            timestamp=self.start, anomaly_type='temperature_high', model_confidence=0.9,
+        )
+
+        samples, readings = compaction.compact(self.before)
+
+        # Only tick 0 moves: tick 1 has a reading referenced by an event,
+        # tick 2 the newest humidity reading (heartbeat), tick 3 is incomplete.
+        self.assertEqual((samples, readings), (1, 3))
+        self.assertEqual(SensorSample.objects.count(), 1)
+        self.assertEqual(SensorReading.objects.count(), 8)
+        self.assertTrue(SensorReading.objects.filter(id=event.sensor_reading_id).exists())
+        self.assertEqual(self.readings(), before)
+
+        response = self.client.get('/api/sensor-readings/', {'plot': self.plot.id, 'page_size': 100})
+        ids = [r['id'] for r in response.json()['results']]
+        self.assertEqual(len(ids), 11)
+        self.assertEqual(len([pk for pk in ids if pk < 0]), 3)
+
+    def test_compacted_readings_have_negative_ids(self):
+        compaction.compact(self.before)
+        response = self.client.get(f'/api/sensor-readings/plot/{self.plot.id}/', {'date': '2025-03-01'})
+        compacted = [r for r in response.json() if r['id'] < 0]
+        self.assertEqual(len(compacted), 3 * SensorSample.objects.count())
+        self.assertEqual(len({r['id'] for r in response.json()}), 11)
+        self.assertEqual(self.client.get(f'/api/sensor-readings/{compacted[0]["id"]}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/sensor-readings/{compacted[0]["id"]}/').status_code, 404)
+
+    def test_compaction_is_idempotent(self):
+        compaction.compact(self.before)
+        self.assertEqual(compaction.compact(self.before), (0, 0))
+
+    def test_compacted_readings_are_not_stored_again(self):
+        compaction.compact(self.before)
+        history = SensorReadingHistory.objects.count()
+
+        self.assertEqual(ingest.copy_rows(self.rows[:3]), 0)
+        response = self.client.post('/api/sensor-readings/bulk/', [
+            {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 0.0, 'timestamp': '2025-03-01T10:00:00Z', 'source': 'logger'},
+        ], format='json')
+        self.assertEqual(response.json()['created'], 0)
+        response = self.client.post('/api/sensor-readings/', {
+            'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 0.0, 'timestamp': '2025-03-01T10:00:00Z', 'source': 'logger',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(SensorReadingHistory.objects.count(), history)
+
+        # Other ticks of the same range are still written.
+        self.assertEqual(ingest.copy_rows([(self.start, self.plot.id, 'moisture', 0.0, 'other')]), 1)
+
+    def test_rescoring_reads_compacted_readings(self):
+        compaction.compact(self.before)
+        frames = rescoring.load_readings(self.plot.id, self.start, self.before)
+        self.assertEqual(sum(len(frame) for frame in frames.values()), 11)
+        self.assertEqual(frames['moisture']['value'].tolist(), [0.0, 1.0, 2.0, 3.0])
+        self.assertLess(frames['moisture']['id'][0], 0)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning is PostgreSQL specific')
+    def test_partition_is_replaced_not_deleted_from(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(compaction.compact(self.before), (2, 6))
+        self.assertFalse([q['sql'] for q in queries.captured_queries if q['sql'].startswith('DELETE')])
+        with connection.cursor() as cursor:
+            self.assertIn('sensor_readings_p2025_03', [name for name, _, _ in partitions.list_partitions(cursor)])
+        self.assertEqual(SensorReading.objects.count(), 5)
+        # The replacement has the parent's indexes.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_indexes WHERE tablename = 'sensor_readings_p2025_03'")
+            indexes = cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM pg_indexes WHERE tablename = 'sensor_readings_default'")
+            self.assertEqual(indexes, cursor.fetchone()[0])
+            # ... and its constraints, once each (no leftover CHECK of the range).
+            constraints = "SELECT contype, count(*) FROM pg_constraint WHERE conrelid = %s::regclass GROUP BY contype ORDER BY contype"
+            cursor.execute(constraints, ['sensor_readings_p2025_03'])
+            replaced = cursor.fetchall()
+            cursor.execute(constraints, ['sensor_readings_default'])
+            self.assertEqual(replaced, cursor.fetchall())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning is PostgreSQL specific')
+    def test_retention_detaches_or_drops_sample_partitions(self):
+        compaction.compact(self.before)
+        sample_id = SensorReadingHistory.objects.filter(id__lt=0).values_list('id', flat=True).first()
+        AnomalyEvent.objects.create(
+            plot=self.plot, sensor_reading_id=sample_id, timestamp=self.start,
+            anomaly_type='moisture_drop', model_confidence=0.9,
+        )
+        rollups.refresh()
+        self.assertTrue(DailySensorRollup.objects.exists())
+
+        detached = partitions.apply_retention(
+            now=datetime(2025, 5, 1, tzinfo=dt_timezone.utc), retention_days=1, drop=False,
+        )
+        self.assertEqual(detached, ['sensor_readings_p2025_03', 'sensor_samples_p2025_03'])
+        self.assertEqual(SensorReadingHistory.objects.count(), 0)
+        self.assertEqual(AnomalyEvent.objects.count(), 1)
+        self.assertFalse(HourlySensorRollup.objects.exists() or DailySensorRollup.objects.exists())
+        with connection.cursor() as cursor:
+            # Kept as standalone tables: attach them back for the drop below.
+            for table in partitions.TABLES:
+                cursor.execute(
+                    f'ALTER TABLE {table} ATTACH PARTITION {table}_p2025_03 '
+                    "FOR VALUES FROM ('2025-03-01T00:00:00+00:00') TO ('2025-04-01T00:00:00+00:00')"
+                )
+        self.assertEqual(SensorReadingHistory.objects.count(), 11)
+        rollups.mark_stale(datetime(2025, 3, 1, tzinfo=dt_timezone.utc), datetime(2025, 4, 1, tzinfo=dt_timezone.utc))
+        rollups.refresh()
+        self.assertEqual(sum(HourlySensorRollup.objects.values_list('count', flat=True)), 11)
+
+        dropped = partitions.apply_retention(now=datetime(2025, 5, 1, tzinfo=dt_timezone.utc), retention_days=1)
+        self.assertEqual(dropped, ['sensor_readings_p2025_03', 'sensor_samples_p2025_03'])
+        self.assertEqual(SensorReadingHistory.objects.count(), 0)
+        self.assertFalse(AnomalyEvent.objects.exists())
+        self.assertFalse(HourlySensorRollup.objects.exists() or DailySensorRollup.objects.exists())
+
+
+class IngestQueueTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.client.force_authenticate(user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = patch.dict(ingest_queue.CONFIG, {'ENABLED': True, 'PATH': os.path.join(directory.name, 'queue.sqlite3')})
+        config.start()
+        self.addCleanup(config.stop)
+        self.batch = [
+            {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 60.0, 'timestamp': '2025-03-01T10:00:00Z'},
+            {'plot': self.plot.id, 'sensor_type': 'humidity', 'value': 70.0},
+            {'plot': self.plot.id, 'sensor_type': 'pressure', 'value': 1.0},
+        ]
+
+    def test_bulk_is_queued_then_drained(self):
+        response = self.client.post('/api/sensor-readings/bulk/', self.batch, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['queued'], 2)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [2])
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertEqual(self.client.get('/api/sensor-readings/queue/').json()['readings'], 2)
+
+        self.assertEqual(ingest_queue.drain(), (2, 0, 0))
+        self.assertEqual(SensorReading.objects.count(), 2)
+        self.assertEqual(ingest_queue.stats()['readings'], 0)
+
+    def test_single_reading_is_queued(self):
+        response = self.client.post('/api/sensor-readings/', self.batch[0], format='json')
+        self.assertEqual((response.status_code, response.json()), (202, {'queued': 1}))
+        self.assertEqual(ingest_queue.drain(), (1, 0, 0))
+
+    def test_full_queue_refuses_writes(self):
+        with patch.dict(ingest_queue.CONFIG, {'MAX_PENDING': 1}):
+            response = self.client.post('/api/sensor-readings/bulk/', self.batch, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(ingest_queue.CONFIG['RETRY_AFTER']))
+        self.assertEqual(ingest_queue.stats()['readings'], 0)
+
+    def test_writes_read_the_running_totals(self):
+        statements = []
+        connect = ingest_queue.connect
+
+        def traced():
+            db = connect()
+            db.set_trace_callback(statements.append)
+            return db
+
+        with patch.object(ingest_queue, 'connect', traced):
+            for _ in range(3):
+                self.client.post('/api/sensor-readings/bulk/', self.batch[:2], format='json')
+        self.assertFalse([sql for sql in statements if 'FROM entries' in sql])
+        self.assertEqual(ingest_queue.stats()['readings'], 6)
+
+        db = ingest_queue.connect()
+        self.addCleanup(db.close)
+        entries = ingest_queue.claim(db, 2)
+        ingest_queue.acknowledge(db, [entry_id for entry_id, _ in entries])
+        stats = ingest_queue.stats()
+        self.assertEqual((stats['entries'], stats['readings']), (2, 4))
+
+    def test_totals_of_an_existing_queue_are_counted_once(self):
+        db = sqlite3.connect(ingest_queue.CONFIG['PATH'])
+        db.execute(ingest_queue.SCHEMA[0])
+        db.executemany('INSERT INTO entries (enqueued, size, rows) VALUES (?, ?, ?)', [(1.0, 2, '[]'), (2.0, 3, '[]')])
+        db.commit()
+        db.close()
+        self.assertEqual(ingest_queue.stats()['readings'], 5)
+        self.client.post('/api/sensor-readings/bulk/', self.batch[:1], format='json')
+        stats = ingest_queue.stats()
+        self.assertEqual((stats['entries'], stats['readings']), (3, 6))
+
+    def test_entries_of_a_dead_worker_are_retried(self):
+        self.client.post('/api/sensor-readings/bulk/', self.batch[:1], format='json')
+        db = ingest_queue.connect()
+        self.addCleanup(db.close)
+        entry_id, rows = ingest_queue.claim(db, 100)[0]
+        ingest.copy_rows([(parse_datetime(rows[0][0]), *rows[0][1:])])  # Crash before the acknowledgement.
+
+        self.assertEqual(ingest_queue.drain(), (0, 0, 0))  # Still leased.
+        with patch.dict(ingest_queue.CONFIG, {'LEASE_SECONDS': -1}):
+            self.assertEqual(ingest_queue.drain(), (0, 1, 0))
+        self.assertEqual(SensorReading.objects.count(), 1)
+        self.assertEqual(ingest_queue.stats()['entries'], 0)
+
+
+class LiveStreamTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        farm = FarmProfile.objects.create(owner=self.user, location='Farm', size=1.0)
+        self.plot = FieldPlot.objects.create(farm=farm)
+        other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        self.other_plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=other, location='Farm', size=1.0))
+
+    def test_new_rows_reach_the_subscribers_of_their_plot(self):
+        async def scenario():
+            hub = live.Hub()
+            mine, theirs = hub.subscribe({self.plot.id}), hub.subscribe({self.other_plot.id})
+            hub.task.cancel()  # Polled by hand below.
+            await hub.poll()
+            await sync_to_async(SensorReading.objects.create)(plot=self.plot, sensor_type='moisture', value=61.5)
+            await hub.poll()
+            return await mine.get(0), await theirs.get(0)
+
+        mine, theirs = async_to_sync(scenario)()
+        self.assertEqual(len(mine), 1)
+        self.assertTrue(mine[0].startswith('event: reading\n'))
+        self.assertIn('"value":61.5', mine[0])
+        self.assertEqual(theirs, [])
+
+    def poll_queries(self, hub):
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(hub.poll)()
+        return [q['sql'] for q in queries.captured_queries]
+
+    def test_backlog_of_the_subscribed_plots_is_drained(self):
+        async def scenario():
+            hub = live.Hub()
+            subscription = hub.subscribe({self.plot.id})
+            hub.task.cancel()
+            await hub.poll()
+            await sync_to_async(ingest.copy_rows)(
+                [(now + timedelta(seconds=i), self.plot.id, 'moisture', float(i), 'test') for i in range(5)]
+                + [(now + timedelta(seconds=i), self.other_plot.id, 'moisture', float(i), 'test') for i in range(5)]
+            )
+            queries = await sync_to_async(self.poll_queries)(hub)
+            reads = [sql for sql in queries if 'FROM "sensor_readings"' in sql and 'LIMIT' in sql]
+            return await subscription.get(0), reads
+
+        now = timezone.now()
+        with patch.dict(live.CONFIG, {'BATCH': 2}):
+            frames, reads = async_to_sync(scenario)()
+        self.assertEqual(len(frames), 5)
+        # 2 + 2 + 1 rows: the other plot's readings are not read.
+        self.assertEqual(len(reads), 3)
+
+    def test_slow_client_is_disconnected(self):
+        async def scenario():
+            hub = live.Hub()
+            body = live.stream({self.plot.id}, hub)
+            chunks = [await anext(body)]
+            hub.task.cancel()
+            subscription, = hub.subscriptions
+            for _ in range(3):
+                subscription.push(live.frame('reading', {'plot': self.plot.id}))
+            chunks += [chunk async for chunk in body]
+            return chunks, hub.subscriptions
+
+        with patch.dict(live.CONFIG, {'BUFFER': 2}):
+            chunks, subscriptions = async_to_sync(scenario)()
+        self.assertEqual(chunks[1].count('event: reading'), 2)
+        self.assertTrue(chunks[-1].startswith('event: overflow'))
+        self.assertEqual(subscriptions, set())
+
+    def test_unsent_response_holds_no_subscription(self):
+        async def get():
+            response = await self.async_client.get('/api/stream/', {'plot': self.plot.id, 'token': token})
+            response.close()
+            return response.status_code
+
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(async_to_sync(get)(), 200)
+        self.assertEqual(live.hub.subscriptions, set())
+
+    def test_stream_requires_access_to_the_plots(self):
+        async def get(params):
+            response = await self.async_client.get('/api/stream/', params)
+            if response.streaming:
+                first = await anext(aiter(response.streaming_content))
+                await response.streaming_content.aclose()
+                live.hub.task.cancel()
+                return response.status_code, response['Content-Type'], first
+            return response.status_code, response['Content-Type'], None
+
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(async_to_sync(get)({'plot': self.plot.id})[0], 401)
+        self.assertEqual(async_to_sync(get)({'plot': self.other_plot.id, 'token': token})[0], 403)
+        self.assertEqual(
+            async_to_sync(get)({'plot': self.plot.id, 'token': token}),
+            (200, 'text/event-stream', b'retry: 3000\n\n'),
+        )
+
+
+class DeltaQueryTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.client.force_authenticate(user)
+        self.now = timezone.now().replace(microsecond=0)
+        for minutes in (10, 5):
+            SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=float(minutes),
+                                         timestamp=self.now - timedelta(minutes=minutes))
+        self.url = f'/api/sensor-readings/plot/{self.plot.id}/'
+
+    def test_by_plot_returns_only_newer_readings(self):
+        response = self.client.get(self.url)
+        self.assertEqual([r['value'] for r in response.json()], [10.0, 5.0])
+        cursor = response['X-Next-Cursor']
+
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(response.json(), [])
+        self.assertEqual(response['X-Next-Cursor'], cursor)
+
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=0.0, timestamp=self.now)
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual([r['value'] for r in response.json()], [0.0])
+        self.assertNotEqual(response['X-Next-Cursor'], cursor)
+
+        since = (self.now - timedelta(minutes=5)).isoformat()
+        self.assertEqual([r['value'] for r in self.client.get(self.url, {'since': since}).json()], [0.0])
+        self.assertEqual(self.client.get(self.url, {'after': 'garbage'}).status_code, 400)
+
+    def test_unchanged_poll_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=0.0, timestamp=self.now)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_late_and_old_readings_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        # Older than the newest reading: a late upload, then a backfilled one.
+        SensorReading.objects.create(plot=self.plot, sensor_type='moisture', value=7.0,
+                                     timestamp=self.now - timedelta(minutes=7))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        ingest.copy_rows([(self.now - timedelta(minutes=8), self.plot.id, 'moisture', 8.0, 'backfill')])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual([r['value'] for r in response.json()], [10.0, 8.0, 7.0, 5.0])
+
+        older = SensorReading.objects.get(value=10.0)
+        older.value = 11.0
+        older.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual([r['value'] for r in response.json()], [11.0, 8.0, 7.0, 5.0])
+
+        self.client.delete(f'/api/sensor-readings/{SensorReading.objects.get(value=7.0).id}/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual([r['value'] for r in response.json()], [11.0, 8.0, 5.0])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_old_anomalies_change_the_etag(self):
+        readings = list(SensorReading.objects.order_by('timestamp'))
+        AnomalyEvent.objects.create(plot=self.plot, sensor_reading=readings[1], anomaly_type='temperature_high',
+                                    model_confidence=0.9, timestamp=readings[1].timestamp)
+        etag = self.client.get('/api/anomalies/')['ETag']
+        # Re-scoring writes events at their readings' historical timestamps.
+        AnomalyEvent.objects.bulk_create([AnomalyEvent(
+            plot=self.plot, sensor_reading=readings[0], anomaly_type='temperature_high',
+            model_confidence=0.9, timestamp=readings[0].timestamp,
+        )])
+        response = self.client.get('/api/anomalies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        AnomalyEvent.objects.filter(sensor_reading=readings[0]).update(model_confidence=0.5)
+        event = AnomalyEvent.objects.get(sensor_reading=readings[1])
+        event.model_confidence = 0.5
+        event.save()
+        response = self.client.get('/api/anomalies/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual([e['model_confidence'] for e in response.json()['results']], [0.5, 0.5])
+
+    def test_anomaly_list_after_cursor(self):
+        readings = list(SensorReading.objects.order_by('timestamp'))
+        for reading in readings:
+            AnomalyEvent.objects.create(plot=self.plot, sensor_reading=reading, anomaly_type='temperature_high',
+                                        model_confidence=0.9, timestamp=reading.timestamp)
+        since = f'{readings[0].timestamp.isoformat()},{AnomalyEvent.objects.order_by("id").first().id}'
+        response = self.client.get('/api/anomalies/', {'since': since})
+        body = response.json()
+        self.assertEqual([event['sensor_reading'] for event in body['results']], [readings[1].id])
+        self.assertIn('after=', body['next'])
+
+        response = self.client.get(body['next'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(self.client.get(body['next'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=self.user, location='Farm', size=1.0))
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/sensor-readings/plot/{self.plot.id}/'
+        self.day = {'date': '2025-03-01'}
+        self.reading = {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 60.0, 'timestamp': '2025-03-01T10:00:00Z'}
+
+    def history_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        return response, [q for q in queries.captured_queries if 'sensor_reading_history' in q['sql']]
+
+    def test_past_day_is_served_from_cache_until_a_late_reading(self):
+        self.client.post('/api/sensor-readings/bulk/', [self.reading], format='json')
+        first, queries = self.history_queries(self.url, self.day)
+        self.assertTrue(queries)
+        second, queries = self.history_queries(self.url, self.day)
+        self.assertEqual(queries, [])
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        late = {**self.reading, 'timestamp': '2025-03-01T09:00:00Z', 'value': 59.0}
+        self.client.post('/api/sensor-readings/bulk/', [late], format='json')
+        response, queries = self.history_queries(self.url, self.day)
+        self.assertTrue(queries)
+        self.assertEqual([r['value'] for r in response.json()], [59.0, 60.0])
+
+    def test_lists_follow_farm_writes_and_scopes(self):
+        self.assertEqual(len(self.client.get('/api/farmprofiles/').json()), 1)
+        FarmProfile.objects.create(owner=self.user, location='Second farm', size=2.0)
+        self.assertEqual(len(self.client.get('/api/farmprofiles/').json()), 2)
+
+        other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/farmprofiles/').json(), [])
+
+
+class LatestReadingTests(APITestCase):
+
+    def setUp(self):
+        latest.get_cache().clear()
+        self.user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        farm = FarmProfile.objects.create(owner=self.user, location='Farm', size=1.0)
+        self.plot = FieldPlot.objects.create(farm=farm, crop_variety='oats')
+        self.other_plot = FieldPlot.objects.create(farm=farm, crop_variety='soft_wheat')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+
+    def write(self, plot, sensor_type, value, minutes):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.copy_rows([(self.start + timedelta(minutes=minutes), plot.id, sensor_type, value, 'test')])
+        return SensorReading.objects.get(plot=plot, sensor_type=sensor_type, value=value)
+
+    def current(self, plot=None):
+        plot = plot or self.plot
+        return {
+            sensor_type: reading and reading['value']
+            for sensor_type, reading in self.client.get(f'/api/fieldplots/{plot.id}/current/').json()['readings'].items()
+        }
+
+    def test_current_shows_the_newest_reading_of_each_sensor(self):
+        self.write(self.plot, 'moisture', 60.0, 10)
+        self.write(self.plot, 'moisture', 55.0, 5)  # Backfilled: older than the live value.
+        self.write(self.plot, 'temperature', 21.5, 10)
+        self.assertEqual(self.current(), {'moisture': 60.0, 'temperature': 21.5, 'humidity': None})
+
+        # Cold cache: filled from the heartbeats.
+        latest.get_cache().clear()
+        self.assertEqual(self.current(), {'moisture': 60.0, 'temperature': 21.5, 'humidity': None})
+
+    def test_current_all_answers_the_visible_plots_from_the_cache(self):
+        self.write(self.plot, 'moisture', 60.0, 10)
+        self.write(self.other_plot, 'humidity', 70.0, 10)
+        FieldPlot.objects.create(farm=FarmProfile.objects.create(
+            owner=User.objects.create_user('neighbour', password='password'), location='Other', size=1.0,
+        ))
+        self.client.get('/api/fieldplots/current/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/fieldplots/current/')
+        self.assertFalse([q for q in queries.captured_queries if 'sensor_readings' in q['sql']])
+        self.assertEqual(
+            [(row['plot'], row['readings']['moisture'] and row['readings']['moisture']['value']) for row in response.json()],
+            [(self.plot.id, 60.0), (self.other_plot.id, None)],
+        )
+
+    def test_update_and_delete_refresh_the_entry(self):
+        older = self.write(self.plot, 'moisture', 58.0, 5)
+        newest = self.write(self.plot, 'moisture', 60.0, 10)
+        self.assertEqual(self.current()['moisture'], 60.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/sensor-readings/{newest.id}/', {'value': 61.0}, format='json')
+        self.assertEqual(self.current()['moisture'], 61.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/sensor-readings/{newest.id}/', {'plot': self.other_plot.id}, format='json')
+        self.assertEqual(self.current()['moisture'], 58.0)
+        self.assertEqual(self.current(self.other_plot)['moisture'], 61.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/sensor-readings/{older.id}/')
+        self.assertIsNone(self.current()['moisture'])
+
+    def test_deleted_last_reading_is_not_served_from_a_cold_cache(self):
+        self.write(self.plot, 'moisture', 58.0, 5)
+        newest = self.write(self.plot, 'moisture', 60.0, 10)
+        newest.delete()  # Not through the API: the heartbeat points at a missing reading.
+        latest.get_cache().clear()
+        self.assertEqual(self.current()['moisture'], 58.0)
+
+
+class CachedAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        authentication.get_cache().clear()
+        self.user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.profile = UserProfile.objects.create(user=self.user, role='farmer')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=self.user, location='Farm', size=1.0))
+        other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        self.other_plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=other, location='Farm', size=1.0))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def principal_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/anomalies/', {'plot': self.plot.id})
+        self.assertEqual(response.status_code, 200)
+        tables = ('"auth_user"', '"core_userprofile"', '"farm_profiles"', '"field_plots"')
+        return [q['sql'] for q in queries.captured_queries if any(table in q['sql'] for table in tables)]
+
+    def test_user_and_scope_come_from_the_cache(self):
+        self.assertTrue(self.principal_queries())
+        self.assertEqual(self.principal_queries(), [])
+
+    def test_role_change_is_seen_by_the_next_request(self):
+        self.assertEqual(self.client.get('/api/anomalies/', {'plot': self.other_plot.id}).json()['results'], [])
+        self.assertEqual(self.client.get(f'/api/fieldplots/{self.other_plot.id}/').status_code, 404)
+        self.profile.role = 'admin'
+        self.profile.save()
+        self.assertEqual(self.client.get(f'/api/fieldplots/{self.other_plot.id}/').status_code, 200)
+
+    def test_farm_writes_reach_the_cached_scope(self):
+        # Shipped settings: the entries and the generations are in different caches.
+        self.assertNotEqual(authentication.CONFIG['CACHE'], response_cache.CONFIG['CACHE'])
+        self.assertEqual(len(self.client.get('/api/farmprofiles/').json()), 1)
+        response = self.client.post(
+            '/api/farmprofiles/', {'owner': self.user.id, 'location': 'Second farm', 'size': 2.0}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/fieldplots/', {'farm': response.json()['id']}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.client.get('/api/farmprofiles/').json()), 2)
+
+    def test_device_token_only_ingests_into_its_plots(self):
+        device, key = authentication.create_device_token(self.user, 'logger', [self.plot])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Device {key}')
+        rows = [
+            {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 60.0},
+            {'plot': self.other_plot.id, 'sensor_type': 'moisture', 'value': 60.0},
+        ]
+        response = self.client.post('/api/sensor-readings/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], response.json()['errors'][0]['index']), (1, 1))
+        self.assertEqual(self.client.get('/api/sensor-readings/').status_code, 403)
+
+        device.revoked_at = timezone.now()
+        device.save()
+        self.assertEqual(self.client.post('/api/sensor-readings/bulk/', rows[:1], format='json').status_code, 401)
+
+
+class BenchmarkTests(APITestCase):
+
+    def test_percentiles_use_the_nearest_rank(self):
+        durations = [i / 1000 for i in range(1, 101)]
+        latency = benchmarks.summarize(durations, 200)['latency_ms']
+        self.assertEqual((latency['p50'], latency['p95'], latency['p99'], latency['max']), (50.0, 95.0, 99.0, 100.0))
+
+    def test_run_reports_every_scenario(self):
+        report = benchmarks.run(farms=1, plots_per_farm=2, hours=2, iterations=3, warmup=1, bulk_size=10, page_size=5)
+        self.assertEqual(list(report['scenarios']), list(benchmarks.SCENARIOS))
+        self.assertEqual(report['seed']['readings'], 2 * 24 * 3)
+        self.assertEqual(report['scenarios']['ingest_bulk']['items'], 30)
+        self.assertEqual(report['scenarios']['list']['items'], 15)
+        # Seeded and ingested readings are all scored.
+        self.assertEqual(report['scenarios']['detection']['items'], SensorReading.objects.count())
+        for result in report['scenarios'].values():
+            self.assertIn('p99', result['latency_ms'])
+
+
+class RollupTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.start = (timezone.now().astimezone(dt_timezone.utc) - timedelta(days=3)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        self.end = self.start + timedelta(days=2)
+        ingest.copy_rows(
+            (self.start + timedelta(minutes=7 * i), self.plot.id, sensor_type, 20.0 + (i * 13 % 17), 'test')
+            for i in range(2 * 24 * 60 // 7)
+            for sensor_type in ('moisture', 'temperature')
+        )
+
+    def compare(self, stride):
+        rows, source = rollups.aggregate([self.plot.id], ['moisture', 'temperature'], stride, self.start, self.end)
+        raw = aggregate_readings(
+            SensorReadingHistory.objects.filter(plot_id=self.plot.id), stride, self.start, self.end,
+        )
+        key = ('sensor_type', 'bucket', 'count', 'min', 'max', 'last')
+        self.assertEqual([tuple(row[k] for k in key) for row in rows], [tuple(row[k] for k in key) for row in raw])
+        for row, expected in zip(rows, raw):
+            self.assertAlmostEqual(row['avg'], expected['avg'])
+        return source
+
+    def test_rollups_match_the_raw_aggregate(self):
+        self.assertEqual(self.compare(rollups.HOUR), 'raw')
+        rollups.refresh()
+        self.assertEqual(self.compare(rollups.HOUR), 'hourly')
+        self.assertEqual(self.compare(rollups.DAY), 'daily')
+
+    def test_late_reading_is_served_raw_until_rolled_up(self):
+        rollups.refresh()
+        ingest.copy_rows([(self.start + timedelta(minutes=1), self.plot.id, 'moisture', 99.0, 'late')])
+        self.assertEqual(self.compare(rollups.HOUR), 'raw')
+        rollups.refresh()
+        self.assertEqual(self.compare(rollups.HOUR), 'hourly')
+        self.assertEqual(self.compare(rollups.DAY), 'daily')
+
+    def test_updated_and_deleted_readings_are_rolled_up_again(self):
+        rollups.refresh()
+        readings = SensorReading.objects.filter(plot=self.plot, sensor_type='moisture')
+        readings.filter(timestamp__lt=self.start + timedelta(hours=1)).update(value=99.0)
+        moved = readings.filter(timestamp__gte=self.start + timedelta(hours=5)).order_by('timestamp').first()
+        moved.timestamp += timedelta(days=1, minutes=1)
+        moved.save()
+        # Every reading of a whole hour, and of a whole day.
+        readings.filter(timestamp__gte=self.start + timedelta(hours=2), timestamp__lt=self.start + timedelta(hours=3)).delete()
+        SensorReading.objects.filter(plot=self.plot, sensor_type='temperature', timestamp__gte=self.start + rollups.DAY).delete()
+        self.assertEqual(self.compare(rollups.HOUR), 'raw')
+
+        rollups.refresh()
+        self.assertEqual(self.compare(rollups.HOUR), 'hourly')
+        self.assertEqual(self.compare(rollups.DAY), 'daily')
+        self.assertFalse(StaleRollupBucket.objects.exists())
+        self.assertFalse(HourlySensorRollup.objects.filter(
+            sensor_type='moisture', bucket=self.start + timedelta(hours=2)).exists())
+        self.assertFalse(DailySensorRollup.objects.filter(sensor_type='temperature', bucket=self.start + rollups.DAY).exists())
+
+
+class AggregateEndpointTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.client.force_authenticate(user)
+        start = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc)
+        ingest.copy_rows([
+            (start, self.plot.id, 'moisture', 60.0, 'test'),
+            (start + timedelta(minutes=40), self.plot.id, 'moisture', 61.1, 'test'),
+            (start + timedelta(minutes=20), self.plot.id, 'moisture', 62.0, 'test'),
+            (start + timedelta(minutes=70), self.plot.id, 'moisture', 65.0, 'test'),
+            (start + timedelta(minutes=30), self.plot.id, 'temperature', 21.3, 'test'),
+        ])
+        self.params = {'plot': self.plot.id, 'bucket': '1h', 'start': '2025-03-01T10:00:00Z', 'end': '2025-03-01T12:00:00Z'}
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        key = ('sensor_type', 'bucket', 'count', 'min', 'max', 'last')
+        return [tuple(row[k] for k in key) + (round(row['avg'], 6),) for row in response.json()]
+
+    def test_buckets_hold_count_min_max_avg_and_last(self):
+        expected = [
+            ('moisture', '2025-03-01T10:00:00Z', 3, 60.0, 62.0, 61.1, 61.033333),
+            ('moisture', '2025-03-01T11:00:00Z', 1, 65.0, 65.0, 65.0, 65.0),
+            ('temperature', '2025-03-01T10:00:00Z', 1, 21.3, 21.3, 21.3, 21.3),
+        ]
+        response = self.client.get('/api/sensor-readings/aggregate/', self.params)
+        self.assertEqual(response['X-Aggregate-Source'], 'raw')
+        self.assertEqual(self.rows(response), expected)
+
+        rollups.refresh()
+        response = self.client.get('/api/sensor-readings/aggregate/', self.params)
+        self.assertEqual(response['X-Aggregate-Source'], 'hourly')
+        self.assertEqual(self.rows(response), expected)
+
+        response = self.client.get('/api/sensor-readings/aggregate/', {**self.params, 'sensor_type': 'temperature', 'bucket': '15m'})
+        self.assertEqual(self.rows(response), [('temperature', '2025-03-01T10:30:00Z', 1, 21.3, 21.3, 21.3, 21.3)])
+
+    def test_invalid_requests_are_rejected(self):
+        for params, field in (
+            ({**self.params, 'bucket': '2h'}, 'bucket'),
+            ({key: value for key, value in self.params.items() if key != 'plot'}, 'plot'),
+            ({**self.params, 'start': self.params['end']}, 'start'),
+        ):
+            response = self.client.get('/api/sensor-readings/aggregate/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.json())
+
+    def test_point_budget(self):
+        # A week of minutes for the three sensors: 30240 points.
+        params = {**self.params, 'bucket': '1m', 'start': '2025-03-01T00:00:00Z', 'end': '2025-03-08T00:00:00Z'}
+        response = self.client.get('/api/sensor-readings/aggregate/', params)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('30240 points requested', response.json()['bucket'])
+
+        response = self.client.get('/api/sensor-readings/aggregate/', {**params, 'sensor_type': 'moisture'})
+        self.assertEqual(response.status_code, 200)
+
+
+class DetectionTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.start = timezone.now() - timedelta(days=1)
+
+    def load(self, values, sensor_type='temperature'):
+        ingest.copy_rows(
+            (self.start + timedelta(minutes=5 * i), self.plot.id, sensor_type, value, 'test')
+            for i, value in enumerate(values)
+        )
+
+    def test_spike_after_warmup_creates_one_event(self):
+        self.load([22.0 + 0.1 * (i % 3) for i in range(40)] + [35.0, 35.5, 22.0])
+        self.assertEqual(detection.run_once()[0], 43)
+        events = list(AnomalyEvent.objects.values_list('anomaly_type', flat=True))
+        self.assertEqual(events, ['temperature_high'])
+
+    def test_readings_are_scored_once(self):
+        self.load([22.0] * 5 + [150.0])
+        self.assertEqual(detection.run_once(batch_size=4)[:2], (4, 0))
+        self.assertEqual(detection.run_once()[:2], (2, 1))
+        self.assertEqual(detection.run_once()[:2], (0, 0))
+        self.assertEqual(AnomalyEvent.objects.get().anomaly_type, 'sensor_failure')
+
+
+class RescoringParityTests(APITestCase):
+    """The vectorised re-scorer and the streaming detector on the same series."""
+
+    def setUp(self):
+        self.config = detection.get_config()
+        self.start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+
+    def series(self, size=300):
+        return [22.0 + 0.3 * math.sin(i / 5) + 0.1 * math.sin(i * 1.7) for i in range(size)]
+
+    def streamed(self, values, config):
+        state = DetectorState(plot_id=1, sensor_type='temperature')
+        return [
+            (index, event.anomaly_type)
+            for index, value in enumerate(values)
+            for event in detection.detect(state, index, value, self.start + timedelta(minutes=5 * index), config)
+        ]
+
+    def vectorised(self, values, config):
+        frame = pd.DataFrame({
+            'id': range(len(values)),
+            'timestamp': [self.start + timedelta(minutes=5 * index) for index in range(len(values))],
+            'value': values,
+        })
+        findings = rescoring.score_series(frame, 'temperature', config)
+        return sorted(zip(findings['id'].tolist(), findings['anomaly_type'].tolist()))
+
+    def test_spikes_and_impossible_values_match(self):
+        values = self.series()
+        values[60:62] = [35.0, 35.5]  # One event while the series stays high.
+        values[120] = 10.0
+        values[150] = 150.0
+        events = self.streamed(values, self.config)
+        self.assertEqual(events, [(60, 'temperature_high'), (120, 'temperature_low'), (150, 'sensor_failure')])
+        self.assertEqual(self.vectorised(values, self.config), events)
+
+    def test_drifts_match(self):
+        # A shift too small to be a spike, which the default limit would take long to confirm.
+        config = {**self.config, 'CUSUM_LIMIT': 5.0}
+        for step in (0.4, 0.6, 0.8):
+            values = self.series()
+            values[100:] = [value + step for value in values[100:]]
+            events = self.streamed(values, config)
+            self.assertEqual([anomaly_type for _, anomaly_type in events], ['sensor_drift'])
+            self.assertEqual(self.vectorised(values, config), events)
+
+
+class HeartbeatSweepTests(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+        self.start = timezone.now() - timedelta(days=2)
+        self.config = detection.get_config()
+
+    def load(self, values, first=0):
+        ingest.copy_rows(
+            (self.start + timedelta(minutes=5 * (first + i)), self.plot.id, 'moisture', value, 'test')
+            for i, value in enumerate(values)
+        )
+
+    def sweep(self, minutes):
+        events = heartbeat.sweep(now=self.start + timedelta(minutes=minutes), config=self.config)
+        return [event.anomaly_type for event in events]
+
+    def test_silence_is_reported_once_as_gap_then_as_failure(self):
+        self.load([50.0] * 3)  # Last seen at minute 10.
+        self.assertEqual(self.sweep(20), [])
+        self.assertEqual(self.sweep(30), ['data_gap'])
+        self.assertEqual(self.sweep(60), [])
+        self.assertEqual(self.sweep(10 + 6 * 60 + 1), ['sensor_failure'])
+        self.assertEqual(self.sweep(10 + 6 * 60 + 2), [])
+
+        # The next reading re-arms the sensor.
+        self.load([50.0], first=100)
+        self.assertEqual(self.sweep(500 + 16), ['data_gap'])
+        self.assertEqual(AnomalyEvent.objects.filter(plot=self.plot).count(), 3)
+
+    def test_sensors_silent_together_share_one_event(self):
+        ingest.copy_rows(
+            (self.start + timedelta(minutes=10), self.plot.id, sensor_type, 50.0, 'test')
+            for sensor_type in ('moisture', 'temperature')
+        )
+        out = io.StringIO()
+        with patch.object(heartbeat.timezone, 'now', return_value=self.start + timedelta(minutes=30)):
+            call_command('sweep_heartbeats', stdout=out)
+        self.assertEqual(out.getvalue(), '1 silence events created\n')
+        self.assertEqual(AnomalyEvent.objects.count(), 1)
+
+        # A late upload of the same tick: the third sensor is silent since then too.
+        ingest.copy_rows([(self.start + timedelta(minutes=10), self.plot.id, 'humidity', 50.0, 'test')])
+        self.assertEqual(self.sweep(31), [])
+        self.assertEqual(AnomalyEvent.objects.count(), 1)
+
+    def test_detector_does_not_report_gaps(self):
+        self.load([50.0] * 3)
+        self.load([50.0] * 3, first=60)
+        detection.run_once()
+        self.assertFalse(AnomalyEvent.objects.exists())
+
+    def test_replace_keeps_the_sweepers_events(self):
+        self.load([50.0] * 40 + [150.0])
+        self.sweep(40 * 5 + 16)
+        self.sweep(40 * 5 + 6 * 60 + 1)
+        end = self.start + timedelta(days=1)
+        rescoring.rescore_plot(self.plot.id, self.start, end, config=self.config)
+        rescoring.rescore_plot(self.plot.id, self.start, end, config=self.config, replace=True)
+
+        events = AnomalyEvent.objects.order_by('timestamp')
+        self.assertEqual(
+            [(event.anomaly_type, event.timestamp - self.start) for event in events],
+            [
+                ('sensor_failure', timedelta(minutes=200)),
+                ('data_gap', timedelta(minutes=215)),
+                ('sensor_failure', timedelta(minutes=200 + 6 * 60)),
+            ],
+        )
+
+    def test_failed_replace_keeps_the_events(self):
+        self.load([50.0] * 40 + [150.0])
+        end = self.start + timedelta(days=1)
+        rescoring.rescore_plot(self.plot.id, self.start, end, config=self.config)
+        with patch.object(AnomalyEvent.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                rescoring.rescore_plot(self.plot.id, self.start, end, config=self.config, replace=True)
+        self.assertEqual(list(AnomalyEvent.objects.values_list('anomaly_type', flat=True)), ['sensor_failure'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Other backends serialize their writers')
+class WatermarkOrderingTests(APITransactionTestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('farmer', 'farmer@example.com', 'password')
+        self.plot = FieldPlot.objects.create(farm=FarmProfile.objects.create(owner=user, location='Farm', size=1.0))
+
+    def commit_out_of_order(self, late, early, between):
+        """
+        Insert ``late`` from a second connection, then ``early`` (a higher id)
+        from this one, call ``between()`` and only then commit ``late``.
+        Returns the two ids.
+        """
+        import psycopg2
+        writer = psycopg2.connect(**connection.get_connection_params())
+        try:
+            with writer.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO sensor_readings ("timestamp", plot_id, sensor_type, value, source) '
+                    "VALUES (%s, %s, 'moisture', %s, 'test') RETURNING id",
+                    [late[0], self.plot.id, late[1]],
+                )
+                late_id = cursor.fetchone()[0]
+            early_id = SensorReading.objects.create(
+                plot=self.plot, sensor_type='moisture', timestamp=early[0], value=early[1],
+            ).id
+            self.assertGreater(early_id, late_id)
+            between()
+            writer.commit()
+        finally:
+            writer.close()
+        return late_id, early_id
+
+    def test_reading_committed_below_a_scored_one_is_still_scored(self):
+        now = timezone.now()
+        late_id, early_id = self.commit_out_of_order(
+            (now - timedelta(minutes=5), 150.0), (now, 60.0),
+            lambda: self.assertEqual(detection.run_once()[0], 0),
+        )
+        self.assertEqual(detection.run_once()[0], 2)
+        self.assertEqual(ProcessingWatermark.objects.get(name=detection.WATERMARK).last_reading_id, early_id)
+        self.assertEqual(AnomalyEvent.objects.get().sensor_reading_id, late_id)
+
+    def test_reading_committed_below_a_streamed_one_is_still_streamed(self):
+        async def scenario():
+            hub = live.Hub()
+            subscription = hub.subscribe({self.plot.id})
+            hub.task.cancel()
+            await hub.poll()
+            await sync_to_async(self.commit_out_of_order)(
+                (now - timedelta(minutes=5), 50.0), (now, 60.0), async_to_sync(hub.poll),
+            )
+            between = await subscription.get(0)
+            await hub.poll()
+            return between, await subscription.get(0)
+
+        now = timezone.now()
+        between, after = async_to_sync(scenario)()
+        self.assertEqual(between, [])
+        self.assertEqual([re.search(r'"value":([\d.]+)', text).group(1) for text in after], ['50.0', '60.0'])
+
+    def test_reading_committed_below_the_rollup_watermark_is_rolled_up(self):
+        hour = timezone.now().astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        self.commit_out_of_order((hour + timedelta(minutes=10), 50.0), (hour + timedelta(minutes=20), 60.0), rollups.refresh)
+        rows, source = rollups.aggregate([self.plot.id], ['moisture'], rollups.HOUR, hour, hour + rollups.HOUR)
+        self.assertEqual((source, rows[0]['count']), ('raw', 2))
+
+        rollups.refresh()
+        rows, source = rollups.aggregate([self.plot.id], ['moisture'], rollups.HOUR, hour, hour + rollups.HOUR)
+        self.assertEqual((source, rows[0]['count'], rows[0]['min']), ('hourly', 2, 50.0))
+
+
+class WatermarkPendingTests(APITestCase):
+
+    def test_pending_observations_stay_bounded_under_a_long_transaction(self):
+        watermark = ProcessingWatermark(name='test', last_reading_id=0)
+        # Transaction 10 stays open while readings keep arriving.
+        for call in range(1000):
+            settled = watermarks.horizon(watermark, (10, 100 + call, call + 1))
+            self.assertEqual(settled, 0)
+            self.assertLessEqual(len(watermark.pending), watermarks.PENDING_LIMIT)
+        self.assertEqual(watermark.pending[0], [100, 1])
+        self.assertEqual(watermark.pending[-1], [1099, 1000])
+
+        # Never past the ids of the transactions that have ended.
+        settled = watermarks.horizon(watermark, (600, 1100, 1000))
+        self.assertLessEqual(settled, 500)
+        self.assertGreater(settled, 0)
+        self.assertEqual(watermarks.horizon(watermark, (1101, 1101, 1000)), 1000)
+        self.assertEqual(watermark.pending, [])
+
+
+class BatchUploaderTests(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = os.path.join(directory.name, 'spool', 'readings.ndjson')
+        self.uploader = HttpGenerator.BatchUploader(
+            'http://backend', batch_size=2, max_retries=2, backoff=0.5, spool_path=self.spool,
+        )
+        self.session = Mock()
+        self.rows = [{'plot': 1, 'sensor_type': 'moisture', 'value': float(i)} for i in range(5)]
+        sleep = patch.object(HttpGenerator.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+        quiet = patch('builtins.print')
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    @staticmethod
+    def response(status_code, body=None):
+        return Mock(status_code=status_code, text='', json=Mock(return_value=body or {}))
+
+    def sent(self):
+        return [json.loads(call.kwargs['data']) for call in self.session.post.call_args_list]
+
+    def spooled(self):
+        with open(self.spool) as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_failures_are_retried_with_exponential_backoff(self):
+        self.session.post.side_effect = [
+            HttpGenerator.requests.ConnectionError('refused'),
+            self.response(503),
+            self.response(201, {'created': 1, 'duplicates': 1}),
+        ]
+        with patch.object(HttpGenerator.random, 'uniform', return_value=0.0):
+            self.assertTrue(self.uploader._send(self.session, self.rows[:2]))
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(self.sent(), [self.rows[:2]] * 3)
+        stats = self.uploader.stats
+        self.assertEqual((stats['retries'], stats['sent'], stats['duplicates']), (2, 1, 1))
+
+    def test_client_errors_are_not_retried(self):
+        self.session.post.return_value = self.response(400)
+        self.assertTrue(self.uploader._send(self.session, self.rows[:2]))
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(self.uploader.stats['rejected'], 2)
+
+    def test_batch_is_spooled_when_the_backend_stays_down(self):
+        self.session.post.return_value = self.response(502)
+        self.assertFalse(self.uploader._send(self.session, self.rows[:2]))
+        self.assertEqual(self.session.post.call_count, 3)
+        self.assertEqual(self.spooled(), self.rows[:2])
+
+    def test_spool_is_replayed_in_order(self):
+        self.uploader._spool(self.rows[:3])
+        self.uploader._spool(self.rows[3:])
+        self.session.post.return_value = self.response(201)
+        self.uploader._replay_spool(self.session)
+        self.assertEqual(self.sent(), [self.rows[:2], self.rows[2:4], self.rows[4:]])
+        self.assertEqual(self.uploader.stats['replayed'], 5)
+        self.assertEqual(os.listdir(os.path.dirname(self.spool)), [])
+
+    def test_unsent_rest_of_the_spool_is_kept_in_order(self):
+        self.uploader._spool(self.rows)
+        self.session.post.side_effect = [self.response(201)] + [self.response(503)] * 3
+        self.uploader._replay_spool(self.session)
+        self.assertEqual(self.spooled(), self.rows[2:])
+        self.assertEqual(self.uploader.stats['replayed'], 2)
+
+    def test_unreadable_lines_are_quarantined(self):
+        self.uploader._spool(self.rows[:2])
+        with open(self.spool, 'a') as handle:
+            handle.write('{"plot": 1, "sens\n')
+        self.uploader._spool(self.rows[2:3])
+        self.session.post.return_value = self.response(201)
+        self.uploader._replay_spool(self.session)
+        self.assertEqual(self.sent(), [self.rows[:2], self.rows[2:3]])
+        with open(f'{self.spool}.corrupt') as handle:
+            self.assertEqual(handle.read(), '{"plot": 1, "sens\n')
+        self.assertEqual(self.uploader.stats['corrupt'], 1)
+
+
+class FleetSimulatorTests(APITestCase):
+
+    def fleet(self, plot_ids, seed=7):
+        return fleet_simulator.FleetSimulator(
+            plot_ids, seed=seed, start_time=datetime(2025, 3, 1), fast_simulate=True,
+            scenario_delay=(600, 1200), block_ticks=8,
+        )
+
+    def series(self, fleet, plot_id, ticks=200):
+        column = list(fleet.plot_ids).index(plot_id)
+        rows = []
+        for _ in range(ticks):
+            tick = fleet.tick()
+            rows.append((tick['mode'][column], tick['temperature'][column],
+                         tick['humidity'][column], tick['soil_moisture'][column]))
+            fleet.advance_time(300)
+        return rows
+
+    def test_plot_is_reproducible_whatever_the_rest_of_the_fleet(self):
+        alone = self.series(self.fleet([2]), 2)
+        self.assertEqual(self.series(self.fleet([5, 2, 9, 1]), 2), alone)
+        self.assertEqual(self.series(self.fleet(range(1, 50)), 2), alone)
+        # The scripted anomaly and the recovery are part of the compared run.
+        self.assertGreater(len({row[0] for row in alone}), 2)
+        self.assertNotEqual(self.series(self.fleet([2], seed=8), 2), alone)
+
+    def test_tick_shapes_dtypes_and_ranges(self):
+        fleet = self.fleet([3, 1, 2])
+        for _ in range(100):
+            tick = fleet.tick()
+            self.assertEqual(tick['timestamp'], fleet.current_time)
+            self.assertEqual(tick['plot_id'].tolist(), [3, 1, 2])
+            self.assertEqual(tick['plot_id'].dtype, 'int64')
+            self.assertEqual(tick['mode'].dtype, 'int8')
+            self.assertTrue(((tick['mode'] >= fleet_simulator.NORMAL) & (tick['mode'] <= fleet_simulator.RECOVERY)).all())
+            for column, (low, high) in {'temperature': (5, 45), 'humidity': (15, 95), 'soil_moisture': (25, 85)}.items():
+                self.assertEqual((tick[column].shape, tick[column].dtype), ((3,), 'float64'))
+                self.assertTrue(((tick[column] >= low) & (tick[column] <= high)).all(), column)
+            fleet.advance_time(300)
+        self.assertEqual(fleet.current_time, datetime(2025, 3, 1) + timedelta(seconds=300 * 100))
+
+
+class IterBackfillTests(APITestCase):
+
+    start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+
+    def test_every_tick_of_the_range_is_generated(self):
+        frame = backfill.backfill([1, 2], self.start, self.start + timedelta(hours=2))
+        self.assertEqual(len(frame), 24 * 2 * 3)
+        stamps = sorted(set(frame['timestamp']))
+        self.assertEqual(stamps, [self.start + timedelta(minutes=5 * k) for k in range(24)])
+        self.assertEqual(frame.groupby(['plot', 'sensor_type'], observed=True).size().tolist(), [24] * 6)
+
+        # A partial last interval still gets its tick; naive and aware bounds are UTC.
+        end = datetime(2025, 3, 1, 3, 1, tzinfo=dt_timezone(timedelta(hours=2)))
+        frame = backfill.backfill([1], datetime(2025, 3, 1, 1), end)
+        self.assertEqual(sorted(set(frame['timestamp']))[-1], self.start + timedelta(hours=1))
+        self.assertEqual(len(frame), 1 * 3)
+
+    def test_chunks_split_the_same_series(self):
+        end = self.start + timedelta(hours=2)
+        chunks = list(backfill.iter_backfill([1, 2], self.start, end, chunk_ticks=10))
+        self.assertEqual([len(chunk) for chunk in chunks], [10 * 6, 10 * 6, 4 * 6])
+        whole = next(backfill.iter_backfill([1, 2], self.start, end, chunk_ticks=288))
+        columns = ['timestamp', 'plot', 'sensor_type']
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks).sort_values(columns, ignore_index=True),
+            whole.sort_values(columns, ignore_index=True),
+        )
+
+    def test_rows_carry_the_source(self):
+        end = self.start + timedelta(hours=1)
+        long = backfill.backfill([1], self.start, end, source='import-2025')
+        self.assertEqual(set(long['source']), {'import-2025'})
+        self.assertEqual(set(long['sensor_type']), {'temperature', 'humidity', 'moisture'})
+        wide = next(backfill.iter_backfill([1], self.start, end, source='import-2025', wide=True))
+        self.assertEqual(list(wide.columns), ['timestamp', 'plot', 'temperature', 'humidity', 'moisture', 'source'])
+        self.assertEqual(set(wide['source']), {'import-2025'})
@@ -1,5 +1,6 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import FarmProfileViewSet, FieldPlotViewSet, SensorReadingViewSet, AnomalyEventViewSet, AgentRecommendationViewSet
+from .views import FarmProfileViewSet, FieldPlotViewSet, SensorReadingViewSet, AnomalyEventViewSet, AgentRecommendationViewSet, live_stream
 
 
 router = DefaultRouter()
@@ -11,4 +12,6 @@ router.register(r'anomalies', AnomalyEventViewSet)
 router.register(r'recommendations', AgentRecommendationViewSet)
 
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('stream/', live_stream, name='live-stream'),
+]
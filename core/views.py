@@ -1,18 +1,48 @@
 from rest_framework import viewsets
-from .models import FarmProfile, FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation, UserProfile
+from .models import FarmProfile, FieldPlot, SensorReading, SensorReadingHistory, AnomalyEvent, AgentRecommendation
 from .serializers import FarmProfileSerializer, FieldPlotSerializer, SensorReadingSerializer, AnomalyEventSerializer, AgentRecommendationSerializer
+from .serializers import anomaly_event_rows, sensor_reading_rows
 from .permissions import IsOwnerOrAdmin
+from .authentication import CachedJWTAuthentication
+from .scopes import Scope, get_scope
+from .parsers import NDJSONParser
+from .filters import day_range, filter_choices, filter_plots, filter_time_range, id_list, time_range, value_list
+from . import aggregation
+from . import export
+from .enumerations import AnomalyType, SensorType, SeverityLevel
+from .pagination import KeysetPagination, check_etag, delta_position, encode_cursor, seek_after
+from . import ingest
+from . import ingest_queue
+from . import latest
+from . import live
+from . import response_cache
+from . import rollups
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+def require_plot(request, plot_id):
+    """Writes may only point at plots in the caller's scope."""
+    if not get_scope(request).allows_plot(plot_id):
+        raise PermissionDenied('You do not have access to this plot.')
+
 
 class FarmProfileViewSet(viewsets.ModelViewSet):
     """
     Management of farm profiles.
 
 list:
-    Returns all farm profiles (admin only).
+    Returns the farm profiles of the user (all of them for an admin).
 
 retrieve:
     Returns a specific farm profile.
@@ -28,7 +58,26 @@ delete:
     """
     queryset = FarmProfile.objects.all()
     serializer_class = FarmProfileSerializer
-    permission_classes = [IsOwnerOrAdmin]
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+
+    def get_queryset(self):
+        return get_scope(self.request).restrict_farms(super().get_queryset())
+
+    def perform_create(self, serializer):
+        self.check_owner(serializer)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_owner(serializer)
+        super().perform_update(serializer)
+
+    def check_owner(self, serializer):
+        owner = serializer.validated_data.get('owner')
+        if owner is not None and owner != self.request.user and not get_scope(self.request).is_admin:
+            raise PermissionDenied('Only administrators can give a farm to another user.')
+
+    def list(self, request, *args, **kwargs):
+        return response_cache.cached(request, ['plots'], lambda: super(FarmProfileViewSet, self).list(request, *args, **kwargs))
 
 
 class FieldPlotViewSet(viewsets.ModelViewSet):
@@ -49,27 +98,55 @@ update:
 
 delete:
     Deletes a field plot.
+
+current:
+    Returns the latest reading of each sensor type of a plot
+    (`/fieldplots/{id}/current/`) or of every visible plot
+    (`/fieldplots/current/`).
     """
     serializer_class = FieldPlotSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
     
     def get_queryset(self):
-        user = self.request.user
+        # Admins see every plot, farmers the plots of their farms.
+        return get_scope(self.request).restrict(FieldPlot.objects.all(), plot_field=None)
 
-        
-        try:
-            profile = user.userprofile  
-            if profile.role == 'admin':
-                return FieldPlot.objects.all()
-        except (AttributeError, UserProfile.DoesNotExist):
-            pass
+    def list(self, request, *args, **kwargs):
+        return response_cache.cached(request, ['plots'], lambda: super(FieldPlotViewSet, self).list(request, *args, **kwargs))
+
+    def perform_create(self, serializer):
+        self.check_farm(serializer)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_farm(serializer)
+        super().perform_update(serializer)
+
+    def check_farm(self, serializer):
+        farm = serializer.validated_data.get('farm')
+        if farm is not None and not get_scope(self.request).allows_farm(farm.id):
+            raise PermissionDenied('You do not have access to this farm.')
+
+    @action(detail=True, methods=['get'])
+    def current(self, request, pk=None):
+        """
+        GET /api/fieldplots/{id}/current/
 
-       
-        if user.farmprofile_set.exists():
-            return FieldPlot.objects.filter(farm__owner=user)
+        Latest moisture, temperature and humidity reading of the plot.
+        """
+        plot = self.get_object()
+        return Response(latest.represent(plot.id, latest.get_many([plot.id])[plot.id]))
 
-        
-        return FieldPlot.objects.none()
+    @action(detail=False, methods=['get'], url_path='current', url_name='current-all')
+    def current_all(self, request):
+        """
+        GET /api/fieldplots/current/
+
+        Latest readings of every plot visible to the user, in one cache read.
+        """
+        plot_ids = list(self.get_queryset().order_by('id').values_list('id', flat=True))
+        entries = latest.get_many(plot_ids)
+        return Response([latest.represent(plot_id, entries[plot_id]) for plot_id in plot_ids])
 
 
 class SensorReadingViewSet(viewsets.ModelViewSet):
@@ -77,27 +154,276 @@ class SensorReadingViewSet(viewsets.ModelViewSet):
     Management of sensor readings.
 
 list:
-    Returns all sensor readings.
+    Returns sensor readings, newest first, one page at a time (`cursor`,
+    `page_size`), or only the readings after `after=<cursor>`, oldest
+    first. Filters: `plot`, `farm`, `sensor_type`, `start`, `end`.
 
 by_plot:
-    Returns the readings for a specific plot for the current date.
+    Returns the readings for a specific plot for the current date
+    (or for `date`, optionally restricted to one `sensor_type`), or only
+    the newer ones with `after` / `since`.
+
+bulk:
+    Ingests a batch of readings (JSON array or NDJSON body).
+
+queue:
+    Backlog of the write-behind ingest queue (admins only).
+
+aggregate:
+    Returns count/min/max/avg/last per time bucket for one or more plots.
+
+export:
+    Streams the readings as CSV, NDJSON, Parquet or Arrow
+    (`/sensor-readings/export/<format>/`), with the list filters.
+
+    list, by_plot, aggregate and export include the old readings compacted
+    into one row per tick (core/compaction.py). Those keep their values but
+    get a negative `id`, which cannot be retrieved, updated or deleted.
     """
     queryset = SensorReading.objects.all()
     serializer_class = SensorReadingSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = KeysetPagination
+    # Allowed to device tokens, limited to their plots.
+    device_actions = ('create', 'bulk')
+
+    def get_queryset(self):
+        if self.action in ('list', 'export'):
+            # Live and compacted readings (see core/compaction.py).
+            queryset = get_scope(self.request).restrict(SensorReadingHistory.objects.all())
+            params = self.request.query_params
+            queryset = filter_time_range(queryset, params)
+            queryset = filter_plots(queryset, params)
+            queryset = filter_choices(queryset, params, 'sensor_type', SensorType.values)
+            return queryset
+        return get_scope(self.request).restrict(super().get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(sensor_reading_rows.values(self.get_queryset()))
+        return self.get_paginated_response(sensor_reading_rows.represent(page))
+
+    def create(self, request, *args, **kwargs):
+        if not ingest_queue.is_enabled():
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.check_plot(serializer)
+        return self.enqueue([SensorReading(**serializer.validated_data)])
+
+    def perform_create(self, serializer):
+        self.check_plot(serializer)
+        with transaction.atomic():
+            ingest.record_written([serializer.save()])
+
+    def perform_update(self, serializer):
+        self.check_plot(serializer)
+        instance = serializer.instance
+        previous = (instance.plot_id, instance.sensor_type)
+        super().perform_update(serializer)
+        transaction.on_commit(lambda: latest.refresh([previous, (instance.plot_id, instance.sensor_type)]))
+        response_cache.invalidate(*{response_cache.readings(previous[0]), response_cache.readings(instance.plot_id)})
+
+    def perform_destroy(self, instance):
+        series = (instance.plot_id, instance.sensor_type)
+        super().perform_destroy(instance)
+        transaction.on_commit(lambda: latest.refresh([series]))
+        response_cache.invalidate(response_cache.readings(instance.plot_id))
+
+    def check_plot(self, serializer):
+        plot = serializer.validated_data.get('plot')
+        if plot is not None:
+            require_plot(self.request, plot.id)
+
+    def enqueue(self, readings, errors=None):
+        """202 once ``readings`` are in the write-behind queue, 503 when it is full."""
+        try:
+            queued = ingest_queue.enqueue(readings)
+        except ingest_queue.QueueFull:
+            return Response(
+                {'detail': 'Ingestion is behind, retry later.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(ingest_queue.CONFIG['RETRY_AFTER'])},
+            )
+        body = {'queued': queued}
+        if errors is not None:
+            body['errors'] = errors
+        code = status.HTTP_202_ACCEPTED if queued or not errors else status.HTTP_400_BAD_REQUEST
+        return Response(body, status=code)
+
     @action(detail=False, methods=['get'], url_path='plot/(?P<plot_id>[^/.]+)')
     def by_plot(self, request, plot_id=None):
-        """GET /api/sensor-readings/plot/<plot_id>/"""
-        today = timezone.localdate() 
-        readings = SensorReading.objects.filter(plot_id=plot_id, timestamp__date=today).order_by('timestamp')
-        serializer = self.get_serializer(readings, many=True)
-        return Response(serializer.data)
+        """
+        GET /api/sensor-readings/plot/<plot_id>/?date=YYYY-MM-DD&sensor_type=...
+
+        Oldest first. With `after=<cursor>` (or `since=<timestamp>[,<id>]`)
+        only the newer readings are returned, across midnight unless `date`
+        is given. `X-Next-Cursor` is the `after` value for the next poll;
+        an unchanged poll with `If-None-Match` gets a 304. Responses are
+        cached until the plot's readings change (see core/response_cache.py).
+        """
+        try:
+            plot_id = int(plot_id)
+        except ValueError:
+            raise ValidationError({'plot': f'"{plot_id}" is not a valid id.'})
+        return response_cache.cached(
+            request,
+            ['plots', response_cache.readings(plot_id)],
+            lambda: self.plot_readings(request, plot_id),
+            closed=self.is_closed_range(request.query_params),
+        )
+
+    @staticmethod
+    def is_closed_range(params):
+        """True for a past `date` without delta parameters: no new reading is expected."""
+        if not params.get('date') or params.get('after') or params.get('since'):
+            return False
+        try:
+            day = parse_date(params['date'])
+        except ValueError:
+            return False
+        return day is not None and day_range(day)[1] <= timezone.now()
+
+    def plot_readings(self, request, plot_id):
+        params = request.query_params
+        day = timezone.localdate()
+        if params.get('date'):
+            try:
+                day = parse_date(params['date'])
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValidationError({'date': 'Expected YYYY-MM-DD.'})
+        start, end = day_range(day)
+        position = delta_position(params)
+
+        # Half-open range + explicit sensor types: three range scans on the
+        # (plot, sensor_type, timestamp) index instead of a cast on every row.
+        sensor_types = value_list(params, 'sensor_type', SensorType.values) or SensorType.values
+        readings = get_scope(request).restrict(SensorReadingHistory.objects.all()).filter(
+            plot_id=plot_id,
+            sensor_type__in=sensor_types,
+        )
+        if position is None or params.get('date'):
+            readings = readings.filter(timestamp__gte=start, timestamp__lt=end)
+        if position is not None:
+            readings = seek_after(readings, position)
+
+        etag, not_modified = check_etag(request, readings, [response_cache.readings(plot_id)])
+        if not_modified is not None:
+            return not_modified
+        rows = list(sensor_reading_rows.values(readings.order_by('timestamp', 'id')))
+
+        headers = {'ETag': etag}
+        if rows:
+            headers['X-Next-Cursor'] = encode_cursor(rows[-1]['timestamp'], rows[-1]['id'])
+        elif position is not None and position[1] is not None:
+            headers['X-Next-Cursor'] = encode_cursor(*position)
+        return Response(sensor_reading_rows.represent(rows), headers=headers)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        POST /api/sensor-readings/bulk/
+
+        Body: a JSON array (or NDJSON lines) of
+        {plot, sensor_type, value, timestamp?, source?} objects.
+        Valid rows are written in one batch; invalid rows are reported
+        by index without rejecting the rest. Rows already stored (same
+        plot, sensor_type, timestamp and source) are counted as
+        `duplicates`, so a batch can be retried safely. With the ingest
+        queue enabled, valid rows are queued and counted as `queued` (202).
+        """
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get('readings')
+        if not isinstance(rows, list):
+            return Response({'detail': 'Expected a list of readings.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > ingest.BULK_MAX_ROWS:
+            return Response(
+                {'detail': f'At most {ingest.BULK_MAX_ROWS} readings per request.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        readings, errors = ingest.validate_readings(rows, plot_ids=get_scope(request).plot_ids)
+        if ingest_queue.is_enabled():
+            return self.enqueue(readings, errors)
+        created = ingest.write_readings(readings)
+        code = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+        return Response({'created': created, 'duplicates': len(readings) - created, 'errors': errors}, status=code)
+
+    @action(detail=False, methods=['get'])
+    def queue(self, request):
+        """
+        GET /api/sensor-readings/queue/
+
+        Entries and readings waiting in the write-behind queue and the age
+        in seconds of the oldest one.
+        """
+        if not get_scope(request).is_admin:
+            raise PermissionDenied('Only administrators can see the ingest queue.')
+        return Response({'enabled': ingest_queue.is_enabled(), **ingest_queue.stats()})
+
+    @action(detail=False, methods=['get'])
+    def aggregate(self, request):
+        """
+        GET /api/sensor-readings/aggregate/?plot=1,2&sensor_type=temperature&bucket=1h&start=...&end=...
+
+        `plot` or `farm` is required; `bucket` is one of 1m, 5m, 15m, 1h, 1d
+        (default 1h); the range defaults to the last 24 hours. Hour- or
+        day-aligned requests are answered from the rollup tables when they
+        are up to date (see the `X-Aggregate-Source` response header).
+        """
+        params = request.query_params
+        stride = aggregation.bucket_size(params.get('bucket', '1h'))
+        start, end = aggregation.default_range(*time_range(params))
+
+        plots = id_list(params, 'plot')
+        farms = id_list(params, 'farm')
+        if not plots and not farms:
+            raise ValidationError({'plot': 'A plot or farm filter is required.'})
+        scope = get_scope(request)
+        if plots:
+            plots = [plot_id for plot_id in plots if scope.allows_plot(plot_id)]
+        else:
+            plots = list(scope.restrict(FieldPlot.objects.filter(farm_id__in=farms), plot_field=None)
+                         .values_list('id', flat=True))
+        sensor_types = value_list(params, 'sensor_type', SensorType.values) or SensorType.values
+        aggregation.check_point_budget(start, end, stride, len(plots) * len(sensor_types))
+
+        rows, source = rollups.aggregate(plots, sensor_types, stride, start, end)
+        return Response(rows, headers={'X-Aggregate-Source': source})
+
+    @action(detail=False, methods=['get'], url_path='export/(?P<export_format>[a-z]+)')
+    def export(self, request, export_format=None):
+        """
+        GET /api/sensor-readings/export/<csv|ndjson|parquet|arrow>/?plot=1&start=...&end=...
+
+        Oldest first. The response is streamed chunk by chunk from a
+        server-side cursor, so exports of any size use constant memory
+        (under ASGI too, see core/export.py).
+        """
+        if export_format not in export.FORMATS:
+            raise ValidationError({'format': f'Unsupported export format "{export_format}".'})
+        if not export.available(export_format):
+            raise ValidationError({'format': f'The {export_format} export requires pyarrow.'})
+        content_type, extension, stream, _ = export.FORMATS[export_format]
+        body = stream(self.get_queryset())
+        if isinstance(request._request, ASGIRequest):
+            body = export.aiterate(body)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="sensor-readings.{extension}"'
+        return response
+
 
 class AnomalyEventViewSet(viewsets.ModelViewSet):
     """
     Management of anomaly events.
 
     list:
-    Returns all anomaly events.
+    Returns anomaly events, newest first, one page at a time (`cursor`,
+    `page_size`), or only the events after `after=<cursor>` /
+    `since=<timestamp>[,<id>]`, oldest first. Filters: `plot`, `farm`,
+    `anomaly_type`, `severity`, `start`, `end`. Supports `If-None-Match`.
 
     retrieve:
     Returns a specific anomaly event.
@@ -108,6 +434,46 @@ class AnomalyEventViewSet(viewsets.ModelViewSet):
     """
     queryset = AnomalyEvent.objects.all()
     serializer_class = AnomalyEventSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = get_scope(self.request).restrict(super().get_queryset())
+        if self.action == 'list':
+            params = self.request.query_params
+            queryset = filter_time_range(queryset, params)
+            queryset = filter_plots(queryset, params)
+            queryset = filter_choices(queryset, params, 'anomaly_type', AnomalyType.values)
+            queryset = filter_choices(queryset, params, 'severity', SeverityLevel.values)
+        return queryset
+
+    def perform_create(self, serializer):
+        self.check_references(serializer)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_references(serializer)
+        super().perform_update(serializer)
+
+    def check_references(self, serializer):
+        data = serializer.validated_data
+        if 'plot' in data:
+            require_plot(self.request, data['plot'].id)
+        if 'sensor_reading' in data:
+            require_plot(self.request, data['sensor_reading'].plot_id)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        # The ETag covers the rows this request can return.
+        position = delta_position(request.query_params)
+        polled = queryset if position is None else seek_after(queryset, position)
+        etag, not_modified = check_etag(request, polled, [response_cache.ANOMALIES])
+        if not_modified is not None:
+            return not_modified
+        page = self.paginate_queryset(anomaly_event_rows.values(queryset))
+        response = self.get_paginated_response(anomaly_event_rows.represent(page))
+        response['ETag'] = etag
+        return response
 
 
 class AgentRecommendationViewSet(viewsets.ModelViewSet):
@@ -115,7 +481,8 @@ class AgentRecommendationViewSet(viewsets.ModelViewSet):
     Management of agent recommendations.
 
     list:
-    Returns all recommendations.
+    Returns recommendations, newest first, one page at a time (`cursor`,
+    `page_size`). Filters: `plot`, `farm`, `start`, `end`.
 
     retrieve:
     Returns a specific recommendation.
@@ -125,6 +492,84 @@ class AgentRecommendationViewSet(viewsets.ModelViewSet):
     """
     queryset = AgentRecommendation.objects.all()
     serializer_class = AgentRecommendationSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = get_scope(self.request).restrict(super().get_queryset(), plot_field='anomaly_event__plot')
+        if self.detail:
+            # The object permission check reads the event's plot.
+            queryset = queryset.select_related('anomaly_event')
+        if self.action == 'list':
+            params = self.request.query_params
+            queryset = filter_time_range(queryset, params)
+            queryset = filter_plots(queryset, params, plot_field='anomaly_event__plot')
+        return queryset
+
+    def perform_create(self, serializer):
+        self.check_event(serializer)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_event(serializer)
+        super().perform_update(serializer)
+
+    def check_event(self, serializer):
+        event = serializer.validated_data.get('anomaly_event')
+        if event is not None:
+            require_plot(self.request, event.plot_id)
+
+
+def _stream_user(request):
+    """User of a stream request: JWT (header or `?token=`, for EventSource) or session."""
+    authenticator = CachedJWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else request.GET.get('token')
+    if raw_token:
+        try:
+            return authenticator.get_user(authenticator.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    return request.user if request.user.is_authenticated else None
+
+
+def _stream_plots(user, params):
+    scope = Scope(user)
+    plots = id_list(params, 'plot')
+    farms = id_list(params, 'farm')
+    if not plots and not farms:
+        raise ValidationError({'plot': 'A plot or farm filter is required.'})
+    plots = {plot_id for plot_id in plots if scope.allows_plot(plot_id)}
+    if farms:
+        plots.update(scope.restrict(FieldPlot.objects.filter(farm_id__in=farms), plot_field=None)
+                     .values_list('id', flat=True))
+    return plots
+
+
+async def live_stream(request):
+    """
+    GET /api/stream/?plot=1,2&farm=3
+
+    Server-sent events (`reading`, `anomaly`) of the readings and anomaly
+    events committed from now on for the requested plots and farms, see
+    core/live.py. EventSource cannot send headers: pass the access token
+    as `?token=`.
+    """
+    user = await sync_to_async(_stream_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+    try:
+        plots = await sync_to_async(_stream_plots)(user, request.GET)
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400)
+    if not plots:
+        return JsonResponse({'detail': 'None of these plots is accessible.'}, status=403)
+    return StreamingHttpResponse(
+        live.stream(plots),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 
 
 
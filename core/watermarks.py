@@ -0,0 +1,98 @@
+"""
+How far a background job may move its ``ProcessingWatermark``.
+
+Reading ids are assigned at insert time but become visible at commit, and
+concurrent writers (API workers, COPY loads, the ingest queue worker)
+commit in any order: when id 6 is visible, id 5 may still be in flight.
+A job that consumed 6 and moved its watermark there would never see 5.
+
+``horizon()`` returns the highest id up to which every reading is settled
+(committed or never to be). On PostgreSQL each call records an
+observation: the transaction id of the caller and the highest visible
+reading id. Every id at or below that reading id was handed out before
+the observation, by a transaction that had already started. It is settled
+once every transaction older than the caller has ended. That holds when
+the oldest running transaction (``pg_snapshot_xmin``) is no older than the
+caller. Observations that cannot be settled yet are kept in
+``ProcessingWatermark.pending`` (at most ``PENDING_LIMIT`` of them) and
+checked again on the next call. A long write transaction, on any table,
+therefore holds the watermarks back until it ends. (A writer draws the id of its first row an instant before
+it gets its transaction id; only an observation falling inside that
+single-row window could settle too early.)
+
+``observe()`` must be the first statement of the caller's transaction to
+take a transaction id (before ``select_for_update()`` of the watermark),
+so that writers which started after the lock are not mistaken for older
+ones:
+
+    with transaction.atomic():
+        observation = watermarks.observe()
+        watermark = ProcessingWatermark.objects.select_for_update().get(name=...)
+        settled = watermarks.horizon(watermark, observation)
+
+The same holds for the ids of any table: ``observe(model)`` and
+``horizon(..., model)`` follow another one (core/live.py tails
+anomaly_events with them, through unsaved watermarks).
+
+Other backends serialize their writers (SQLite has one writer at a time),
+and their highest visible id is always settled.
+"""
+from django.db import connection
+from django.db.models import Max
+
+from .models import SensorReading
+
+
+# Observations kept per watermark, see horizon().
+PENDING_LIMIT = 64
+
+
+def observe(model=SensorReading):
+    """
+    ``(oldest running transaction, own transaction, highest visible id of
+    model)`` on PostgreSQL, ``None`` elsewhere.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        # One statement: the snapshot is taken before pg_current_xact_id()
+        # assigns the caller its transaction id.
+        cursor.execute(
+            f'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, '
+            f'pg_current_xact_id()::text::bigint, '
+            f'(SELECT MAX(id) FROM {table})'
+        )
+        oldest, own, top = cursor.fetchone()
+    return oldest, own, top or 0
+
+
+def horizon(watermark, observation, model=SensorReading):
+    """
+    Highest ``model`` id ``watermark`` may move to, given an ``observe()``
+    of it. Updates ``watermark.pending``; the caller saves it with the
+    watermark.
+    """
+    if observation is None:
+        return model.objects.aggregate(top=Max('id'))['top'] or 0
+
+    oldest, own, top = observation
+    settled = watermark.last_reading_id
+    waiting = []
+    for transaction_id, reading_id in [*watermark.pending, [own, top]]:
+        if oldest >= transaction_id:
+            settled = max(settled, reading_id)
+        else:
+            waiting.append([transaction_id, reading_id])
+    # The oldest observation of each id is the first to settle.
+    pending = []
+    for transaction_id, reading_id in waiting:
+        if reading_id > settled and (not pending or reading_id > pending[-1][1]):
+            pending.append([transaction_id, reading_id])
+    if len(pending) > PENDING_LIMIT:
+        # A long transaction adds an observation per call. Every other one
+        # goes (the first and the newest stay): the ids of a dropped one
+        # settle with the next kept one, a little later, never too early.
+        pending = pending[:-1:2] + pending[-1:]
+    watermark.pending = pending
+    return settled